@@ -0,0 +1,163 @@
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+import config
+import metrics
+from policy_runtime import PolicyRuntime
+from log_utils import info, warn, error
+
+# === Batched multi-symbol inference ===
+# One exported policy (export_policy.py) serving many symbols. Each symbol's feed submits
+# its observation when a bar closes; the service waits until every symbol has reported or
+# INFERENCE_BATCH_WINDOW_MS has passed since the first one, runs ONE forward pass over the
+# batch (PolicyRuntime.predict_rows, LSTM state kept per symbol), then resolves each
+# submission's Future and hands the action to the symbol's executor on a small pool, so a
+# slow order path never delays the next batch.
+#
+#   service = BatchInferenceService(config.POLICY_EXPORT_PATH, ["BTCUSDT", "ETHUSDT"]).start()
+#   service.register("BTCUSDT", lambda symbol, action: ...)
+#   service.submit("BTCUSDT", obs)           # -> Future[int]
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+BATCH_SIZE = metrics.histogram("policy_batch_size", "Observations per batched forward pass", buckets=BATCH_BUCKETS)
+BATCH_WAIT = metrics.histogram("policy_batch_wait_seconds", "First submission of a batch to its forward pass")
+EXECUTOR_ERRORS = metrics.counter("policy_executor_errors_total", "Per-symbol executors that raised")
+
+
+def inference_symbols():
+    return [symbol.strip() for symbol in config.INFERENCE_SYMBOLS.split(",") if symbol.strip()]
+
+
+class BatchInferenceService:
+    def __init__(self, policy_path, symbols=None, window_ms=None, num_threads=None, executor_threads=4):
+        symbols = symbols or inference_symbols()
+        self.runtime = PolicyRuntime(policy_path, n_envs=len(symbols), num_threads=num_threads)
+        self.rows = {symbol: row for row, symbol in enumerate(symbols)}
+        self.window = (config.INFERENCE_BATCH_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self._executors = {}
+        self._started = set()           # symbols whose LSTM state has seen an episode start
+        self._pending = {}              # symbol -> (obs, episode_start, future)
+        self._first_at = None
+        self._cond = threading.Condition()
+        self._run_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=executor_threads, thread_name_prefix="executor")
+        self._thread = None
+        self._stopped = False
+
+    def register(self, symbol, executor):
+        """executor(symbol, action) is called for every decision on `symbol`."""
+        if symbol not in self.rows:
+            raise KeyError(f"{symbol} is not served by this policy (symbols: {', '.join(self.rows)})")
+        self._executors[symbol] = executor
+
+    def submit(self, symbol, obs, episode_start=False):
+        """Queues a raw observation for the next batch. A second one for the same bar replaces the first."""
+        if symbol not in self.rows:
+            raise KeyError(f"{symbol} is not served by this policy")
+        future = Future()
+        with self._cond:
+            previous = self._pending.get(symbol)
+            if previous is not None:
+                previous[2].cancel()
+            self._pending[symbol] = (np.asarray(obs, dtype=np.float32), episode_start, future)
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+            self._cond.notify()
+        return future
+
+    def flush(self):
+        """Runs whatever is pending now, on the calling thread. Returns {symbol: action}."""
+        with self._cond:
+            batch, first_at = self._take()
+        return self._run(batch, first_at) if batch else {}
+
+    def _take(self):
+        batch, first_at = self._pending, self._first_at
+        self._pending, self._first_at = {}, None
+        return batch, first_at
+
+    def _run(self, batch, first_at):
+        symbols = list(batch)
+        rows = [self.rows[symbol] for symbol in symbols]
+        obs = np.stack([batch[symbol][0] for symbol in symbols])
+        with self._run_lock:
+            # First decision per symbol starts its episode: its LSTM state row may hold a stale sequence
+            starts = [bool(batch[symbol][1]) or symbol not in self._started for symbol in symbols]
+            BATCH_WAIT.observe(time.monotonic() - first_at)
+            try:
+                actions = self.runtime.predict_rows(rows, obs, starts)
+            except Exception as e:
+                error(f"❌ Batched inference failed for {len(symbols)} symbol(s): {e}")
+                for symbol in symbols:
+                    if batch[symbol][2].set_running_or_notify_cancel():
+                        batch[symbol][2].set_exception(e)
+                return {}
+            self._started.update(symbols)
+        BATCH_SIZE.observe(len(symbols))
+
+        decisions = {}
+        for symbol, action in zip(symbols, actions.tolist()):
+            decisions[symbol] = action
+            future = batch[symbol][2]
+            if not future.set_running_or_notify_cancel():
+                continue  # replaced by a newer observation, or cancelled by the caller
+            future.set_result(action)
+            executor = self._executors.get(symbol)
+            if executor is not None:
+                self._pool.submit(self._dispatch, executor, symbol, action)
+        return decisions
+
+    @staticmethod
+    def _dispatch(executor, symbol, action):
+        try:
+            executor(symbol, action)
+        except Exception as e:
+            EXECUTOR_ERRORS.inc()
+            warn(f"⚠️ Executor for {symbol} failed on action {action}: {e}")
+
+    # === Background batching loop ===
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="batch-inference", daemon=True)
+        self._thread.start()
+        info(f"🧠 Batched inference for {len(self.rows)} symbol(s), window {self.window * 1000:.0f} ms")
+        return self
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                # Wait for the rest of this bar's symbols, but never longer than the window
+                while len(self._pending) < len(self.rows) and not self._stopped:
+                    remaining = self._first_at + self.window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, first_at = self._take()
+            try:
+                self._run(batch, first_at)
+            except Exception as e:
+                error(f"❌ Batch inference loop error: {e}")
+
+    def stop(self, timeout=5.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+        self._pool.shutdown(wait=True)
+
+    def reset(self, symbol=None):
+        """Next decision for `symbol` (or every symbol) starts a fresh LSTM episode."""
+        with self._run_lock:
+            if symbol is None:
+                self._started.clear()
+            else:
+                self._started.discard(symbol)
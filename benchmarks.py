@@ -0,0 +1,456 @@
+import os
+import sys
+import json
+import math
+import time
+import runpy
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# === Offline benchmark suite ===
+# Runs against synthetic OHLCV data (generate_ohlcv) and local stand-ins only (exchange_sim
+# for Bybit, a dummy Telegram Bot API), inside a temporary working directory, so nothing
+# touches the real DB, state store, exchange or chat. Project modules are imported only after the
+# environment points them at the temp directory.
+#
+#   python benchmarks.py run --save baseline.json
+#   python benchmarks.py compare baseline.json            # runs the suite again and diffs
+#   python benchmarks.py compare baseline.json --current new.json --threshold 0.15
+#
+# A benchmark whose dependencies are missing (e.g. torch) is reported as skipped; a metric
+# over its BUDGETS entry fails the run.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BARS = 10_000
+DEFAULT_THRESHOLD = 0.10   # relative change counted as a regression
+LATENCY_ITERATIONS = 500
+ORDER_CYCLES = 100
+BATCH_SIZES = (1, 8, 32, 64)
+BATCH_BARS = 200
+
+# metric -> maximum; a run over budget exits 1 like a regression
+BUDGETS = {
+    "memory_mb_per_m_bars": 32.0,   # backtest data path: streamed bars + StepLog (~13 MB / M bars)
+}
+
+
+class Context:
+    def __init__(self, workdir, bars, seed):
+        self.workdir = workdir
+        self.bars = bars
+        self.seed = seed
+        self.db_path = os.path.join(workdir, "ohlcv_data.db")
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _latency_metrics(prefix, seconds, unit="ms"):
+    scale = 1e3 if unit == "ms" else 1e6
+    seconds = sorted(seconds)
+    return {
+        f"{prefix}_p50_{unit}": (_percentile(seconds, 0.5) * scale, unit, False),
+        f"{prefix}_p99_{unit}": (_percentile(seconds, 0.99) * scale, unit, False),
+    }
+
+
+# === Stand-ins ===
+class _TelegramStandIn(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"ok": true, "result": {}}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_telegram_stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _TelegramStandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="telegram-stand-in", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def prepare(bars, seed):
+    """Temp workdir + environment for every project module; must run before any of them is imported."""
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    ctx = Context(workdir, bars, seed)
+    os.environ.update({
+        "DB_PATH": ctx.db_path,
+        "STATE_BACKEND": "sqlite",
+        "STATE_DB_PATH": os.path.join(workdir, "bot_state.db"),
+        "RISK_STATE_FILE": os.path.join(workdir, "risk_state.json"),
+        "POLICY_EXPORT_PATH": os.path.join(workdir, "policy.pt"),
+        "TENSORBOARD_LOG": os.path.join(workdir, "tensorboard"),
+        "BOT_TOKEN": "bench",
+        "ALLOWED_USERS": "1",
+        "CONTACT_ID": "1",
+        "TELEGRAM_API_URL": start_telegram_stand_in(),
+        "MARKET_DATA_STREAM": "0",
+        "PORTFOLIO_PRIVATE_STREAM": "0",
+        "JOB_WARM_WORKERS": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    os.chdir(workdir)  # logs/, charts and CSVs written by the scripts land here
+
+    import config
+    import rate_limit
+    import telegram_api
+    # The stand-ins have no rate limits: lift the client-side pacing so the numbers measure
+    # this code (Bybit's 10 orders/s would otherwise dominate the order-path latency)
+    unlimited = 1_000_000
+    rate_limit.ENDPOINT_GROUPS = {
+        prefix: (name, unlimited, unlimited) for prefix, (name, _, _) in rate_limit.ENDPOINT_GROUPS.items()
+    }
+    rate_limit.DEFAULT_GROUP = (rate_limit.DEFAULT_GROUP[0], unlimited, unlimited)
+    telegram_api.CHAT_RATE = telegram_api.CHAT_BURST = telegram_api.GLOBAL_RATE = telegram_api.GLOBAL_BURST = unlimited
+    from generate_ohlcv import generate
+    generate(ctx.db_path, [config.SYMBOL], bars, start="2024-01-01", seed=seed)
+    return ctx
+
+
+def _start_exchange(ctx):
+    import exchange_sim
+    return exchange_sim.start_server(ctx.db_path, port=0, bar_seconds=0, start_bar=-1, api_secret="bench")
+
+
+def _env_with_model(ctx, recurrent=False):
+    from stable_baselines3.common.vec_env import DummyVecEnv, VecNormalize
+    from crypto_trading_env import CryptoTradingEnv
+
+    vec_env = VecNormalize(DummyVecEnv([lambda: CryptoTradingEnv()]), norm_obs=True, norm_reward=True, clip_obs=10.)
+    if recurrent:
+        from sb3_contrib import RecurrentPPO
+        model = RecurrentPPO("MlpLstmPolicy", vec_env, n_steps=64, batch_size=64, seed=ctx.seed)
+    else:
+        from stable_baselines3 import PPO
+        model = PPO("MlpPolicy", vec_env, n_steps=64, batch_size=64, seed=ctx.seed)
+    return model, vec_env  # untrained: speed does not depend on the weights
+
+
+# === Benchmarks ===
+def bench_ingest(ctx):
+    """fetch_data.main() paging the whole synthetic history from exchange_sim into an empty DB."""
+    import config
+    import fetch_data
+
+    server, _, base_url = _start_exchange(ctx)
+    target = os.path.join(ctx.workdir, "ingest.db")
+    if os.path.exists(target):
+        os.remove(target)
+    config.BYBIT_OHLCV_ENDPOINT = f"{base_url}/v5/market/kline"
+    fetch_data.DB_PATH = target
+    try:
+        started = time.perf_counter()
+        fetch_data.main()
+        elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+    conn = sqlite3.connect(target)
+    rows = conn.execute("SELECT COUNT(*) FROM ohlcv").fetchone()[0]
+    conn.close()
+    return {"ingest_rows_per_sec": (rows / elapsed, "rows/s", True)}
+
+
+def bench_env(ctx):
+    """CryptoTradingEnv.step with random actions, resetting at the end of the data."""
+    import numpy as np
+    from crypto_trading_env import CryptoTradingEnv
+
+    env = CryptoTradingEnv()
+    env.reset(seed=ctx.seed)
+    actions = np.random.default_rng(ctx.seed).integers(0, 3, ctx.bars)
+    started = time.perf_counter()
+    for action in actions:
+        _, _, terminated, truncated, _ = env.step(int(action))
+        if terminated or truncated:
+            env.reset()
+    elapsed = time.perf_counter() - started
+    return {"env_steps_per_sec": (len(actions) / elapsed, "steps/s", True)}
+
+
+def _episode_peak_bytes(steps, chunk_rows, seed):
+    """tracemalloc peak of a random-action env episode recorded into a StepLog."""
+    import tracemalloc
+    import numpy as np
+    from crypto_trading_env import CryptoTradingEnv
+    from sim_records import StepLog
+
+    actions = np.random.default_rng(seed).integers(0, 3, steps)
+    tracemalloc.start()
+    try:
+        env = CryptoTradingEnv(chunk_rows=chunk_rows)
+        env.reset(seed=seed)
+        step_log = StepLog(steps)
+        for action in actions:
+            _, reward, terminated, _, step_info = env.step(int(action))
+            step_log.append(action, step_info["price"], reward)
+            if terminated:
+                break
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(ctx):
+    """
+    Peak memory of the backtest data path, from episodes over half and all of the bars with
+    the same chunk size: the growth between the two is projected to one million bars.
+    """
+    chunk_rows = max(ctx.bars // 8, 1)
+    half, full = ctx.bars // 2, ctx.bars - 1
+    peak_half = _episode_peak_bytes(half, chunk_rows, ctx.seed)
+    peak_full = _episode_peak_bytes(full, chunk_rows, ctx.seed)
+    per_bar = max(peak_full - peak_half, 0) / (full - half)
+    return {
+        "memory_peak_mb": (peak_full / 1e6, "MB", False),
+        "memory_mb_per_m_bars": (per_bar, "MB", False),   # bytes per bar == MB per million bars
+    }
+
+
+def bench_backtest(ctx):
+    """run_simulation.py end to end (predict loop, CSV, charts) with an untrained PPO model."""
+    models_dir = os.path.join(ctx.workdir, "models")
+    os.makedirs(models_dir, exist_ok=True)
+    model, vec_env = _env_with_model(ctx)
+    model.save(os.path.join(models_dir, "ppo_model_bench.zip"))
+    vec_env.save(os.path.join(models_dir, "vecnormalize_bench.pkl"))
+
+    started = time.perf_counter()
+    runpy.run_path(os.path.join(REPO_DIR, "run_simulation.py"), run_name="__main__")
+    elapsed = time.perf_counter() - started
+    return {"backtest_bars_per_sec": (ctx.bars / elapsed, "bars/s", True)}
+
+
+def bench_inference(ctx):
+    """Single-observation PolicyRuntime.predict on an exported (untrained) LSTM policy."""
+    from crypto_trading_env import OBS_COLUMNS
+    from data_access import iter_chunks
+    from export_policy import export_policy
+    from policy_runtime import PolicyRuntime
+
+    model, vec_env = _env_with_model(ctx, recurrent=True)
+    runtime = PolicyRuntime(export_policy(model, vec_env, os.environ["POLICY_EXPORT_PATH"]))
+    observations = next(iter_chunks(columns=OBS_COLUMNS, chunk_rows=LATENCY_ITERATIONS * 4)).astype("float32")
+    timings = []
+    for i in range(min(len(observations), LATENCY_ITERATIONS * 4)):
+        obs = list(observations[i]) + [1000.0]
+        started = time.perf_counter()
+        runtime.predict(obs, episode_start=i == 0)
+        timings.append(time.perf_counter() - started)
+    return _latency_metrics("inference", timings, unit="us")
+
+
+def bench_batch_inference(ctx):
+    """BatchInferenceService bar cycles (submit every symbol, wait for all actions) as the batch grows."""
+    import numpy as np
+    from crypto_trading_env import OBS_COLUMNS
+    from data_access import iter_chunks
+    from export_policy import export_policy
+    from batch_inference import BatchInferenceService
+
+    model, vec_env = _env_with_model(ctx, recurrent=True)
+    path = export_policy(model, vec_env, os.environ["POLICY_EXPORT_PATH"])
+    bars = next(iter_chunks(columns=OBS_COLUMNS, chunk_rows=BATCH_BARS + max(BATCH_SIZES))).astype("float32")
+    observations = np.hstack([bars, np.full((len(bars), 1), 1000.0, dtype="float32")])
+    results = {}
+    for size in BATCH_SIZES:
+        symbols = [f"SYM{i:03d}USDT" for i in range(size)]
+        service = BatchInferenceService(path, symbols, window_ms=1000).start()
+        timings = []
+        try:
+            for bar in range(min(BATCH_BARS, len(observations) - size)):
+                started = time.perf_counter()
+                futures = [service.submit(symbol, observations[bar + i]) for i, symbol in enumerate(symbols)]
+                for future in futures:
+                    future.result()
+                timings.append(time.perf_counter() - started)
+        finally:
+            service.stop()
+        latency = _latency_metrics(f"batch{size}", timings)
+        results.update(latency)
+        results[f"batch{size}_obs_per_sec"] = (size * len(timings) / sum(timings), "obs/s", True)
+    return results
+
+
+def bench_open_position(ctx):
+    """futures_trader.open_position round trips against exchange_sim (close is not timed)."""
+    import bybit_client
+    import futures_trader
+
+    server, _, base_url = _start_exchange(ctx)
+    bybit_client.reset_client(base_url=base_url, api_key="bench", api_secret="bench")
+    timings, failures = [], 0
+    try:
+        for _ in range(ORDER_CYCLES):
+            started = time.perf_counter()
+            opened, _ = futures_trader.open_position("Buy", 100.0)
+            timings.append(time.perf_counter() - started)
+            closed, _ = futures_trader.close_position()
+            failures += (not opened) + (not closed)
+    finally:
+        server.shutdown()
+    results = _latency_metrics("open_position", timings)
+    results["open_position_failures"] = (failures, "count", False)
+    return results
+
+
+def bench_status(ctx):
+    """main.handle_command(user, "/status"): summary read, job lookup, reply enqueued."""
+    import config
+    import main
+    import telegram_api
+
+    user_id = config.ALLOWED_USERS[0]
+    timings = []
+    for _ in range(LATENCY_ITERATIONS):
+        started = time.perf_counter()
+        main.handle_command(user_id, "/status")
+        timings.append(time.perf_counter() - started)
+    telegram_api.flush(timeout=30)
+    return _latency_metrics("status", timings)
+
+
+BENCHMARKS = {
+    "ingest": bench_ingest,
+    "env": bench_env,
+    "backtest": bench_backtest,
+    "memory": bench_memory,
+    "inference": bench_inference,
+    "batch_inference": bench_batch_inference,
+    "open_position": bench_open_position,
+    "status": bench_status,
+}
+
+
+# === Runner / baselines ===
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_suite(names, bars, seed):
+    cwd = os.getcwd()
+    ctx = prepare(bars, seed)
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "commit": _git_commit(),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "bars": bars, "seed": seed,
+        },
+        "results": {},
+        "skipped": {},
+        "over_budget": {},
+    }
+    try:
+        for name in names:
+            print(f"⏱️ {name} ...", flush=True)
+            try:
+                metrics = BENCHMARKS[name](ctx)
+            except ImportError as e:
+                report["skipped"][name] = f"missing dependency: {e.name or e}"
+                print(f"⏭️ {name} skipped ({report['skipped'][name]})")
+                continue
+            for metric, (value, unit, higher_is_better) in metrics.items():
+                report["results"][metric] = {"value": float(value), "unit": unit, "higher_is_better": higher_is_better}
+                budget = BUDGETS.get(metric)
+                if budget is not None and value > budget:
+                    report["over_budget"][metric] = budget
+                    print(f"❌ {metric:<26} {value:12.2f} {unit} (budget {budget:g})")
+                else:
+                    print(f"   {metric:<26} {value:12.2f} {unit}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(ctx.workdir, ignore_errors=True)
+    return report
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Prints a baseline vs current table; returns the names of regressed metrics."""
+    regressions = []
+    for metric, base in sorted(baseline["results"].items()):
+        now = current["results"].get(metric)
+        if now is None:
+            print(f"⏭️ {metric:<26} {base['value']:12.2f} → {'(not run)':>12}")
+            continue
+        delta = now["value"] - base["value"]
+        if base["value"]:
+            change = delta / base["value"]
+            label = f"{change:+.1%}"
+        else:
+            # No relative change from 0 (e.g. failure counts): any move the wrong way is a regression
+            change = math.copysign(math.inf, delta) if delta else 0.0
+            label = f"{delta:+g} from 0"
+        worse = -change if base["higher_is_better"] else change
+        if worse > threshold:
+            regressions.append(metric)
+            icon = "❌"
+        elif worse < -threshold:
+            icon = "🚀"
+        else:
+            icon = "✅"
+        print(f"{icon} {metric:<26} {base['value']:12.2f} → {now['value']:12.2f} {base['unit']:<7} ({label})")
+    for metric in sorted(set(current["results"]) - set(baseline["results"])):
+        print(f"🆕 {metric:<26} {'':12} → {current['results'][metric]['value']:12.2f}")
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) beyond {threshold:.0%}: {', '.join(regressions)}")
+    else:
+        print(f"✅ No regressions beyond {threshold:.0%}")
+    return regressions
+
+
+def _load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Results saved to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("run", "compare"):
+        p = sub.add_parser(name)
+        p.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+        p.add_argument("--bars", type=int, default=DEFAULT_BARS, help="synthetic bars to generate")
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--save", help="write the results as JSON (e.g. a new baseline)")
+        if name == "compare":
+            p.add_argument("baseline", help="baseline JSON from `run --save`")
+            p.add_argument("--current", help="compare this results JSON instead of running the suite")
+            p.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="relative change flagged as regression")
+    args = parser.parse_args()
+
+    if args.command == "compare" and args.current:
+        current = _load(args.current)
+    else:
+        current = run_suite(args.only, args.bars, args.seed)
+    if args.save:
+        _save(current, args.save)
+    failed = bool(current.get("over_budget"))
+    if args.command == "compare":
+        failed = bool(compare(_load(args.baseline), current, args.threshold)) or failed
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,209 @@
 # === bybit_client.py ===
-from pybit.unified_trading import HTTP
 import config
 import time
 import hmac
 import hashlib
 import requests
 import json
+import threading
+from requests.adapters import HTTPAdapter
+from rate_limit import request_with_limits, SingleFlight
+import tracing
+import metrics
 
-from log_utils import info, error, success, warn  # 🔧 Імпорт логування
+from log_utils import info, error, success, warn, debug  # 🔧 Імпорт логування
+
+BASE_URL = config.BYBIT_BASE_URL
+RECV_WINDOW = "5000"
+TIME_SYNC_INTERVAL = 300  # seconds between background server-time syncs
 
 
 def get_session():
+    from pybit.unified_trading import HTTP  # pybit is heavy and only this legacy helper needs it
     return HTTP(
         testnet=True,
         api_key=config.BYBIT_API_KEY,
         api_secret=config.BYBIT_API_SECRET
     )
 
-def get_usdt_balance():
-    try:
-        server_time_resp = requests.get("https://api.bybit.com/v5/market/time")
-        server_timestamp = str(server_time_resp.json()["time"])
-
-        url = "https://api.bybit.com/v5/account/wallet-balance"
-        recv_window = "5000"
-        params = f"accountType=UNIFIED&coin=USDT"
 
-        to_sign = f"{server_timestamp}{config.BYBIT_API_KEY}{recv_window}{params}"
-        sign = hmac.new(
-            config.BYBIT_API_SECRET.encode("utf-8"),
+# === Server clock offset ===
+class ClockOffset:
+    """
+    Estimates (server_ms - local_ms) from /v5/market/time, using the request midpoint
+    to cancel out half of the round trip. The first signed call syncs inline (concurrent
+    first callers wait for that one sync), after that a daemon thread re-syncs every
+    sync_interval seconds.
+    """
+
+    def __init__(self, fetch_server_ms, sync_interval=TIME_SYNC_INTERVAL):
+        self._fetch_server_ms = fetch_server_ms
+        self._sync_interval = sync_interval
+        self._offset_ms = 0.0
+        self._synced = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def sync(self):
+        sent = time.time() * 1000
+        server_ms = self._fetch_server_ms()
+        received = time.time() * 1000
+        self._offset_ms = server_ms - (sent + received) / 2
+        self._synced.set()
+        return self._offset_ms, received - sent
+
+    def _run(self):
+        while True:
+            time.sleep(self._sync_interval)
+            try:
+                self.sync()
+            except Exception as e:
+                warn(f"⚠️ Server time sync failed: {e}")
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="bybit-time-sync", daemon=True)
+                self._thread.start()
+
+    def now_ms(self):
+        if not self._synced.is_set():
+            with self._start_lock:
+                if not self._synced.is_set():
+                    self.sync()
+            self.start()
+        return int(time.time() * 1000 + self._offset_ms)
+
+
+BYBIT_REQUESTS = metrics.counter("bybit_requests_total", "Bybit REST requests sent", ["method", "path"])
+BYBIT_LATENCY = metrics.histogram("bybit_request_seconds", "Bybit REST round trip", ["method", "path"])
+BYBIT_ERRORS = metrics.counter("bybit_errors_total", "Bybit calls with retCode != 0 (ret_code) or that raised (exception type)", ["path", "ret_code"])
+
+
+def _observe(method, path, started, exc=None):
+    BYBIT_REQUESTS.labels(method, path).inc()
+    BYBIT_LATENCY.labels(method, path).observe(time.perf_counter() - started)
+    if exc is not None:
+        BYBIT_ERRORS.labels(path, type(exc).__name__).inc()  # timeouts, resets: no retCode to count
+
+
+def _count_errors(path, data):
+    ret_code = data.get("retCode") if isinstance(data, dict) else None
+    if ret_code not in (0, None):
+        BYBIT_ERRORS.labels(path, str(ret_code)).inc()
+    return data
+
+
+# === Signed REST client ===
+class BybitClient:
+    """
+    One keep-alive requests.Session shared by every call (TCP + TLS handshakes are paid once),
+    a background-synced server clock offset and a single signer for GET and POST.
+    Every call goes through the per-endpoint-group rate limiter, and identical
+    concurrent GETs (e.g. a burst of /balance taps) are coalesced into one request.
+    """
+
+    def __init__(self, api_key=None, api_secret=None, base_url=None, pool_size=10):
+        self.api_key = api_key if api_key is not None else config.BYBIT_API_KEY
+        self.api_secret = api_secret if api_secret is not None else config.BYBIT_API_SECRET
+        self.base_url = (base_url or BASE_URL).rstrip("/")
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.clock = ClockOffset(self._fetch_server_ms)
+        self._flights = SingleFlight()
+
+    def _fetch_server_ms(self):
+        response = self.session.get(f"{self.base_url}/v5/market/time", timeout=5)
+        return int(response.json()["time"])
+
+    def sign(self, timestamp, payload):
+        to_sign = f"{timestamp}{self.api_key}{RECV_WINDOW}{payload}"
+        return hmac.new(
+            self.api_secret.encode("utf-8"),
             to_sign.encode("utf-8"),
             hashlib.sha256
         ).hexdigest()
 
-        headers = {
-            "X-BAPI-API-KEY": config.BYBIT_API_KEY,
-            "X-BAPI-SIGN": sign,
-            "X-BAPI-TIMESTAMP": server_timestamp,
-            "X-BAPI-RECV-WINDOW": recv_window
+    def _signed_headers(self, payload):
+        timestamp = str(self.clock.now_ms())
+        with tracing.span("sign"):
+            signature = self.sign(timestamp, payload)
+        return {
+            "X-BAPI-API-KEY": self.api_key,
+            "X-BAPI-SIGN": signature,
+            "X-BAPI-TIMESTAMP": timestamp,
+            "X-BAPI-RECV-WINDOW": RECV_WINDOW
         }
 
-        response = requests.get(f"{url}?{params}", headers=headers)
+    def get(self, path, params=None, signed=False):
+        query = "&".join(f"{k}={v}" for k, v in (params or {}).items())
+        url = f"{self.base_url}{path}?{query}" if query else f"{self.base_url}{path}"
+
+        def send():
+            headers = self._signed_headers(query) if signed else None
+            started = time.perf_counter()
+            try:
+                with tracing.span(f"http:{path}"):
+                    response = self.session.get(url, headers=headers, timeout=10)
+            except Exception as e:
+                _observe("GET", path, started, e)
+                raise
+            _observe("GET", path, started)
+            return response
+
+        return self._flights.do((path, query), lambda: _count_errors(path, request_with_limits(path, send)))
+
+    def post(self, path, body):
+        body_str = json.dumps(body, separators=(",", ":"))
 
-        print("📡 Response status:", response.status_code)
-        print("📄 Response headers:", response.headers)
-        print("📄 Raw response:", response.text)
+        def send():
+            headers = self._signed_headers(body_str)
+            headers["Content-Type"] = "application/json"
+            started = time.perf_counter()
+            try:
+                with tracing.span(f"http:{path}"):
+                    response = self.session.post(f"{self.base_url}{path}", data=body_str, headers=headers, timeout=10)
+            except Exception as e:
+                _observe("POST", path, started, e)
+                raise
+            _observe("POST", path, started)
+            return response
+
+        return _count_errors(path, request_with_limits(path, send))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = BybitClient()
+    return _client
+
+
+def reset_client(**kwargs):
+    """Replaces the shared client, e.g. reset_client(base_url=...) to target exchange_sim."""
+    global _client
+    with _client_lock:
+        _client = BybitClient(**kwargs)
+    return _client
 
-        try:
-            data = response.json()
-        except Exception as e:
-            error(f"❌ JSON parse error: {e} | Raw: {response.text}")
-            return None
 
-        info(f"🔎 FULL BALANCE RESPONSE: {data}")
+# === Account / market helpers ===
+def get_usdt_balance():
+    try:
+        data = get_client().get(
+            "/v5/account/wallet-balance", {"accountType": "UNIFIED", "coin": "USDT"}, signed=True
+        )
+        debug("🔎 FULL BALANCE RESPONSE: %s", data)
 
         if data.get("retCode") != 0:
             error(f"❌ API Error: {data.get('retMsg', 'Unknown error')}")
@@ -71,6 +222,9 @@ def get_usdt_balance():
             error(f"❌ Unexpected response format: {e}")
             return None
 
+    except ValueError as e:
+        error(f"❌ JSON parse error: {e}")
+        return None
     except Exception as e:
         error(f"❌ Raw API balance error: {e}")
         return None
@@ -78,10 +232,7 @@ def get_usdt_balance():
 
 def get_market_price(symbol):
     try:
-        url = "https://api.bybit.com/v5/market/tickers"
-        params = {"category": "linear", "symbol": symbol}
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = get_client().get("/v5/market/tickers", {"category": "linear", "symbol": symbol})
         return float(data['result']['list'][0]['lastPrice'])
     except Exception as e:
         error(f"Market price error: {e}")
@@ -89,30 +240,8 @@ def get_market_price(symbol):
 
 def get_position_info(symbol):
     try:
-        server_time_resp = requests.get("https://api.bybit.com/v5/market/time")
-        server_timestamp = str(server_time_resp.json()["time"])
-
-        url = "https://api.bybit.com/v5/position/list"
-        recv_window = "5000"
-        params = f"category=linear&symbol={symbol}"
-
-        to_sign = f"{server_timestamp}{config.BYBIT_API_KEY}{recv_window}{params}"
-        sign = hmac.new(
-            config.BYBIT_API_SECRET.encode("utf-8"),
-            to_sign.encode("utf-8"),
-            hashlib.sha256
-        ).hexdigest()
-
-        headers = {
-            "X-BAPI-API-KEY": config.BYBIT_API_KEY,
-            "X-BAPI-SIGN": sign,
-            "X-BAPI-TIMESTAMP": server_timestamp,
-            "X-BAPI-RECV-WINDOW": recv_window
-        }
-
-        response = requests.get(f"{url}?{params}", headers=headers)
-        data = response.json()
-        info(f"📦 POSITION INFO: {data}")
+        data = get_client().get("/v5/position/list", {"category": "linear", "symbol": symbol}, signed=True)
+        debug("📦 POSITION INFO: %s", data)
 
         return data["result"]["list"][0] if data["result"]["list"] else {}
     except Exception as e:
@@ -121,39 +250,14 @@ def get_position_info(symbol):
 
 def set_leverage(symbol, leverage):
     try:
-        server_time_resp = requests.get("https://api.bybit.com/v5/market/time")
-        server_timestamp = str(server_time_resp.json()["time"])
-
-        url = "https://api.bybit.com/v5/position/set-leverage"
-        recv_window = "5000"
-
         body = {
             "category": "linear",
             "symbol": symbol,
             "buyLeverage": str(leverage),
             "sellLeverage": str(leverage)
         }
-
-        body_str = json.dumps(body, separators=(",", ":"))
-        to_sign = f"{server_timestamp}{config.BYBIT_API_KEY}{recv_window}{body_str}"
-
-        sign = hmac.new(
-            config.BYBIT_API_SECRET.encode("utf-8"),
-            to_sign.encode("utf-8"),
-            hashlib.sha256
-        ).hexdigest()
-
-        headers = {
-            "Content-Type": "application/json",
-            "X-BAPI-API-KEY": config.BYBIT_API_KEY,
-            "X-BAPI-SIGN": sign,
-            "X-BAPI-TIMESTAMP": server_timestamp,
-            "X-BAPI-RECV-WINDOW": recv_window
-        }
-
-        response = requests.post(url, data=body_str, headers=headers)
-        data = response.json()
-        info(f"📨 LEVERAGE RESPONSE: {data}")
+        data = get_client().post("/v5/position/set-leverage", body)
+        info("📨 LEVERAGE RESPONSE: %s", data, rate=5)
 
         if data["retCode"] == 0:
             return True, f"Leverage set to {leverage}x"
@@ -165,32 +269,8 @@ def set_leverage(symbol, leverage):
 
 def place_order(order_data):
     try:
-        server_time_resp = requests.get("https://api.bybit.com/v5/market/time")
-        server_timestamp = str(server_time_resp.json()["time"])
-
-        url = "https://api.bybit.com/v5/order/create"
-        recv_window = "5000"
-
-        body_str = json.dumps(order_data, separators=(",", ":"))
-        to_sign = f"{server_timestamp}{config.BYBIT_API_KEY}{recv_window}{body_str}"
-
-        sign = hmac.new(
-            config.BYBIT_API_SECRET.encode("utf-8"),
-            to_sign.encode("utf-8"),
-            hashlib.sha256
-        ).hexdigest()
-
-        headers = {
-            "Content-Type": "application/json",
-            "X-BAPI-API-KEY": config.BYBIT_API_KEY,
-            "X-BAPI-SIGN": sign,
-            "X-BAPI-TIMESTAMP": server_timestamp,
-            "X-BAPI-RECV-WINDOW": recv_window
-        }
-
-        response = requests.post(url, data=body_str, headers=headers)
-        data = response.json()
-        info(f"📤 ORDER RESPONSE: {data}")
+        data = get_client().post("/v5/order/create", order_data)
+        info("📤 ORDER RESPONSE: %s", data, rate=5)
 
         if data["retCode"] == 0:
             return True, data
@@ -200,41 +280,17 @@ def place_order(order_data):
         error(f"Order error: {e}")
         return False, f"Order error: {str(e)}"
 
-def set_tp_sl(side, take_profit, stop_loss):
+def set_tp_sl(side, take_profit, stop_loss, symbol=None):
     try:
-        server_time_resp = requests.get("https://api.bybit.com/v5/market/time")
-        server_timestamp = str(server_time_resp.json()["time"])
-
-        url = "https://api.bybit.com/v5/position/trading-stop"
-        recv_window = "5000"
         body = {
             "category": "linear",
-            "symbol": config.SYMBOL,
+            "symbol": symbol or config.SYMBOL,
             "takeProfit": str(round(take_profit, 2)),
             "stopLoss": str(round(stop_loss, 2)),
             "positionIdx": 1 if side == "Buy" else 2
         }
-
-        body_str = json.dumps(body, separators=(",", ":"))
-        to_sign = f"{server_timestamp}{config.BYBIT_API_KEY}{recv_window}{body_str}"
-
-        sign = hmac.new(
-            config.BYBIT_API_SECRET.encode("utf-8"),
-            to_sign.encode("utf-8"),
-            hashlib.sha256
-        ).hexdigest()
-
-        headers = {
-            "Content-Type": "application/json",
-            "X-BAPI-API-KEY": config.BYBIT_API_KEY,
-            "X-BAPI-SIGN": sign,
-            "X-BAPI-TIMESTAMP": server_timestamp,
-            "X-BAPI-RECV-WINDOW": recv_window
-        }
-
-        response = requests.post(url, data=body_str, headers=headers)
-        data = response.json()
-        info(f"🎯 TP/SL RESPONSE: {data}")
+        data = get_client().post("/v5/position/trading-stop", body)
+        info("🎯 TP/SL RESPONSE: %s", data, rate=5)
 
         if data["retCode"] == 0:
             success("🎯 TP & SL set successfully.")
@@ -244,4 +300,4 @@ def set_tp_sl(side, take_profit, stop_loss):
             return False
     except Exception as e:
         error(f"TP/SL error: {e}")
-        return False
\ No newline at end of file
+        return False
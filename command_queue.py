@@ -0,0 +1,94 @@
+import time
+import queue
+import threading
+
+import config
+import metrics
+from log_utils import info, warn, error
+
+# === Bounded command worker pool ===
+# Each user is pinned to one worker (user_id % workers), so one user's commands run in
+# the order they arrived while different users run in parallel. Every worker owns a
+# bounded queue: when it is full, submit() fails and the webhook answers 503 so
+# Telegram redelivers the update later instead of the process buffering without limit.
+
+SUBMIT_TIMEOUT = 0.05  # seconds the webhook may block on a full queue before rejecting
+
+COMMANDS = metrics.counter("webhook_commands_total", "Webhook commands by result", ["result"])
+COMMAND_SECONDS = metrics.histogram("webhook_command_seconds", "Command handler run time")
+COMMAND_WAIT_SECONDS = metrics.histogram("webhook_command_queue_seconds", "Time a command waited for its worker")
+
+
+class CommandDispatcher:
+    def __init__(self, workers=None, queue_size=None):
+        self.workers = workers or config.WEBHOOK_WORKERS
+        queue_size = queue_size or config.WEBHOOK_QUEUE_SIZE
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(self.workers)]
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "rejected": 0, "processed": 0, "failed": 0}
+        for index, worker_queue in enumerate(self._queues):
+            threading.Thread(
+                target=self._run, args=(worker_queue,), name=f"command-worker-{index}", daemon=True
+            ).start()
+        metrics.gauge("webhook_queue_depth", "Commands waiting across all workers").set_function(
+            lambda: sum(q.qsize() for q in self._queues)
+        )
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+        COMMANDS.labels(key).inc()
+
+    def _run(self, worker_queue):
+        while True:
+            fn, args, queued_at = worker_queue.get()
+            started = time.monotonic()
+            COMMAND_WAIT_SECONDS.observe(started - queued_at)
+            try:
+                fn(*args)
+                self._count("processed")
+            except Exception as e:
+                self._count("failed")
+                error(f"❌ Command {getattr(fn, '__name__', fn)} failed: {e}")
+            finally:
+                worker_queue.task_done()
+                COMMAND_SECONDS.observe(time.monotonic() - started)
+            waited = started - queued_at
+            if waited > 5:
+                warn(f"⚠️ Command waited {waited:.1f}s in queue")
+
+    def submit(self, user_id, fn, *args):
+        """Queues fn(*args) behind user_id's earlier commands. False when that worker's queue is full."""
+        worker_queue = self._queues[hash(user_id) % self.workers]
+        try:
+            worker_queue.put((fn, args, time.monotonic()), timeout=SUBMIT_TIMEOUT)
+        except queue.Full:
+            self._count("rejected")
+            return False
+        self._count("submitted")
+        return True
+
+    def join(self):
+        for worker_queue in self._queues:
+            worker_queue.join()
+
+    def stats(self):
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot["queued"] = [q.qsize() for q in self._queues]
+        snapshot["workers"] = self.workers
+        return snapshot
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = CommandDispatcher()
+                info(f"🧵 Command dispatcher started ({_dispatcher.workers} workers)")
+    return _dispatcher
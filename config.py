@@ -6,11 +6,37 @@ load_dotenv()
 
 # === Telegram Bot ===
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")  # or a local Bot API server
 CONTACT_ID = os.getenv("CONTACT_ID")
 
 # 🔐 Allowed users (Telegram IDs)
 ALLOWED_USERS = list(map(int, [x.strip() for x in os.getenv("ALLOWED_USERS", "").split(",")]))
 
+# === Webhook server ===
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 8))  # command workers; each user is pinned to one
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 100))  # pending commands per worker before 503
+WEBHOOK_SERVER_THREADS = int(os.getenv("WEBHOOK_SERVER_THREADS", 16))  # waitress HTTP threads
+
+# === Job runner ===
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))  # jobs running at once across all types
+JOB_WARM_WORKERS = int(os.getenv("JOB_WARM_WORKERS", 1))  # idle pre-imported worker processes
+
+# === Scheduled pipeline (scheduled_updater.py) ===
+PIPELINE_GRACE_SECONDS = float(os.getenv("PIPELINE_GRACE_SECONDS", 5))  # wait after a candle closes before ingesting
+PIPELINE_ROLLUP_INTERVALS = os.getenv("PIPELINE_ROLLUP_INTERVALS", "240,1440")  # minutes, higher-timeframe bars in ohlcv_rollup
+PIPELINE_RETRAIN_INTERVAL = int(os.getenv("PIPELINE_RETRAIN_INTERVAL", 1440))  # minutes; retrain once per completed bucket
+
+# === Out-of-sample evaluation during training (train_ppo.py) ===
+EVAL_HOLDOUT_FRACTION = float(os.getenv("EVAL_HOLDOUT_FRACTION", 0.2))  # newest bars kept out of training; 0 disables
+EVAL_EVERY_TIMESTEPS = int(os.getenv("EVAL_EVERY_TIMESTEPS", 10000))  # policy snapshot interval
+EVAL_PATIENCE = int(os.getenv("EVAL_PATIENCE", 5))  # evaluations without improvement before stopping; 0 never stops
+EVAL_MIN_DELTA = float(os.getenv("EVAL_MIN_DELTA", 0.001))  # held-out return gain that counts as improvement
+
+# === Shared state store ===
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")  # sqlite | redis
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "bot_state.db")
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0")
+
 # === OHLCV DB ===
 DB_PATH = os.getenv("DB_PATH", "ohlcv_data.db")
 
@@ -21,9 +47,22 @@ LIMIT = int(os.getenv("LIMIT", "200"))
 
 # === Model config ===
 MODEL_PATH = os.getenv("MODEL_PATH", "ppo_crypto_trader.zip")
+POLICY_EXPORT_PATH = os.getenv("POLICY_EXPORT_PATH", "ppo_crypto_trader.pt")  # TorchScript policy for policy_runtime
+INFERENCE_SYMBOLS = os.getenv("INFERENCE_SYMBOLS", SYMBOL)  # comma-separated, one LSTM state per symbol in batch_inference
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv("INFERENCE_BATCH_WINDOW_MS", 250))  # max wait for the rest of a bar's observations
 
 # === Bybit Endpoint ===
-BYBIT_OHLCV_ENDPOINT = os.getenv("BYBIT_OHLCV_ENDPOINT", "https://api.bybit.com/v5/market/kline")
+BYBIT_BASE_URL = os.getenv("BYBIT_BASE_URL", "https://api.bybit.com")  # e.g. http://127.0.0.1:8765 for exchange_sim.py
+BYBIT_OHLCV_ENDPOINT = os.getenv("BYBIT_OHLCV_ENDPOINT", f"{BYBIT_BASE_URL}/v5/market/kline")
+BYBIT_WS_PUBLIC_URL = os.getenv("BYBIT_WS_PUBLIC_URL", "wss://stream.bybit.com/v5/public/linear")
+BYBIT_WS_PRIVATE_URL = os.getenv("BYBIT_WS_PRIVATE_URL", "wss://stream.bybit.com/v5/private")
+
+# === Market data cache ===
+MARKET_DATA_STREAM = os.getenv("MARKET_DATA_STREAM", "1") == "1"  # 0 = REST only (e.g. against exchange_sim)
+MARKET_DATA_MAX_STALENESS = float(os.getenv("MARKET_DATA_MAX_STALENESS", 2.0))  # seconds
+
+# === Portfolio engine ===
+PORTFOLIO_PRIVATE_STREAM = os.getenv("PORTFOLIO_PRIVATE_STREAM", "1") == "1"  # 0 = position book synced via REST only
 
 # === Bybit API Keys ===
 BYBIT_API_KEY = os.getenv("BYBIT_API_KEY")
@@ -34,7 +73,14 @@ STOP_LOSS_PERCENT = float(os.getenv("STOP_LOSS_PERCENT", 2))
 TAKE_PROFIT_PERCENT = float(os.getenv("TAKE_PROFIT_PERCENT", 4))
 RISK_PERCENT = float(os.getenv("RISK_PERCENT", 2))
 MAX_DRAWDOWN_PERCENT = float(os.getenv("MAX_DRAWDOWN_PERCENT", 10))
-RISK_STATE_FILE = os.getenv("RISK_STATE_FILE", "risk_state.json")
+RISK_STATE_FILE = os.getenv("RISK_STATE_FILE", "risk_state.json")  # legacy, imported once into the state store
+MAX_DAILY_LOSS_PERCENT = float(os.getenv("MAX_DAILY_LOSS_PERCENT", 5))
+MAX_LEVERAGE = int(os.getenv("MAX_LEVERAGE", 10))
+MAX_SYMBOL_EXPOSURE_PERCENT = float(os.getenv("MAX_SYMBOL_EXPOSURE_PERCENT", 1000))  # notional per symbol, % of equity
+MAX_GROSS_LEVERAGE = float(os.getenv("MAX_GROSS_LEVERAGE", 10))  # sum of notionals / equity
+RISK_CONFIDENCE = float(os.getenv("RISK_CONFIDENCE", 0.99))  # VaR / ES confidence level
+RISK_WINDOW = int(os.getenv("RISK_WINDOW", 168))  # bars per rolling VaR window
+VOL_TARGET_PERCENT = float(os.getenv("VOL_TARGET_PERCENT", 50))  # annualized volatility budget per position, % of equity
 
 # === Fees ===
 TRADING_FEE_PERCENT = float(os.getenv("TRADING_FEE_PERCENT", 0.04))  # default: 0.04%
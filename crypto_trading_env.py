@@ -1,29 +1,46 @@
 import gymnasium as gym
 import numpy as np
-import pandas as pd
-import sqlite3
-import os
 from gymnasium import spaces
 from dotenv import load_dotenv
 import config
+import metrics
+from data_access import count_rows, iter_chunks, CHUNK_ROWS
 from log_utils import info, error
 
 # Load environment variables
 load_dotenv()
 
+ENV_STEPS = metrics.counter("env_steps_total", "CryptoTradingEnv.step calls")
+ENV_TRADES = metrics.counter("env_trades_total", "Simulated fills in CryptoTradingEnv", ["side"])
+_BUYS, _SELLS = ENV_TRADES.labels("Buy"), ENV_TRADES.labels("Sell")
+
+OBS_COLUMNS = ("open", "high", "low", "close", "volume")
+CLOSE = OBS_COLUMNS.index("close")
+
 class CryptoTradingEnv(gym.Env):
-    def __init__(self):
+    """
+    Bars are streamed from the ohlcv table in float32 chunks of chunk_rows (data_access.iter_chunks),
+    so an episode over any history length holds one chunk (20 bytes per bar) in memory.
+    start/end (ms) limit the episode to a time range.
+    """
+    def __init__(self, symbol=None, start=None, end=None, db_path=None, chunk_rows=CHUNK_ROWS):
         super().__init__()
 
-        db_path = os.getenv("DB_PATH", "ohlcv_data.db")
-        self.conn = sqlite3.connect(db_path)
-        self.df = pd.read_sql("SELECT * FROM ohlcv ORDER BY timestamp", self.conn)
-        info(f"📊 LOADED {len(self.df)} rows from {db_path}")
+        self.symbol = symbol or config.SYMBOL
+        self.start, self.end = start, end
+        self.db_path = db_path or config.DB_PATH
+        self.chunk_rows = chunk_rows
+        self.n_rows = count_rows(self.symbol, start, end, db_path=self.db_path)
+        info(f"📊 {self.n_rows} {self.symbol} rows in {self.db_path}, streamed in chunks of {chunk_rows}")
 
-        if self.df.empty:
+        if self.n_rows == 0:
             error("❌ OHLCV data is empty. Please fetch data first.")
             raise ValueError("❌ OHLCV data is empty. Please fetch data first.")
 
+        self._chunks = None
+        self._chunk = None
+        self._chunk_start = 0
+
         self.current_step = 0
         self.balance = 1000.0
         self.crypto_held = 0.0
@@ -31,12 +48,24 @@ class CryptoTradingEnv(gym.Env):
         self.action_space = spaces.Discrete(3)
         self.observation_space = spaces.Box(low=0, high=np.inf, shape=(6,), dtype=np.float32)
 
+    def _row(self, index):
+        """Bar `index` of the episode; sequential access pulls the next chunk, going back restarts the stream."""
+        chunk = self._chunk
+        if chunk is not None and self._chunk_start <= index < self._chunk_start + len(chunk):
+            return chunk[index - self._chunk_start]
+        if chunk is None or index < self._chunk_start:
+            self._chunks = iter_chunks(self.symbol, self.start, self.end, columns=OBS_COLUMNS,
+                                       chunk_rows=self.chunk_rows, db_path=self.db_path, dtype=np.float32)
+            self._chunk, self._chunk_start = next(self._chunks), 0
+        while index >= self._chunk_start + len(self._chunk):
+            self._chunk_start += len(self._chunk)
+            self._chunk = next(self._chunks)
+        return self._chunk[index - self._chunk_start]
+
     def _get_observation(self):
-        row = self.df.iloc[self.current_step]
-        obs = np.array([
-            row['open'], row['high'], row['low'],
-            row['close'], row['volume'], self.balance
-        ], dtype=np.float32)
+        obs = np.empty(6, dtype=np.float32)
+        obs[:5] = self._row(self.current_step)
+        obs[5] = self.balance
         return obs
 
     def reset(self, *, seed=None, options=None):
@@ -44,32 +73,34 @@ class CryptoTradingEnv(gym.Env):
         self.current_step = 0
         self.balance = 1000.0
         self.crypto_held = 0.0
-        info("🔄 Environment reset")
+        info("🔄 Environment reset", rate=1)
         return self._get_observation(), {}
 
     def step(self, action):
-        row = self.df.iloc[self.current_step]
-        price = row['close']
+        ENV_STEPS.inc()
+        price = float(self._row(self.current_step)[CLOSE])
 
         if action == 1 and self.balance > 0:
             fee = self.balance * config.TRADING_FEE_PERCENT / 100
             amount_to_use = self.balance - fee
             self.crypto_held = amount_to_use / price
             self.balance = 0
-            info(f"🟢 BUY at {price:.2f}, used {amount_to_use:.2f} after fee {fee:.4f}")
+            _BUYS.inc()
+            info("🟢 BUY at %.2f, used %.2f after fee %.4f", price, amount_to_use, fee, rate=2)
         elif action == 2 and self.crypto_held > 0:
             gross = self.crypto_held * price
             fee = gross * config.TRADING_FEE_PERCENT / 100
             self.balance = gross - fee
-            info(f"🔴 SELL at {price:.2f}, received {gross:.2f}, fee {fee:.4f}, net {self.balance:.2f}")
+            _SELLS.inc()
+            info("🔴 SELL at %.2f, received %.2f, fee %.4f, net %.2f", price, gross, fee, self.balance, rate=2)
             self.crypto_held = 0
 
         self.current_step += 1
-        terminated = self.current_step >= len(self.df) - 1
+        terminated = self.current_step >= self.n_rows - 1
         truncated = False
         reward = self.balance + self.crypto_held * price
 
-        return self._get_observation(), reward, terminated, truncated, {}
+        return self._get_observation(), reward, terminated, truncated, {"price": price}
 
     def render(self):
-        info(f"📺 Step: {self.current_step}, Balance: {self.balance:.2f}, Crypto Held: {self.crypto_held:.4f}")
\ No newline at end of file
+        info("📺 Step: %d, Balance: %.2f, Crypto Held: %.4f", self.current_step, self.balance, self.crypto_held, every=1000)
\ No newline at end of file
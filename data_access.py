@@ -0,0 +1,166 @@
+import sqlite3
+import threading
+
+import numpy as np
+
+import config
+from log_utils import warn
+
+# === Chunked, bounded-memory access to the ohlcv table ===
+# Readers never load the whole table: iter_chunks() pages through a time range with
+# keyset pagination on (timestamp, rowid), one short query per chunk, so memory is
+# bounded by chunk_rows and no read transaction stays open between chunks (fetch_data
+# can keep writing while a long training run streams bars). Summary statistics are
+# streaming reductions over those chunks, constant memory for any history size.
+#
+#   for chunk in iter_chunks("BTCUSDT", start=ts0, end=ts1, columns=("close",)):
+#       ...                                  # float64 array [rows, len(columns)]
+#   stats = return_stats("BTCUSDT")          # RunningStats of bar-to-bar returns
+
+TABLE_NAME = "ohlcv"
+INDEX_NAME = "idx_ohlcv_symbol_timestamp"
+COLUMNS = ("timestamp", "open", "high", "low", "close", "volume")
+CHUNK_ROWS = 100_000
+
+_indexed = set()
+_indexed_lock = threading.Lock()
+
+
+def ensure_index(conn, db_path=None):
+    """(symbol, timestamp) index that makes range scans and ORDER BY timestamp streaming."""
+    key = db_path or id(conn)
+    if key in _indexed:
+        return
+    with _indexed_lock:
+        try:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON {TABLE_NAME} (symbol, timestamp)")
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            warn(f"⚠️ Could not create {INDEX_NAME}: {e}")
+        _indexed.add(key)
+
+
+def connect(db_path=None):
+    db_path = db_path or config.DB_PATH
+    conn = sqlite3.connect(db_path)
+    ensure_index(conn, db_path)
+    return conn
+
+
+def _where(symbol, start, end):
+    """WHERE clause over [start, end) in ms; None bounds are open."""
+    clauses, params = ["symbol = ?"], [symbol or config.SYMBOL]
+    if start is not None:
+        clauses.append("timestamp >= ?")
+        params.append(int(start))
+    if end is not None:
+        clauses.append("timestamp < ?")
+        params.append(int(end))
+    return " AND ".join(clauses), params
+
+
+def count_rows(symbol=None, start=None, end=None, db_path=None):
+    where, params = _where(symbol, start, end)
+    conn = connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME} WHERE {where}", params).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def time_range(symbol=None, db_path=None):
+    """(first, last) bar timestamp in ms, (None, None) without data."""
+    where, params = _where(symbol, None, None)
+    conn = connect(db_path)
+    try:
+        return conn.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM {TABLE_NAME} WHERE {where}", params).fetchone()
+    finally:
+        conn.close()
+
+
+def timestamp_at(row, symbol=None, db_path=None):
+    """Timestamp of the row-th bar (0-based, timestamp order), e.g. to split train / held-out ranges."""
+    where, params = _where(symbol, None, None)
+    conn = connect(db_path)
+    try:
+        found = conn.execute(
+            f"SELECT timestamp FROM {TABLE_NAME} WHERE {where} ORDER BY timestamp LIMIT 1 OFFSET ?", params + [int(row)]
+        ).fetchone()
+        return found[0] if found else None
+    finally:
+        conn.close()
+
+
+def iter_chunks(symbol=None, start=None, end=None, columns=COLUMNS, chunk_rows=CHUNK_ROWS, db_path=None,
+                dtype=np.float64):
+    """
+    Yields arrays [rows <= chunk_rows, len(columns)] in timestamp order over [start, end).
+    float64 keeps ms timestamps exact; price/volume-only readers can ask for float32.
+    """
+    where, params = _where(symbol, start, end)
+    select = ", ".join(columns)
+    first = f"SELECT {select}, timestamp, rowid FROM {TABLE_NAME} WHERE {where} ORDER BY timestamp, rowid LIMIT ?"
+    after = (f"SELECT {select}, timestamp, rowid FROM {TABLE_NAME} WHERE {where} "
+             f"AND (timestamp > ? OR (timestamp = ? AND rowid > ?)) ORDER BY timestamp, rowid LIMIT ?")
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(first, params + [chunk_rows]).fetchall()
+        while rows:
+            last_ts, last_rowid = rows[-1][-2], rows[-1][-1]
+            chunk = np.array(rows, dtype=np.float64)[:, :-2]
+            yield chunk if dtype == np.float64 else chunk.astype(dtype)
+            if len(rows) < chunk_rows:
+                break
+            rows = conn.execute(after, params + [last_ts, last_ts, last_rowid, chunk_rows]).fetchall()
+    finally:
+        conn.close()
+
+
+# === Streaming reductions ===
+class RunningStats:
+    """Count / mean / variance / min / max merged chunk by chunk (Welford, Chan et al. pairwise update)."""
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        if not n:
+            return self
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else float("nan")  # ddof=1, like pandas
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+
+
+def return_stats(symbol=None, start=None, end=None, chunk_rows=CHUNK_ROWS, db_path=None):
+    """RunningStats of close-to-close returns (pandas pct_change().dropna()) over the range."""
+    stats = RunningStats()
+    previous = None
+    for chunk in iter_chunks(symbol, start, end, columns=("close",), chunk_rows=chunk_rows, db_path=db_path):
+        closes = chunk[:, 0]
+        if previous is not None:
+            closes = np.concatenate(([previous], closes))
+        stats.update(closes[1:] / closes[:-1] - 1.0)
+        previous = closes[-1]
+    return stats
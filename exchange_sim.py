@@ -0,0 +1,435 @@
+import os
+import json
+import time
+import hmac
+import uuid
+import random
+import sqlite3
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import config
+from log_utils import info, success, warn
+
+# === Local stand-in for the Bybit v5 REST endpoints used by this project ===
+# Replays OHLCV bars from the local DB as the market, fills market orders at the
+# current bar close (single or batch) and triggers TP/SL against each replayed bar's high/low.
+# Point the bot at it with BYBIT_BASE_URL=http://127.0.0.1:<port>.
+
+DEFAULT_PORT = 8765
+FEE_RATE = config.TRADING_FEE_PERCENT / 100
+
+
+def _ok(result, ret_msg="OK"):
+    return {"retCode": 0, "retMsg": ret_msg, "result": result, "retExtInfo": {}, "time": int(time.time() * 1000)}
+
+
+def _fail(code, msg):
+    return {"retCode": code, "retMsg": msg, "result": {}, "retExtInfo": {}, "time": int(time.time() * 1000)}
+
+
+class SimExchange:
+    """Matching engine + account state. All public methods are called under self.lock."""
+
+    def __init__(self, db_path, bar_seconds=1.0, balance=10_000.0, api_secret=None, start_bar=0):
+        self.lock = threading.Lock()
+        self.bar_seconds = bar_seconds
+        self.start_bar = start_bar  # replay starts here; -1 = newest bar, i.e. the whole history is visible
+        self.api_secret = api_secret
+        self.balance = balance
+        self.positions = {}
+        self.leverage = {}
+        self.order_count = 0
+        self.bars = self._load_bars(db_path)
+        self.started = time.monotonic()
+        self.processed_idx = {symbol: 0 for symbol in self.bars}
+
+    @staticmethod
+    def _load_bars(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            rows = conn.execute(
+                "SELECT symbol, timestamp, open, high, low, close, volume FROM ohlcv ORDER BY symbol, timestamp"
+            ).fetchall()
+        finally:
+            conn.close()
+        bars = {}
+        for symbol, *bar in rows:
+            bars.setdefault(symbol, []).append(tuple(bar))
+        if not bars:
+            raise ValueError(f"❌ No OHLCV data in {db_path}. Please fetch data first.")
+        return bars
+
+    # === Market replay ===
+    def bar_index(self, symbol):
+        elapsed = time.monotonic() - self.started
+        steps = int(elapsed / self.bar_seconds) if self.bar_seconds > 0 else 0
+        return (self.start_bar + steps) % len(self.bars[symbol])
+
+    def current_bar(self, symbol):
+        return self.bars[symbol][self.bar_index(symbol)]
+
+    def advance(self):
+        """Runs TP/SL triggers over every bar replayed since the last request."""
+        for symbol, position in list(self.positions.items()):
+            idx = self.bar_index(symbol)
+            start = self.processed_idx.get(symbol, idx)
+            span = range(start + 1, idx + 1) if idx >= start else list(range(start + 1, len(self.bars[symbol]))) + list(range(0, idx + 1))
+            for i in span:
+                _, _, high, low, _, _ = self.bars[symbol][i]
+                hit = self._triggered_price(position, high, low)
+                if hit is not None:
+                    self._reduce(symbol, position["size"], hit)
+                    break
+            self.processed_idx[symbol] = idx
+
+    @staticmethod
+    def _triggered_price(position, high, low):
+        tp, sl = position.get("takeProfit"), position.get("stopLoss")
+        if position["side"] == "Buy":
+            if sl and low <= sl:
+                return sl
+            if tp and high >= tp:
+                return tp
+        else:
+            if sl and high >= sl:
+                return sl
+            if tp and low <= tp:
+                return tp
+        return None
+
+    # === Account ===
+    def _reduce(self, symbol, qty, price):
+        position = self.positions[symbol]
+        qty = min(qty, position["size"])
+        direction = 1 if position["side"] == "Buy" else -1
+        self.balance += direction * (price - position["avgPrice"]) * qty - qty * price * FEE_RATE
+        position["size"] -= qty
+        if position["size"] <= 1e-12:
+            del self.positions[symbol]
+
+    def position_view(self, symbol):
+        price = self.current_bar(symbol)[4]
+        leverage = self.leverage.get(symbol, 10)
+        position = self.positions.get(symbol)
+        if not position:
+            return {
+                "symbol": symbol, "side": "", "size": "0", "avgPrice": "0", "positionValue": "0",
+                "leverage": str(leverage), "liqPrice": "", "takeProfit": "", "stopLoss": "",
+                "unrealisedPnl": "0", "markPrice": str(price), "positionIdx": 0
+            }
+        direction = 1 if position["side"] == "Buy" else -1
+        avg = position["avgPrice"]
+        liq = avg * (1 - direction / leverage)
+        return {
+            "symbol": symbol, "side": position["side"], "size": str(round(position["size"], 6)),
+            "avgPrice": str(avg), "positionValue": str(round(avg * position["size"], 4)),
+            "leverage": str(leverage), "liqPrice": str(round(liq, 2)),
+            "takeProfit": str(position.get("takeProfit") or ""), "stopLoss": str(position.get("stopLoss") or ""),
+            "unrealisedPnl": str(round(direction * (price - avg) * position["size"], 4)),
+            "markPrice": str(price), "positionIdx": 0
+        }
+
+    # === Endpoints ===
+    def market_time(self, query):
+        now_ns = time.time_ns()
+        return _ok({"timeSecond": str(now_ns // 1_000_000_000), "timeNano": str(now_ns)})
+
+    def tickers(self, query):
+        symbol = query.get("symbol")
+        if symbol not in self.bars:
+            return _fail(10001, f"params error: symbol invalid {symbol}")
+        ts, o, h, l, c, v = self.current_bar(symbol)
+        spread = c * 0.00005
+        return _ok({"category": "linear", "list": [{
+            "symbol": symbol, "lastPrice": str(c), "markPrice": str(c), "indexPrice": str(c),
+            "bid1Price": str(round(c - spread, 2)), "ask1Price": str(round(c + spread, 2)),
+            "bid1Size": "1", "ask1Size": "1", "highPrice24h": str(h), "lowPrice24h": str(l), "volume24h": str(v)
+        }]})
+
+    def kline(self, query):
+        symbol = query.get("symbol")
+        if symbol not in self.bars:
+            return _fail(10001, f"params error: symbol invalid {symbol}")
+        limit = int(query.get("limit", 200))
+        start = int(query.get("start", 0))
+        visible = self.bars[symbol][:self.bar_index(symbol) + 1]
+        selected = [bar for bar in visible if bar[0] >= start][:limit]
+        rows = [[str(ts), str(o), str(h), str(l), str(c), str(v), str(round(v * c, 4))]
+                for ts, o, h, l, c, v in reversed(selected)]  # Bybit returns newest first
+        return _ok({"category": "linear", "symbol": symbol, "list": rows})
+
+    def wallet_balance(self, query):
+        equity = self.balance + sum(
+            float(self.position_view(symbol)["unrealisedPnl"]) for symbol in self.positions
+        )
+        return _ok({"list": [{"accountType": "UNIFIED", "totalEquity": str(equity), "coin": [{
+            "coin": "USDT", "walletBalance": str(round(self.balance, 6)), "equity": str(round(equity, 6))
+        }]}]})
+
+    def position_list(self, query):
+        symbol = query.get("symbol")
+        symbols = [symbol] if symbol else list(self.bars)
+        return _ok({"category": "linear", "list": [self.position_view(s) for s in symbols if s in self.bars]})
+
+    def set_leverage(self, body):
+        symbol = body.get("symbol")
+        leverage = int(float(body.get("buyLeverage", 0)))
+        if symbol not in self.bars or not 1 <= leverage <= 100:
+            return _fail(10001, "params error")
+        if self.leverage.get(symbol, 10) == leverage:
+            return _fail(110043, "leverage not modified")
+        self.leverage[symbol] = leverage
+        return _ok({})
+
+    def order_create(self, body):
+        symbol = body.get("symbol")
+        if symbol not in self.bars:
+            return _fail(10001, f"params error: symbol invalid {symbol}")
+        if body.get("orderType") != "Market":
+            return _fail(10001, "simulator only supports Market orders")
+        side = body.get("side")
+        qty = float(body.get("qty", 0))
+        if side not in ("Buy", "Sell") or qty <= 0:
+            return _fail(10001, "params error: side/qty")
+
+        price = self.current_bar(symbol)[4]
+        position = self.positions.get(symbol)
+        if body.get("reduceOnly"):
+            if not position or position["side"] == side:
+                return _fail(110017, "current position is zero, cannot fix reduce-only order qty")
+            self._reduce(symbol, qty, price)
+        elif position and position["side"] != side:
+            closing = min(qty, position["size"])
+            self._reduce(symbol, closing, price)
+            if qty > closing:
+                self._open(symbol, side, qty - closing, price, body)
+        else:
+            self._open(symbol, side, qty, price, body)
+
+        self.order_count += 1
+        return _ok({"orderId": str(uuid.uuid4()), "orderLinkId": body.get("orderLinkId", "")})
+
+    def order_create_batch(self, body):
+        acks, codes = [], []
+        for order in body.get("request", [])[:10]:
+            result = self.order_create(dict(order, category=body.get("category")))
+            acks.append({"category": "linear", "symbol": order.get("symbol"),
+                         "orderId": result["result"].get("orderId", ""), "orderLinkId": order.get("orderLinkId", "")})
+            codes.append({"code": result["retCode"], "msg": result["retMsg"]})
+        response = _ok({"list": acks})
+        response["retExtInfo"] = {"list": codes}
+        return response
+
+    def _open(self, symbol, side, qty, price, body):
+        position = self.positions.get(symbol)
+        if position:
+            total = position["size"] + qty
+            position["avgPrice"] = (position["avgPrice"] * position["size"] + price * qty) / total
+            position["size"] = total
+        else:
+            position = self.positions[symbol] = {"side": side, "size": qty, "avgPrice": price}
+            self.processed_idx[symbol] = self.bar_index(symbol)
+        self.balance -= qty * price * FEE_RATE
+        if body.get("takeProfit"):
+            position["takeProfit"] = float(body["takeProfit"])
+        if body.get("stopLoss"):
+            position["stopLoss"] = float(body["stopLoss"])
+
+    def trading_stop(self, body):
+        position = self.positions.get(body.get("symbol"))
+        if not position:
+            return _fail(10001, "can not set tp/sl/ts for zero position")
+        if body.get("takeProfit"):
+            position["takeProfit"] = float(body["takeProfit"])
+        if body.get("stopLoss"):
+            position["stopLoss"] = float(body["stopLoss"])
+        return _ok({})
+
+    # === Auth ===
+    def verify(self, headers, payload):
+        if not headers.get("X-BAPI-API-KEY") or not headers.get("X-BAPI-SIGN"):
+            return _fail(10003, "API key is invalid.")
+        timestamp = headers.get("X-BAPI-TIMESTAMP", "")
+        recv_window = headers.get("X-BAPI-RECV-WINDOW", "5000")
+        try:
+            skew = abs(int(time.time() * 1000) - int(timestamp))
+            window = int(recv_window)
+        except (TypeError, ValueError):
+            return _fail(10002, "invalid request, please check your server timestamp or recv_window param")
+        if skew > window:
+            return _fail(10002, "invalid request, please check your server timestamp or recv_window param")
+        if self.api_secret:
+            to_sign = f"{timestamp}{headers['X-BAPI-API-KEY']}{recv_window}{payload}"
+            expected = hmac.new(self.api_secret.encode("utf-8"), to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, headers["X-BAPI-SIGN"]):
+                return _fail(10004, "error sign!")
+        return None
+
+
+PUBLIC_GET = {
+    "/v5/market/time": SimExchange.market_time,
+    "/v5/market/tickers": SimExchange.tickers,
+    "/v5/market/kline": SimExchange.kline,
+}
+PRIVATE_GET = {
+    "/v5/account/wallet-balance": SimExchange.wallet_balance,
+    "/v5/position/list": SimExchange.position_list,
+}
+PRIVATE_POST = {
+    "/v5/position/set-leverage": SimExchange.set_leverage,
+    "/v5/order/create": SimExchange.order_create,
+    "/v5/order/create-batch": SimExchange.order_create_batch,
+    "/v5/position/trading-stop": SimExchange.trading_stop,
+}
+
+
+def make_handler(exchange, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+        disable_nagle_algorithm = True  # headers and body are separate writes; avoid 40 ms delayed-ACK stalls
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _respond(self, data, status=200):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _inject(self):
+            delay = latency_ms + (random.uniform(-jitter_ms, jitter_ms) if jitter_ms else 0.0)
+            if delay > 0:
+                time.sleep(delay / 1000)
+            if error_rate and random.random() < error_rate:
+                self._respond(_fail(10016, "Service error (injected by exchange_sim)"))
+                return True
+            return False
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            handler = PUBLIC_GET.get(url.path) or PRIVATE_GET.get(url.path)
+            if handler is None:
+                return self._respond(_fail(10001, f"unknown endpoint {url.path}"), status=404)
+            if self._inject():
+                return
+            with exchange.lock:
+                if url.path in PRIVATE_GET:
+                    denied = exchange.verify(self.headers, url.query)
+                    if denied:
+                        return self._respond(denied)
+                exchange.advance()
+                self._respond(handler(exchange, query))
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length).decode("utf-8") if length else ""
+            handler = PRIVATE_POST.get(url.path)
+            if handler is None:
+                return self._respond(_fail(10001, f"unknown endpoint {url.path}"), status=404)
+            if self._inject():
+                return
+            try:
+                body = json.loads(raw or "{}")
+            except ValueError:
+                return self._respond(_fail(10001, "invalid json body"))
+            with exchange.lock:
+                denied = exchange.verify(self.headers, raw)
+                if denied:
+                    return self._respond(denied)
+                exchange.advance()
+                self._respond(handler(exchange, body))
+
+    return Handler
+
+
+def start_server(db_path=None, port=DEFAULT_PORT, bar_seconds=1.0, latency_ms=0.0, jitter_ms=0.0,
+                 error_rate=0.0, balance=10_000.0, api_secret=None, start_bar=0):
+    """Starts the simulator on a daemon thread. Returns (server, exchange, base_url)."""
+    exchange = SimExchange(db_path or config.DB_PATH, bar_seconds=bar_seconds, balance=balance,
+                           api_secret=api_secret, start_bar=start_bar)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(exchange, latency_ms, jitter_ms, error_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="exchange-sim", daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    info(f"🏦 Exchange simulator listening on {base_url} ({', '.join(exchange.bars)})")
+    return server, exchange, base_url
+
+
+# === Offline order-throughput benchmark ===
+def bench_orders(base_url, cycles, usdt_amount=100.0, api_secret="sim"):
+    """Open + close round trips through futures_trader against the simulator."""
+    import tempfile
+    import bybit_client
+    import futures_trader
+    import risk_utils
+    import state_store
+
+    config.PORTFOLIO_PRIVATE_STREAM = False  # the simulator has no private websocket
+    bybit_client.reset_client(base_url=base_url, api_key="sim", api_secret=api_secret)
+    # Simulated equity must not reach the live peak / daily-loss state
+    workdir = tempfile.mkdtemp()
+    risk_utils.RISK_FILE = os.path.join(workdir, "risk_state.json")
+    state_store._store = state_store.SQLiteStateStore(os.path.join(workdir, "bot_state.db"))
+
+    latencies = []
+    failures = 0
+    started = time.perf_counter()
+    for _ in range(cycles):
+        t0 = time.perf_counter()
+        opened, _ = futures_trader.open_position("Buy", usdt_amount)
+        closed, _ = futures_trader.close_position()
+        latencies.append((time.perf_counter() - t0) * 1000)
+        failures += (not opened) + (not closed)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    success(
+        f"📊 {cycles} open/close cycles in {elapsed:.2f}s → {2 * cycles / elapsed:.1f} orders/s | "
+        f"cycle p50 {p(0.5):.1f} ms, p99 {p(0.99):.1f} ms | failures: {failures}"
+    )
+    return {"cycles": cycles, "orders_per_sec": 2 * cycles / elapsed, "p50_ms": p(0.5), "p99_ms": p(0.99), "failures": failures}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Bybit v5 exchange simulator")
+    parser.add_argument("--db", default=config.DB_PATH)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--bar-seconds", type=float, default=1.0, help="Wall-clock seconds per replayed bar (0 = frozen)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Injected latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with retCode 10016")
+    parser.add_argument("--balance", type=float, default=10_000.0)
+    parser.add_argument("--api-secret", default=None, help="Verify HMAC signatures with this secret")
+    parser.add_argument("--start-bar", type=int, default=0, help="Bar the replay starts at (-1 = newest, full history visible)")
+    parser.add_argument("--bench", type=int, default=0, help="Run N open/close cycles against the simulator and exit")
+    args = parser.parse_args()
+
+    server, _, base_url = start_server(
+        args.db, 0 if args.bench else args.port, args.bar_seconds, args.latency_ms,
+        args.jitter_ms, args.error_rate, args.balance, args.api_secret, args.start_bar
+    )
+    if args.bench:
+        bench_orders(base_url, args.bench, api_secret=args.api_secret or "sim")
+        server.shutdown()
+        return
+
+    info(f"🔌 Set BYBIT_BASE_URL={base_url} to route the bot here. Ctrl+C to stop.")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        warn("🛑 Exchange simulator stopped")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
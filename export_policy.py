@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import zipfile
+import argparse
+import numpy as np
+import torch
+from torch import nn
+
+import config
+from log_utils import info, success, warn, error
+
+# === Export format ===
+# TorchScript module: forward(obs, h, c, episode_start) -> (action, logits, h, c)
+# obs           float32 [batch, obs_dim]   (raw, un-normalized observation)
+# h, c          float32 [lstm_layers, batch, lstm_hidden]
+# episode_start float32 [batch]            (1.0 resets the LSTM state for that row)
+META_FILE = "meta.json"
+EXPORT_VERSION = 1
+
+
+class _ObsNormalizer(nn.Module):
+    """Same scaling as VecNormalize.normalize_obs, baked into the graph."""
+
+    def __init__(self, vec_normalize, obs_dim):
+        super().__init__()
+        if vec_normalize is not None and vec_normalize.norm_obs:
+            mean = np.asarray(vec_normalize.obs_rms.mean, dtype=np.float64)
+            std = np.sqrt(np.asarray(vec_normalize.obs_rms.var, dtype=np.float64) + vec_normalize.epsilon)
+            clip = float(vec_normalize.clip_obs)
+        else:
+            mean = np.zeros(obs_dim, dtype=np.float64)
+            std = np.ones(obs_dim, dtype=np.float64)
+            clip = float("inf")
+        self.register_buffer("mean", torch.as_tensor(mean, dtype=torch.float32))
+        self.register_buffer("inv_std", torch.as_tensor(1.0 / std, dtype=torch.float32))
+        self.clip = clip
+
+    def forward(self, obs):
+        return torch.clamp((obs - self.mean) * self.inv_std, -self.clip, self.clip)
+
+
+class _RecurrentPolicyModule(nn.Module):
+    """Actor path of sb3_contrib RecurrentActorCriticPolicy (critic LSTM is dropped)."""
+
+    def __init__(self, policy, normalizer):
+        super().__init__()
+        self.normalizer = normalizer
+        self.features_extractor = policy.pi_features_extractor
+        self.lstm = policy.lstm_actor
+        self.policy_net = policy.mlp_extractor.policy_net
+        self.action_net = policy.action_net
+
+    def forward(self, obs, h, c, episode_start):
+        features = self.features_extractor(self.normalizer(obs))
+        keep = (1.0 - episode_start).view(1, -1, 1)
+        out, (h, c) = self.lstm(features.unsqueeze(0), (keep * h, keep * c))
+        logits = self.action_net(self.policy_net(out.squeeze(0)))
+        return torch.argmax(logits, dim=1), logits, h, c
+
+
+class _MlpPolicyModule(nn.Module):
+    """Actor path of a plain sb3 ActorCriticPolicy; h/c are passed through untouched."""
+
+    def __init__(self, policy, normalizer):
+        super().__init__()
+        self.normalizer = normalizer
+        self.features_extractor = policy.pi_features_extractor
+        self.policy_net = policy.mlp_extractor.policy_net
+        self.action_net = policy.action_net
+
+    def forward(self, obs, h, c, episode_start):
+        features = self.features_extractor(self.normalizer(obs))
+        logits = self.action_net(self.policy_net(features))
+        return torch.argmax(logits, dim=1), logits, h, c
+
+
+# === Loading sb3 artifacts ===
+def is_recurrent_checkpoint(model_path):
+    """RecurrentPPO and PPO zips look the same from outside; peek at the saved policy class."""
+    with zipfile.ZipFile(model_path) as archive:
+        data = archive.read("data").decode("utf-8", errors="ignore")
+    return "RecurrentActorCriticPolicy" in data
+
+
+def load_sb3_model(model_path):
+    if is_recurrent_checkpoint(model_path):
+        from sb3_contrib import RecurrentPPO
+        return RecurrentPPO.load(model_path, device="cpu")
+    from stable_baselines3 import PPO
+    return PPO.load(model_path, device="cpu")
+
+
+def load_vec_normalize(vecnorm_path):
+    if not vecnorm_path or not os.path.exists(vecnorm_path):
+        warn(f"⚠️ VecNormalize file not found ({vecnorm_path}), exporting without obs scaling")
+        return None
+    import pickle
+    with open(vecnorm_path, "rb") as f:
+        return pickle.load(f)
+
+
+# === Export ===
+def build_module(model, vec_normalize):
+    policy = model.policy.to("cpu").eval()
+    obs_dim = int(np.prod(model.observation_space.shape))
+    normalizer = _ObsNormalizer(vec_normalize, obs_dim)
+
+    lstm = getattr(policy, "lstm_actor", None)
+    if lstm is not None:
+        module = _RecurrentPolicyModule(policy, normalizer)
+        lstm_layers, lstm_hidden = lstm.num_layers, lstm.hidden_size
+    else:
+        module = _MlpPolicyModule(policy, normalizer)
+        lstm_layers, lstm_hidden = 1, 1
+
+    meta = {
+        "version": EXPORT_VERSION,
+        "recurrent": lstm is not None,
+        "obs_dim": obs_dim,
+        "n_actions": int(model.action_space.n),
+        "lstm_layers": lstm_layers,
+        "lstm_hidden": lstm_hidden,
+    }
+    return module.eval(), meta
+
+
+def export_policy(model, vec_normalize, output_path):
+    """Traces normalization + actor into a TorchScript file that policy_runtime can load."""
+    module, meta = build_module(model, vec_normalize)
+
+    batch = 2  # trace with batch > 1 so no dimension gets baked in as a constant
+    example = (
+        torch.zeros(batch, meta["obs_dim"]),
+        torch.zeros(meta["lstm_layers"], batch, meta["lstm_hidden"]),
+        torch.zeros(meta["lstm_layers"], batch, meta["lstm_hidden"]),
+        torch.zeros(batch),
+    )
+    with torch.no_grad():
+        traced = torch.jit.trace(module, example, check_trace=False)
+    traced = torch.jit.freeze(traced.eval())
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    torch.jit.save(traced, output_path, _extra_files={META_FILE: json.dumps(meta)})
+    success(f"📦 Exported policy to {output_path} ({'LSTM' if meta['recurrent'] else 'MLP'}, obs_dim={meta['obs_dim']})")
+    return output_path
+
+
+# === Parity check against model.predict ===
+def check_parity(model, vec_normalize, export_path, steps=500, seed=0):
+    """
+    Replays the same observation stream through model.predict(deterministic=True)
+    and through the exported runtime. Returns (action_mismatches, max_logit_diff, timings).
+    """
+    from policy_runtime import PolicyRuntime
+
+    runtime = PolicyRuntime(export_path)
+    rng = np.random.default_rng(seed)
+
+    # Realistic-looking raw observations: random walk prices + positive volume + balance
+    price = 30_000 + np.cumsum(rng.normal(0, 50, steps))
+    raw_obs = np.stack([
+        price, price + np.abs(rng.normal(0, 30, steps)), price - np.abs(rng.normal(0, 30, steps)),
+        price + rng.normal(0, 10, steps), np.abs(rng.normal(100, 40, steps)), np.full(steps, 1000.0)
+    ], axis=1).astype(np.float32)[:, :runtime.obs_dim]
+
+    recurrent = runtime.recurrent
+    lstm_state = None
+    episode_start = np.ones((1,), dtype=bool)
+    mismatches = 0
+    max_logit_diff = 0.0
+    sb3_ns = 0
+    rt_ns = 0
+
+    for i in range(steps):
+        obs = raw_obs[i:i + 1]
+        norm_obs = vec_normalize.normalize_obs(obs) if vec_normalize is not None else obs
+
+        t0 = time.perf_counter_ns()
+        if recurrent:
+            expected, lstm_state = model.predict(norm_obs, state=lstm_state, episode_start=episode_start, deterministic=True)
+        else:
+            expected, _ = model.predict(norm_obs, deterministic=True)
+        sb3_ns += time.perf_counter_ns() - t0
+
+        t0 = time.perf_counter_ns()
+        action = runtime.predict(obs[0], episode_start=bool(episode_start[0]))
+        rt_ns += time.perf_counter_ns() - t0
+
+        if int(expected[0]) != action:
+            mismatches += 1
+        max_logit_diff = max(max_logit_diff, _logit_diff(model, norm_obs, runtime))
+        episode_start[0] = False
+
+    timings = {"sb3_us": sb3_ns / steps / 1000, "runtime_us": rt_ns / steps / 1000}
+    return mismatches, max_logit_diff, timings
+
+
+def _logit_diff(model, norm_obs, runtime):
+    if runtime.recurrent:
+        return 0.0  # sb3 does not expose recurrent logits without re-running the LSTM
+    with torch.no_grad():
+        obs_t, _ = model.policy.obs_to_tensor(norm_obs)
+        expected = model.policy.get_distribution(obs_t).distribution.logits.numpy()
+    return float(np.abs(expected - runtime.last_logits).max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export PPO/RecurrentPPO + VecNormalize to a TorchScript policy")
+    parser.add_argument("--model", default=config.MODEL_PATH)
+    parser.add_argument("--vecnorm", default=config.MODEL_PATH.replace(".zip", ".pkl"))
+    parser.add_argument("--output", default=config.POLICY_EXPORT_PATH)
+    parser.add_argument("--check", action="store_true", help="Compare exported runtime against model.predict")
+    parser.add_argument("--steps", type=int, default=500)
+    args = parser.parse_args()
+
+    info(f"📦 Loading {args.model} + {args.vecnorm}...")
+    model = load_sb3_model(args.model)
+    vec_normalize = load_vec_normalize(args.vecnorm)
+    export_policy(model, vec_normalize, args.output)
+
+    if args.check:
+        mismatches, logit_diff, timings = check_parity(model, vec_normalize, args.output, steps=args.steps)
+        info(f"⏱️ model.predict: {timings['sb3_us']:.1f} µs/step | runtime: {timings['runtime_us']:.1f} µs/step")
+        if mismatches:
+            error(f"❌ Parity check failed: {mismatches}/{args.steps} actions differ (max logit diff {logit_diff:.2e})")
+            sys.exit(1)
+        success(f"✅ Parity check passed over {args.steps} steps (max logit diff {logit_diff:.2e})")
+
+
+if __name__ == "__main__":
+    main()
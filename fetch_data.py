@@ -1,11 +1,15 @@
 import requests
 import sqlite3
 import time
-import pandas as pd
 import os
 from datetime import datetime
 import config
+from urllib.parse import urlparse
+from rate_limit import request_with_limits
 from log_utils import info, warn, error
+from job_runner import report_progress
+import metrics
+from status_summary import init_summary, record_ingest
 
 DB_PATH = config.DB_PATH
 TABLE_NAME = "ohlcv"
@@ -13,6 +17,10 @@ SYMBOL = config.SYMBOL
 INTERVAL = config.INTERVAL  # у секундах, 60 = 1m
 LIMIT = config.LIMIT
 
+OHLCV_ROWS = metrics.counter("ohlcv_rows_ingested_total", "OHLCV rows written to the DB")
+OHLCV_PAGES = metrics.counter("ohlcv_pages_fetched_total", "Kline pages fetched from Bybit")
+OHLCV_LAST_TS = metrics.gauge("ohlcv_last_timestamp_ms", "Newest ingested bar (ms since epoch)")
+
 def fetch_ohlcv_data(start_ts=None):
     url = config.BYBIT_OHLCV_ENDPOINT
     params = {
@@ -24,8 +32,8 @@ def fetch_ohlcv_data(start_ts=None):
     if start_ts:
         params["start"] = int(start_ts)
 
-    response = requests.get(url, params=params)
-    data = response.json()
+    # Paced by the shared market-data token bucket instead of a fixed sleep between pages
+    data = request_with_limits(urlparse(url).path, lambda: requests.get(url, params=params))
 
     if data.get("retCode") != 0:
         warn(f"⚠️ API returned error: {data}")
@@ -33,8 +41,8 @@ def fetch_ohlcv_data(start_ts=None):
 
     return data["result"].get("list", [])
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
+def init_db(db_path=None):
+    conn = sqlite3.connect(db_path or DB_PATH)
     cursor = conn.cursor()
     cursor.execute(f'''
         CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
@@ -48,7 +56,10 @@ def init_db():
             volume REAL
         )
     ''')
+    # Range scans for data_access.iter_chunks (same index as data_access.ensure_index)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_ohlcv_symbol_timestamp ON {TABLE_NAME} (symbol, timestamp)")
     conn.commit()
+    init_summary(conn)
     return conn
 
 def get_latest_timestamp(conn):
@@ -62,10 +73,12 @@ def main():
     conn = init_db()
     inserted_total = 0
     prev_latest_ts = get_latest_timestamp(conn)
+    first_ts = prev_latest_ts
 
     while True:
         start_ts = prev_latest_ts + 60_000 if prev_latest_ts else None
         ohlcv = fetch_ohlcv_data(start_ts)
+        OHLCV_PAGES.inc()
 
         if not ohlcv:
             info("⛔ No more new data available. Exiting.")
@@ -91,21 +104,30 @@ def main():
             except (ValueError, IndexError) as e:
                 warn(f"⚠️ Skipped invalid row: {item} | Error: {e}")
 
-        df = pd.DataFrame(rows, columns=[
-            "symbol", "timestamp", "open", "high", "low", "close", "volume"
-        ])
-        df.drop_duplicates(subset=["timestamp"], inplace=True)
+        unique = {}
+        for row in rows:
+            unique.setdefault(row[1], row)  # first row per timestamp wins
+        rows = list(unique.values())
 
-        if df.empty or df["timestamp"].max() == prev_latest_ts:
+        if not rows or max(unique) == prev_latest_ts:
             info("✅ All data is up to date.")
             break
 
-        df.to_sql(TABLE_NAME, conn, if_exists="append", index=False)
-        inserted_total += len(df)
-        prev_latest_ts = df["timestamp"].max()
+        prev_latest_ts = max(unique)
+        with conn:  # rows and the /status summary commit together
+            conn.executemany(
+                f"INSERT INTO {TABLE_NAME} (symbol, timestamp, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            record_ingest(conn, len(rows), prev_latest_ts)
+        inserted_total += len(rows)
+        OHLCV_ROWS.inc(len(rows))
+        OHLCV_LAST_TS.set(prev_latest_ts)
         last_ts = datetime.fromtimestamp(prev_latest_ts / 1000).strftime("%Y-%m-%d %H:%M:%S")
-        info(f"📥 Fetched {len(df)} rows. Total: {inserted_total} | Last timestamp: {last_ts}")
-        time.sleep(0.5)
+        info(f"📥 Fetched {len(rows)} rows. Total: {inserted_total} | Last timestamp: {last_ts}")
+        first_ts = first_ts or min(unique)
+        covered = (prev_latest_ts - first_ts) / max(1, time.time() * 1000 - first_ts)
+        report_progress(min(1.0, covered), f"{inserted_total} rows, up to {last_ts}")
 
     conn.close()
     info("💾 Saved to ohlcv_data.db ✅")
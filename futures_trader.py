@@ -1,70 +1,122 @@
-import random
-from bybit_client import get_usdt_balance, get_market_price, get_position_info, set_leverage, place_order, set_tp_sl
+import asyncio
+import time
+import threading
+from bybit_client import get_usdt_balance, set_leverage, place_order
+from market_data import get_market_price
+from portfolio_engine import get_engine, calculate_tp_sl
 from log_utils import info, success, warn, error
-from risk_utils import check_drawdown
+from risk_engine import get_risk_engine
+from risk_analytics import get_risk_analytics
+import tracing
 import config
 
 SYMBOL = config.SYMBOL
+ENTRY_PRICE_MAX_STALENESS = 1.0  # seconds; sizing and TP/SL use this price
 CATEGORY = "linear"
 ACCOUNT_TYPE = "UNIFIED"
 MARGIN_MODE = "REGULAR"
 
 def get_current_position():
-    info("🔎 Fetching current position info...")
-    position_info = get_position_info(SYMBOL)
+    position_info = get_engine().book.get(SYMBOL)
     size = float(position_info.get("size", 0))
     side = position_info.get("side", "")
     return size, side, position_info
 
-def calculate_tp_sl(entry_price, direction):
-    if direction == "Buy":
-        stop_loss_price = entry_price * (1 - config.STOP_LOSS_PERCENT / 100)
-        take_profit_price = entry_price * (1 + config.TAKE_PROFIT_PERCENT / 100)
-    else:
-        stop_loss_price = entry_price * (1 + config.STOP_LOSS_PERCENT / 100)
-        take_profit_price = entry_price * (1 - config.TAKE_PROFIT_PERCENT / 100)
-    return round(take_profit_price, 2), round(stop_loss_price, 2)
-
 def open_long_position(usdt_amount):
     return open_position("Buy", usdt_amount)
 
 def open_short_position(usdt_amount):
     return open_position("Sell", usdt_amount)
 
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    """Event loop on its own thread, for sync callers that already run a loop on theirs."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="trader-loop", daemon=True).start()
+    return _loop
+
+
 def open_position(direction, usdt_amount):
+    """Sync entry point; coroutines should await open_position_async instead."""
     try:
-        current_balance = get_usdt_balance()
-        ok, drawdown = check_drawdown(current_balance)
-        if not ok:
-            return False, f"🚫 Trading halted due to drawdown: {drawdown:.2f}%"
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(open_position_async(direction, usdt_amount))
+    # asyncio.run() refuses to nest, and blocking on this thread's own loop would deadlock
+    future = asyncio.run_coroutine_threadsafe(open_position_async(direction, usdt_amount), _background_loop())
+    return future.result()
+
+async def open_position_async(direction, usdt_amount, decision_ns=None):
+    with tracing.trace("open_position"):
+        return await _open_position(direction, usdt_amount, decision_ns)
+
+async def _open_position(direction, usdt_amount, decision_ns=None):
+    """
+    Opens a protected position in as few sequential round trips as possible:
+    balance, position and price are read concurrently, set_leverage is skipped when
+    the position already uses the target leverage, and TP/SL ride on the create-order request.
+    decision_ns — time.perf_counter_ns() of the trading decision (defaults to now).
+    """
+    decision_ns = decision_ns or time.perf_counter_ns()
+    try:
+        pretrade_start = time.perf_counter_ns()
+        current_balance, position_info, price = await asyncio.gather(
+            asyncio.to_thread(get_usdt_balance),
+            asyncio.to_thread(get_engine().book.get, SYMBOL),
+            asyncio.to_thread(get_market_price, SYMBOL, ENTRY_PRICE_MAX_STALENESS),
+        )
+        tracing.record("pretrade_reads", time.perf_counter_ns() - pretrade_start, pretrade_start)
 
-        size, _, _ = get_current_position()
+        if current_balance is None:
+            error("❌ Failed to fetch balance")
+            return False, "⚠️ Balance fetch error!"
+
+        risk = get_risk_engine()
+        risk.on_equity(current_balance)
+
+        size = float(position_info.get("size", 0) or 0)
         if size > 0:
             warn("❗ Attempt to open a position while one is already open")
             return False, "⚠️ Position already open!"
 
-        leverage = random.randint(1, 10)
-        info(f"🎚️ Setting leverage: {leverage}x")
-        leverage_set, leverage_msg = set_leverage(SYMBOL, leverage)
-        if not leverage_set:
-            error(f"❌ Leverage setting failed: {leverage_msg}")
-            return False, f"⚠️ Leverage setting failed: {leverage_msg}"
-
-        price = get_market_price(SYMBOL)
         if not price:
             error("❌ Failed to fetch market price")
             return False, "⚠️ Market price fetch error!"
 
         fee_cost = (usdt_amount * config.TRADING_FEE_PERCENT / 100)
         usdt_amount_after_fee = usdt_amount - fee_cost
+        leverage = get_risk_analytics().target_leverage(SYMBOL, risk.equity, usdt_amount_after_fee)  # cached stats, no I/O
         qty = round((usdt_amount_after_fee * leverage) / price, 3)
 
-        info(f"💸 Fee deducted: {fee_cost:.4f} USDT | Final amount: {usdt_amount_after_fee:.4f}")
-        info(f"📦 Calculated qty: {qty} for direction {direction}")
+        info("💸 Fee deducted: %.4f USDT | Final amount: %.4f", fee_cost, usdt_amount_after_fee)
+        info("📦 Calculated qty: %s for direction %s", qty, direction, symbol=SYMBOL, leverage=leverage)
         if qty <= 0:
             warn("❗ Calculated qty is zero or negative")
             return False, "⚠️ Calculated qty is zero!"
 
+        ok, reason = risk.check_order(SYMBOL, direction, usdt_amount_after_fee * leverage, leverage)
+        if not ok:
+            warn(reason)
+            return False, reason
+
+        # Only an order that passed the risk checks may change the account's leverage
+        current_leverage = float(position_info.get("leverage", 0) or 0)
+        if current_leverage == leverage:
+            info(f"🎚️ Leverage already {leverage}x, skipping set_leverage")
+        else:
+            info(f"🎚️ Setting leverage: {leverage}x")
+            leverage_set, leverage_msg = await asyncio.to_thread(set_leverage, SYMBOL, leverage)
+            if not leverage_set:
+                error(f"❌ Leverage setting failed: {leverage_msg}")
+                return False, f"⚠️ Leverage setting failed: {leverage_msg}"
+
+        tp, sl = calculate_tp_sl(price, direction)
         order_data = {
             "category": CATEGORY,
             "symbol": SYMBOL,
@@ -74,40 +126,47 @@ def open_position(direction, usdt_amount):
             "timeInForce": "GoodTillCancel",
             "accountType": ACCOUNT_TYPE,
             "marginMode": MARGIN_MODE,
-            "reduceOnly": False
+            "reduceOnly": False,
+            "takeProfit": str(tp),
+            "stopLoss": str(sl),
+            "tpslMode": "Full"
         }
 
-        info(f"📤 Placing {'LONG' if direction == 'Buy' else 'SHORT'} order...")
-        placed, order_response = place_order(order_data)
+        info(f"📤 Placing {'LONG' if direction == 'Buy' else 'SHORT'} order with TP/SL attached...")
+        with tracing.span("tpsl_confirm"):
+            placed, order_response = await asyncio.to_thread(place_order, order_data)
+        latency_ns = time.perf_counter_ns() - decision_ns
+        latency_ms = latency_ns / 1e6
         if placed:
-            success("✅ Order placed successfully")
-            position = get_position_info(SYMBOL)
-            entry_price = float(position.get('avgPrice', price))
-            liq_price = position.get('liqPrice', 'N/A')
-            leverage_used = position.get('leverage', leverage)
-
-            tp, sl = calculate_tp_sl(entry_price, direction)
-            set_tp_sl(direction, tp, sl)
+            tracing.record("decision_to_protected", latency_ns, decision_ns)
+        get_engine().book.mark_traded([SYMBOL])
 
+        if placed:
+            success(f"✅ Protected order placed in {latency_ms:.1f} ms from decision")
+            # Off the timed path: the order is already protected
+            position = await asyncio.to_thread(get_engine().book.get, SYMBOL)
+            liq_price = position.get("liqPrice") or "N/A"
             msg = (
                 f"{'🟢 LONG' if direction == 'Buy' else '🔴 SHORT'} position opened\n"
                 f"💰 Qty: {qty}\n"
-                f"🎯 Entry price: {entry_price}\n"
+                f"🎯 Entry price (est.): {price}\n"
                 f"🚨 Liq price: {liq_price}\n"
-                f"📈 Leverage: {leverage_used}x\n"
+                f"📈 Leverage: {leverage}x\n"
                 f"🎯 TP: {tp}\n"
                 f"🛑 SL: {sl}"
             )
             msg += f"\n💸 Fee (entry): {fee_cost:.4f} USDT"
+            msg += f"\n⏱️ Decision → protected: {latency_ms:.1f} ms"
             return True, msg
         else:
-            error(f"❌ Order placement failed: {order_response}")
+            error(f"❌ Order placement failed after {latency_ms:.1f} ms: {order_response}")
             return False, f"⚠️ Order placement failed: {order_response}"
 
     except Exception as e:
         error(f"❌ Exception while opening position: {e}")
         return False, f"⚠️ Exception: {str(e)}"
 
+@tracing.traced("close_position.total")
 def close_position():
     size, side, position_info = get_current_position()
     if size == 0 or side == "":
@@ -130,6 +189,7 @@ def close_position():
 
     info(f"🔒 Closing position ({side} → {opposite_side}), Qty: {size}")
     closed, order_response = place_order(order_data)
+    get_engine().book.mark_traded([SYMBOL])
 
     if closed:
         success("✅ Position closed successfully")
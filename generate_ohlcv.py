@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import queue
+import argparse
+import itertools
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+import config
+from fetch_data import init_db, TABLE_NAME
+from status_summary import record_ingest
+from log_utils import info, success, warn
+
+# === Synthetic OHLCV at production scale ===
+# Writes statistically plausible bars for many symbols straight into the ohlcv table, so
+# env loading, backtests and training can be profiled on 10-100M rows:
+#   - log returns: Gaussian shocks, optionally Merton jumps (--model jump), with a slow pull
+#     back to the symbol's starting level so decades of bars keep plausible prices
+#   - volatility regimes: calm / normal / turbulent, switching after geometric durations
+#   - high/low: intrabar excursions scaled by the bar's volatility, always bracketing open/close
+#   - volume: per-symbol notional base x UTC hour-of-day seasonality x regime x |return|, lognormal noise
+# Bars are generated vectorized in chunks on a background thread while the main thread
+# bulk-inserts the previous chunk, so memory stays at ~2 chunks whatever the row count.
+# The project has no columnar cache yet, so only the SQLite table is written.
+#
+#   python generate_ohlcv.py --db synthetic.db --symbols 20 --bars 1000000
+#   python generate_ohlcv.py --db synthetic.db --symbols BTCUSDT ETHUSDT --bars 500000 --model jump
+
+DEFAULT_DB = "synthetic_ohlcv.db"
+DEFAULT_START = "2020-01-01"
+CHUNK_ROWS = 1_000_000
+MINUTES_PER_YEAR = 365 * 24 * 60
+
+# name, volatility multiplier, mean duration in bars
+REGIMES = (("calm", 0.6, 2000), ("normal", 1.0, 3000), ("turbulent", 2.5, 500))
+JUMPS_PER_YEAR = 12.0
+JUMP_MEAN, JUMP_STD = -0.01, 0.04   # log jump size
+REVERSION_HALF_LIFE_YEARS = 2.0     # of log-price deviations from the starting level
+REVERSION_BLOCK = 1024              # bars per mean-reversion step
+
+
+class SymbolPath:
+    """Continues one symbol's price path chunk by chunk (last close and regime carry over)."""
+
+    def __init__(self, symbol, rng, interval, start_ms, model="gbm"):
+        self.symbol = symbol
+        self.rng = rng
+        self.interval = interval
+        self.step_ms = interval * 60_000
+        self.next_ts = start_ms
+        self.model = model
+        self.last_close = float(np.exp(rng.uniform(np.log(0.05), np.log(60_000))))
+        self.anchor = np.log(self.last_close)
+        annual_vol = rng.uniform(0.4, 1.2)
+        self.sigma = annual_vol * np.sqrt(interval / MINUTES_PER_YEAR)
+        half_life_bars = REVERSION_HALF_LIFE_YEARS * MINUTES_PER_YEAR / interval
+        self.reversion = 1 - np.exp(-np.log(2) * REVERSION_BLOCK / half_life_bars)
+        self.base_notional = float(np.exp(rng.uniform(np.log(2e4), np.log(5e6)))) * interval / 60
+        self.regime = 1
+        self.remaining = int(rng.geometric(1 / REGIMES[1][2]))
+
+    def _regime_multipliers(self, n):
+        out = np.empty(n)
+        filled = 0
+        while filled < n:
+            take = min(self.remaining, n - filled)
+            out[filled:filled + take] = REGIMES[self.regime][1]
+            filled += take
+            self.remaining -= take
+            if self.remaining == 0:
+                self.regime = int(self.rng.choice([i for i in range(len(REGIMES)) if i != self.regime]))
+                self.remaining = int(self.rng.geometric(1 / REGIMES[self.regime][2]))
+        return out
+
+    def chunk(self, n):
+        """Columns (timestamp, open, high, low, close, volume) for the next n bars."""
+        rng = self.rng
+        timestamps = self.next_ts + self.step_ms * np.arange(n, dtype=np.int64)
+        self.next_ts = int(timestamps[-1]) + self.step_ms
+
+        sigma = self.sigma * self._regime_multipliers(n)
+        returns = sigma * rng.standard_normal(n)
+        if self.model == "jump":
+            jumps = rng.poisson(JUMPS_PER_YEAR * self.interval / MINUTES_PER_YEAR, n)
+            hit = jumps > 0
+            returns[hit] += rng.normal(jumps[hit] * JUMP_MEAN, np.sqrt(jumps[hit]) * JUMP_STD)
+        log_price = np.log(self.last_close)
+        for start in range(0, n, REVERSION_BLOCK):
+            block = returns[start:start + REVERSION_BLOCK]
+            block -= (log_price - self.anchor) * self.reversion / len(block)
+            log_price += block.sum()
+
+        closes = self.last_close * np.exp(np.cumsum(returns))
+        opens = np.empty(n)
+        opens[0] = self.last_close
+        opens[1:] = closes[:-1]
+        self.last_close = float(closes[-1])
+
+        highs = np.maximum(opens, closes) * np.exp(sigma * np.abs(rng.standard_normal(n)) * 0.5)
+        lows = np.minimum(opens, closes) * np.exp(-sigma * np.abs(rng.standard_normal(n)) * 0.5)
+
+        hour = (timestamps // 3_600_000) % 24
+        seasonality = 1.0 + 0.5 * np.cos(2 * np.pi * (hour - 14) / 24)  # busiest around the US open
+        activity = 1.0 + 2.0 * np.abs(returns) / sigma
+        noise = rng.lognormal(0.0, 0.5, n)
+        volumes = self.base_notional / closes * seasonality * sigma / self.sigma * activity * noise / 3.0
+        return timestamps, opens, highs, lows, closes, volumes
+
+
+def _symbol_names(spec):
+    if len(spec) == 1 and spec[0].isdigit():
+        count = int(spec[0])
+        return [config.SYMBOL] + [f"SYN{i:03d}USDT" for i in range(1, count)]
+    return spec
+
+
+def generate(db_path, symbols, bars, interval=None, start=DEFAULT_START, model="gbm", seed=0, chunk_rows=CHUNK_ROWS):
+    """Appends `bars` bars per symbol to db_path's ohlcv table. Returns rows written."""
+    interval = int(interval or config.INTERVAL)
+    start_ms = int(datetime.strptime(start, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+    seeds = np.random.SeedSequence(seed).spawn(len(symbols))
+    chunks = queue.Queue(maxsize=2)
+
+    def produce():
+        try:
+            for symbol, symbol_seed in zip(symbols, seeds):
+                path = SymbolPath(symbol, np.random.default_rng(symbol_seed), interval, start_ms, model)
+                for offset in range(0, bars, chunk_rows):
+                    chunks.put((symbol, path.chunk(min(chunk_rows, bars - offset))))
+        finally:
+            chunks.put(None)
+
+    conn = init_db(db_path)
+    conn.execute("PRAGMA synchronous=OFF")         # a crash mid-run only loses synthetic data
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")      # 256 MB page cache for the bulk load
+    threading.Thread(target=produce, name="ohlcv-generator", daemon=True).start()
+
+    written = 0
+    started = time.perf_counter()
+    insert = f"INSERT INTO {TABLE_NAME} (symbol, timestamp, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)"
+    try:
+        while True:
+            item = chunks.get()
+            if item is None:
+                break
+            symbol, (timestamps, opens, highs, lows, closes, volumes) = item
+            with conn:
+                conn.executemany(insert, zip(
+                    itertools.repeat(symbol), timestamps.tolist(), opens.tolist(), highs.tolist(),
+                    lows.tolist(), closes.tolist(), volumes.tolist(),
+                ))
+                record_ingest(conn, len(timestamps), int(timestamps[-1]))
+            written += len(timestamps)
+            elapsed = time.perf_counter() - started
+            info(f"🧪 {written:,} rows ({symbol}) · {written / elapsed:,.0f} rows/s")
+    finally:
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    if written < bars * len(symbols):
+        warn(f"⚠️ Generator stopped early: {written:,} of {bars * len(symbols):,} rows")
+    size_mb = os.path.getsize(db_path) / 1e6
+    success(f"✅ {written:,} rows for {len(symbols)} symbol(s) in {elapsed:.1f}s "
+            f"({written / max(elapsed, 1e-9):,.0f} rows/s) → {db_path} ({size_mb:,.0f} MB)")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic OHLCV generator for scale testing")
+    parser.add_argument("--db", default=DEFAULT_DB, help="target SQLite file (rows are appended)")
+    parser.add_argument("--symbols", nargs="+", default=["1"], help="symbol names, or a count (first one is config.SYMBOL)")
+    parser.add_argument("--bars", type=int, default=100_000, help="bars per symbol")
+    parser.add_argument("--interval", type=int, default=config.INTERVAL, help="bar size in minutes")
+    parser.add_argument("--start", default=DEFAULT_START, help="first bar, YYYY-MM-DD (UTC)")
+    parser.add_argument("--model", choices=["gbm", "jump"], default="gbm")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    if os.path.abspath(args.db) == os.path.abspath(config.DB_PATH):
+        warn(f"⚠️ Writing synthetic bars into the configured DB_PATH ({config.DB_PATH})")
+    generate(args.db, _symbol_names(args.symbols), args.bars, args.interval, args.start,
+             args.model, args.seed, args.chunk_rows)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+import os
+import sys
+import time
+import runpy
+import itertools
+import threading
+import traceback
+import multiprocessing as mp
+
+import config
+import metrics
+from state_store import get_state_store
+from log_utils import info, success, warn, error, flush as log_flush
+
+# === Warm worker job runner ===
+# Scripts run inside pre-started worker processes that already imported torch, sb3,
+# pandas and matplotlib, so a job starts in milliseconds instead of paying the imports.
+# Every worker runs exactly one job and then exits (scripts keep module-level state and
+# may crash), and a replacement is warmed up in the background right away.
+# Jobs with the same script + args are deduplicated while queued or running — across
+# processes too: the dedup lock, job ids and job records live in the shared state store,
+# so /jobs and /status show every webhook process's jobs.
+
+PRELOAD_MODULES = [
+    "numpy", "pandas", "matplotlib", "matplotlib.pyplot", "torch",
+    "gymnasium", "stable_baselines3", "sb3_contrib", "crypto_trading_env",
+]
+
+# job name -> (script, max concurrent jobs of that type)
+JOB_TYPES = {
+    "simulate": ("run_simulation.py", 1),
+    "trainmodel": ("train_ppo.py", 1),
+    "papertrade": ("paper_trader.py", 1),
+    "updatedata": ("fetch_data.py", 1),
+}
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+JOBS_NS, LOCKS_NS, CANCEL_NS = "jobs", "job_locks", "job_cancel"
+JOB_HEARTBEAT = 30          # seconds between lock / record refreshes of this process's jobs
+JOB_LOCK_TTL = 120          # a crashed owner's locks and active records expire after this
+FINISHED_JOB_TTL = 86400    # finished jobs stay visible in /jobs for a day
+PUBLISH_MIN_SECONDS = 1.0   # progress updates are written to the store at most this often
+
+JOBS_FINISHED = metrics.counter("jobs_finished_total", "Jobs by final state", ["name", "outcome"])
+JOB_SECONDS = metrics.histogram("job_duration_seconds", "Job run time from start to exit", ["name"])
+JOB_START_SECONDS = metrics.histogram("job_start_seconds", "Queue-to-running delay incl. waiting for a warm worker", ["name"])
+
+_progress_conn = None  # set inside a worker process while a job runs
+
+
+def report_progress(fraction, message=""):
+    """Called by scripts: forwards progress (0..1) to the parent when running as a job, no-op otherwise."""
+    if _progress_conn is not None:
+        try:
+            _progress_conn.send(("progress", float(fraction), message))
+        except (OSError, ValueError):
+            pass
+
+
+def _flush_outputs():
+    # Worker processes end via os._exit, which skips the risk, Telegram and log atexit flushes
+    risk_engine = sys.modules.get("risk_engine")
+    if risk_engine is not None:
+        risk_engine.flush()
+    telegram_api = sys.modules.get("telegram_api")
+    if telegram_api is not None:
+        telegram_api.flush(timeout=30)
+    log_flush()
+
+
+def _worker_main(conn, cwd):
+    global _progress_conn
+    os.chdir(cwd)
+    for module in PRELOAD_MODULES:
+        try:
+            __import__(module)
+        except Exception:
+            pass  # a missing optional library only costs the job its warm start
+    conn.send(("ready",))
+
+    try:
+        script, args = conn.recv()
+    except EOFError:
+        return
+    _progress_conn = conn
+    sys.argv = [script] + list(args)
+    try:
+        runpy.run_path(script, run_name="__main__")
+        outcome = ("done", None)
+    except SystemExit as e:
+        outcome = ("done", None) if not e.code else ("failed", f"exit code {e.code}")
+    except BaseException:
+        outcome = ("failed", traceback.format_exc(limit=5))
+    _flush_outputs()
+    conn.send(("metrics", metrics.snapshot()))  # the script's counters end up in the parent's /metrics
+    conn.send(outcome)
+
+
+class _WarmWorker:
+    __slots__ = ("process", "conn", "ready")
+
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, os.getcwd()), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self, timeout=None):
+        if not self.ready and self.conn.poll(timeout):
+            self.ready = self.conn.recv()[0] == "ready"
+        return self.ready
+
+
+class Job:
+    __slots__ = ("id", "name", "script", "args", "state", "progress", "message", "created",
+                 "started", "finished", "on_start", "on_finish", "worker", "published")
+
+    def __init__(self, job_id, name, script, args, on_start, on_finish):
+        self.id = job_id
+        self.name = name
+        self.script = script
+        self.args = tuple(args or ())
+        self.state = QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.on_start = on_start
+        self.on_finish = on_finish
+        self.worker = None
+        self.published = 0.0
+
+    @property
+    def key(self):
+        return (self.script, self.args)
+
+    @property
+    def lock_key(self):
+        return " ".join((self.script,) + self.args)
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+    def record(self):
+        return {
+            "id": self.id, "name": self.name, "script": self.script, "args": list(self.args),
+            "state": self.state, "progress": self.progress, "message": self.message,
+            "created": self.created, "started": self.started, "finished": self.finished,
+            "owner": os.getpid(),
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls(record["id"], record["name"], record["script"], record["args"], None, None)
+        for field in ("state", "progress", "message", "created", "started", "finished"):
+            setattr(job, field, record[field])
+        return job
+
+    def describe(self):
+        icons = {QUEUED: "⏳", RUNNING: "⚙️", DONE: "✅", FAILED: "❌", CANCELLED: "🛑"}
+        line = f"{icons[self.state]} #{self.id} {self.name} — {self.state}"
+        if self.state == RUNNING:
+            line += f" {self.progress * 100:.0f}% ({time.time() - self.started:.0f}s)"
+        elif self.finished and self.started:
+            line += f" in {self.finished - self.started:.0f}s"
+        if self.message:
+            line += f"\n    {self.message}"
+        return line
+
+
+class JobRunner:
+    def __init__(self, max_workers=None, warm_workers=None):
+        self.max_workers = max_workers or config.JOB_WORKERS
+        self.warm_target = config.JOB_WARM_WORKERS if warm_workers is None else warm_workers
+        self._ctx = mp.get_context("spawn")
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._store = get_state_store()
+        self._queue = []
+        self._running = {}
+        self._warm = []
+        for _ in range(self.warm_target):
+            self._warm.append(_WarmWorker(self._ctx))
+        metrics.gauge("jobs_running", "Jobs running in this process").set_function(lambda: len(self._running))
+        metrics.gauge("jobs_queued", "Jobs waiting in this process").set_function(lambda: len(self._queue))
+        threading.Thread(target=self._schedule_loop, name="job-scheduler", daemon=True).start()
+
+    # === Submission ===
+    def submit(self, name, script=None, args=None, on_start=None, on_finish=None):
+        """Queues a job; returns (job, created). An identical queued/running job is returned instead of a new one."""
+        if script is None:
+            script = JOB_TYPES[name][0]
+        with self._lock:
+            candidate_key = (script, tuple(args or ()))
+            for job in itertools.chain(self._running.values(), self._queue):
+                if job.key == candidate_key:
+                    info(f"🔁 Job {name} already {job.state} as #{job.id}")
+                    return job, False
+
+            job = Job(self._store.incr("counters", "job_id"), name, script, args, on_start, on_finish)
+            if not self._store.add(LOCKS_NS, job.lock_key, job.id, ttl=JOB_LOCK_TTL):
+                other = self._store.get(JOBS_NS, self._store.get(LOCKS_NS, job.lock_key))
+                if other is not None:
+                    info(f"🔁 Job {name} already {other['state']} as #{other['id']} in process {other['owner']}")
+                    return Job.from_record(other), False
+                self._store.set(LOCKS_NS, job.lock_key, job.id, ttl=JOB_LOCK_TTL)  # holder vanished
+
+            self._queue.append(job)
+            self._publish(job)
+            self._wakeup.notify()
+        info(f"📥 Job #{job.id} queued: {name}")
+        return job, True
+
+    def _publish(self, job, force=True):
+        now = time.monotonic()
+        if not force and now - job.published < PUBLISH_MIN_SECONDS:
+            return
+        job.published = now
+        self._store.set(JOBS_NS, job.id, job.record(), ttl=JOB_LOCK_TTL if job.active else FINISHED_JOB_TTL)
+
+    def cancel(self, job_id):
+        with self._lock:
+            for job in self._queue:
+                if job.id == job_id:
+                    self._queue.remove(job)
+                    self._finish(job, CANCELLED)
+                    return True
+            job = self._running.get(job_id)
+            if job is not None:
+                job.state = CANCELLED  # the monitor thread sees the dead pipe and keeps this state
+                worker = job.worker    # None while a cold worker is still starting: _run_job stops it
+        if job is None:
+            record = self._store.get(JOBS_NS, job_id)
+            if record is None or record["state"] not in (QUEUED, RUNNING):
+                return False
+            self._store.set(CANCEL_NS, job_id, True, ttl=JOB_LOCK_TTL)  # the owner acts on its next heartbeat
+            return True
+        if worker is not None:
+            worker.process.terminate()
+        return True
+
+    # === Scheduling ===
+    def _limit(self, name):
+        return JOB_TYPES.get(name, (None, 1))[1]
+
+    def _next_runnable(self):
+        if len(self._running) >= self.max_workers:
+            return None
+        running_by_name = {}
+        for job in self._running.values():
+            running_by_name[job.name] = running_by_name.get(job.name, 0) + 1
+        for job in self._queue:
+            if running_by_name.get(job.name, 0) < self._limit(job.name):
+                return job
+        return None
+
+    def _schedule_loop(self):
+        last_heartbeat = time.monotonic()
+        while True:
+            with self._lock:
+                job = self._wakeup.wait_for(self._next_runnable, timeout=JOB_HEARTBEAT)
+                if job is not None:
+                    self._queue.remove(job)
+                    job.state = RUNNING
+                    job.started = time.time()
+                    self._running[job.id] = job
+                    job.worker = self._warm.pop(0) if self._warm else None
+            if job is not None:
+                self._publish(job)
+                if job.worker is None:
+                    worker = _WarmWorker(self._ctx)  # cold start, outside the lock
+                    with self._lock:
+                        job.worker = worker
+                self._refill_warm()
+                threading.Thread(target=self._run_job, args=(job,), name=f"job-{job.id}", daemon=True).start()
+            if time.monotonic() - last_heartbeat >= JOB_HEARTBEAT:
+                self._heartbeat()
+                last_heartbeat = time.monotonic()
+
+    def _heartbeat(self):
+        """Keeps this process's locks and records alive and applies cancels requested by other processes."""
+        with self._lock:
+            jobs = list(self._running.values()) + list(self._queue)
+        for job in jobs:
+            if self._store.get(CANCEL_NS, job.id):
+                self._store.delete(CANCEL_NS, job.id)
+                self.cancel(job.id)
+                continue
+            self._store.set(LOCKS_NS, job.lock_key, job.id, ttl=JOB_LOCK_TTL)
+            self._publish(job)
+
+    def _refill_warm(self):
+        with self._lock:
+            missing = self.warm_target - len(self._warm)
+        for _ in range(missing):
+            worker = _WarmWorker(self._ctx)
+            with self._lock:
+                self._warm.append(worker)
+
+    def _run_job(self, job):
+        conn = job.worker.conn
+        outcome, detail = FAILED, "worker exited"
+        try:
+            if job.state == CANCELLED:  # cancelled before its worker was attached
+                job.worker.process.terminate()
+                raise EOFError
+            if not job.worker.wait_ready(timeout=300):
+                raise EOFError
+            info(f"⚙️ Job #{job.id} started: {job.script} {' '.join(job.args)}")
+            if job.on_start:
+                job.on_start()
+            conn.send((job.script, job.args))
+            JOB_START_SECONDS.labels(job.name).observe(time.time() - job.created)
+            while True:
+                message = conn.recv()
+                if message[0] == "progress":
+                    job.progress, job.message = message[1], message[2] or job.message
+                    self._publish(job, force=False)
+                elif message[0] == "metrics":
+                    metrics.merge(message[1])
+                else:
+                    outcome, detail = message[0], message[1]
+                    break
+        except (EOFError, OSError):
+            pass
+        except Exception as e:
+            detail = str(e)
+        finally:
+            job.worker.process.join(timeout=5)
+            conn.close()
+
+        if job.state == CANCELLED:
+            outcome, detail = CANCELLED, None
+        with self._lock:
+            self._running.pop(job.id, None)
+            self._finish(job, outcome, detail)
+            self._wakeup.notify()
+
+        JOBS_FINISHED.labels(job.name, outcome).inc()
+        JOB_SECONDS.labels(job.name).observe(job.finished - job.started)
+        if outcome == DONE:
+            success(f"✅ Job #{job.id} {job.name} finished in {job.finished - job.started:.1f}s")
+        elif outcome == FAILED:
+            error(f"❌ Job #{job.id} {job.name} failed: {detail}")
+        else:
+            warn(f"🛑 Job #{job.id} {job.name} cancelled")
+        if job.on_finish and outcome != CANCELLED:
+            try:
+                job.on_finish()
+            except Exception as e:
+                error(f"❌ on_finish for job #{job.id} failed: {e}")
+
+    def _finish(self, job, state, detail=None):
+        job.state = state
+        job.finished = time.time()
+        job.worker = None
+        if state == DONE:
+            job.progress = 1.0
+        if detail:
+            job.message = detail.strip().splitlines()[-1]
+        self._publish(job)
+        self._store.delete(LOCKS_NS, job.lock_key)
+
+    # === Views (every process's jobs, from the state store) ===
+    def jobs(self):
+        records = sorted(self._store.items(JOBS_NS).values(), key=lambda r: r["id"], reverse=True)
+        return [Job.from_record(record) for record in records]
+
+    def active(self):
+        return [job for job in self.jobs() if job.active]
+
+    def wait(self, job_id, timeout=None, poll=0.5):
+        """Blocks until job_id (of any process) finishes; returns its final state, None on timeout or if unknown."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            record = self._store.get(JOBS_NS, job_id)
+            if record is None:
+                return None
+            if record["state"] not in (QUEUED, RUNNING):
+                return record["state"]
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def format_jobs(self, limit=10):
+        jobs = self.jobs()[:limit]
+        if not jobs:
+            return "📭 No jobs yet"
+        return "🗂️ Jobs\n" + "\n".join(job.describe() for job in jobs)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = JobRunner()
+                info(f"🏭 Job runner started ({_runner.max_workers} slots, {_runner.warm_target} warm workers)")
+    return _runner
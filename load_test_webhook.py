@@ -0,0 +1,107 @@
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import config
+
+# === Webhook load test ===
+# Fires Telegram-shaped updates at a running main.py at a fixed rate and reports how fast
+# the webhook acknowledges them and whether the command workers keep up (via /health).
+# The text is not a bot command, so workers do no Bybit / Telegram calls.
+
+
+def make_update(update_id, user_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "from": {"id": user_id},
+            "chat": {"id": user_id},
+            "text": text,
+        },
+    }
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run(url, rate, seconds, user_ids, concurrency, text="load-test"):
+    local = threading.local()
+    latencies = []
+    statuses = {}
+    queued = 0  # 200s for allowed users; strangers are answered by the webhook itself
+    lock = threading.Lock()
+
+    def send(update_id):
+        nonlocal queued
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        user_id = user_ids[update_id % len(user_ids)]
+        started = time.perf_counter()
+        try:
+            status = session.post(url, json=make_update(update_id, user_id, text), timeout=10).status_code
+        except requests.exceptions.RequestException:
+            status = "error"
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200 and user_id in config.ALLOWED_USERS:
+                queued += 1
+
+    total = int(rate * seconds)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for update_id in range(total):
+            delay = started + update_id / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, update_id)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"📨 Sent {total} updates in {elapsed:.2f}s → {total / elapsed:.0f} req/s (target {rate})")
+    print(f"📊 Status codes: {statuses}")
+    print(f"⏱️ Ack latency ms: p50={percentile(latencies, 0.5) * 1000:.1f} "
+          f"p99={percentile(latencies, 0.99) * 1000:.1f} max={latencies[-1] * 1000:.1f}")
+    return queued
+
+
+def wait_for_workers(health_url, expected_processed, timeout=30):
+    started = time.perf_counter()
+    stats = {}
+    while time.perf_counter() - started < timeout:
+        stats = requests.get(health_url, timeout=5).json()
+        if stats["processed"] + stats["failed"] >= expected_processed and not any(stats["queued"]):
+            break
+        time.sleep(0.2)
+    print(f"🧵 Workers drained in {time.perf_counter() - started:.2f}s: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the Telegram webhook")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--rate", type=float, default=300, help="updates per second")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", default=",".join(map(str, config.ALLOWED_USERS)),
+                        help="comma separated user ids (non-allowed ids are rejected by the webhook and never reach the workers)")
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    base = args.url.rstrip("/")
+    user_ids = [int(x) for x in args.users.split(",")]
+    before = requests.get(f"{base}/health", timeout=5).json()
+    accepted = run(f"{base}/", args.rate, args.seconds, user_ids, args.concurrency)
+    wait_for_workers(f"{base}/health", before["processed"] + before["failed"] + accepted)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,184 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
 import sys
+import threading
+import time
 
 LOG_DIR = "logs"
 LOG_FILE = os.path.join(LOG_DIR, "app.log")
-os.makedirs(LOG_DIR, exist_ok=True)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 
-# 🛠️ Виправлення Windows-терміналу, щоб підтримував emoji / юнікод
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+# === Non-blocking logging ===
+# Callers only put the LogRecord on a queue; a listener thread formats it and writes the
+# console line and one JSON object per line to the rotating log file. Messages use
+# %-style args, so formatting happens on the listener thread and only for records
+# that are actually emitted. Hot call sites can pass every=N (keep 1 of N calls) or
+# rate=R (at most R records/s); the number of skipped calls rides on the next record.
 
-file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+ICONS = {"info": "ℹ️", "success": "✅", "warn": "⚠️", "error": "❌", "debug": "🐞"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "kind": getattr(record, "kind", None),
+            "msg": record.getMessage(),
+            "logger": record.name,
+            "thread": record.threadName,
+            "site": f"{record.module}:{record.lineno}",
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry["fields"] = fields
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        icon = ICONS.get(getattr(record, "kind", None))
+        if icon:
+            line = line.replace("] ", f"] {icon} ", 1)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            line += f" (+{suppressed} similar suppressed)"
+        return line
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues the record as is: message formatting is left to the listener thread."""
+
+    def prepare(self, record):
+        return record
+
+
+_logger = logging.getLogger("bot")
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def _setup():
+    """Creates logs/, the handlers and the listener thread on the first log call rather than at import."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        os.makedirs(LOG_DIR, exist_ok=True)
+
+        # 🛠️ Виправлення Windows-терміналу, щоб підтримував emoji / юнікод
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setLevel(LOG_LEVEL)
+        console_handler.setFormatter(ConsoleFormatter('%(asctime)s [%(levelname)s] %(message)s'))
+
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+        file_handler.setLevel(LOG_LEVEL)
+        file_handler.setFormatter(JsonFormatter())
+
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)  # drains whatever is still queued
+
+        logging.basicConfig(level=LOG_LEVEL, handlers=[_DeferredQueueHandler(log_queue)])
+        _listener = listener
+
+
+# === Per-call-site sampling ===
+class _Site:
+    __slots__ = ("lock", "calls", "window_start", "window_count", "suppressed")
+
+    def __init__(self):
+        self.lock = threading.Lock()  # call sites are hit from many threads; keeps every / rate exact
+        self.calls = 0
+        self.window_start = 0.0
+        self.window_count = 0
+        self.suppressed = 0
+
+
+_sites = {}
+_sites_lock = threading.Lock()
+
+
+def _admit(site_key, every, rate):
+    """Number of calls suppressed since the last logged one when this call should be logged, else None."""
+    site = _sites.get(site_key)
+    if site is None:
+        with _sites_lock:
+            site = _sites.setdefault(site_key, _Site())
+    with site.lock:
+        site.calls += 1
+        if every and (site.calls - 1) % every:
+            site.suppressed += 1
+            return None
+        if rate:
+            now = time.monotonic()
+            if now - site.window_start >= 1.0:
+                site.window_start, site.window_count = now, 0
+            if site.window_count >= rate:
+                site.suppressed += 1
+                return None
+            site.window_count += 1
+        suppressed, site.suppressed = site.suppressed, 0
+        return suppressed
+
+
+def _log(level, kind, msg, args, every, rate, fields):
+    if _listener is None:
+        _setup()
+    if not _logger.isEnabledFor(level):
+        return
+    suppressed = 0
+    if every or rate:
+        frame = sys._getframe(2)
+        suppressed = _admit((frame.f_code, frame.f_lineno), every, rate)
+        if suppressed is None:
+            return
+    _logger.log(level, msg, *args, stacklevel=3,
+                extra={"kind": kind, "fields": fields or None, "suppressed": suppressed})
 
-logging.basicConfig(level=logging.INFO, handlers=[console_handler, file_handler])
 
 # === Шорткати ===
-def info(msg):
-    logging.info(f"ℹ️ {msg}")
+# info("📦 Qty %s for %s", qty, side)          — formatted lazily
+# info("📺 Step %d", step, every=1000)          — 1 of every 1000 calls from this line
+# info("📤 Order %s", order_id, rate=5, symbol=s) — ≤ 5/s from this line, symbol as a JSON field
+def info(msg, *args, every=None, rate=None, **fields):
+    _log(logging.INFO, "info", msg, args, every, rate, fields)
+
+def success(msg, *args, every=None, rate=None, **fields):
+    _log(logging.INFO, "success", msg, args, every, rate, fields)
+
+def warn(msg, *args, every=None, rate=None, **fields):
+    _log(logging.WARNING, "warn", msg, args, every, rate, fields)
+
+def error(msg, *args, every=None, rate=None, **fields):
+    _log(logging.ERROR, "error", msg, args, every, rate, fields)
+
 
-def success(msg):
-    logging.info(f"✅ {msg}")
+def debug(msg, *args, every=None, rate=None, **fields):
+    _log(logging.DEBUG, "debug", msg, args, every, rate, fields)
 
-def warn(msg):
-    logging.warning(f"⚠️ {msg}")
 
-def error(msg):
-    logging.error(f"❌ {msg}")
+def flush():
+    """Writes out everything queued so far (for processes that exit without running atexit)."""
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener.start()
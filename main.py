@@ -1,22 +1,40 @@
-from flask import Flask, request
+from flask import Flask, Response, request, jsonify
 from telegram_api import send_message, send_photo
-from bybit_client import get_usdt_balance
-from futures_trader import close_position
 from ai_utils import run_script_async, get_status
+from command_queue import get_dispatcher
+from job_runner import get_job_runner
+from state_store import get_state_store
+import market_data
+import tracing
+import metrics
 import config
 import datetime
-from log_utils import info, success, warn, error
+import importlib
+from log_utils import info, success, warn, error, debug
 
 app = Flask(__name__)
 
-# Temporary storage for user amounts
-trade_amounts = {}
-pending_amount_input = set()
+# Trading modules (pybit, numpy via risk_analytics) are imported on first use, and
+# pre-imported in the background once the server is up, so startup stays small.
+LAZY_MODULES = ["bybit_client", "futures_trader"]
+
+
+def preimport_lazy_modules():
+    for module in LAZY_MODULES:
+        importlib.import_module(module)
+    from risk_analytics import get_risk_analytics
+    get_risk_analytics().start([config.SYMBOL])  # VaR / vol for leverage sizing, refreshed off the order path
+
+
+# User state lives in the shared state store so several webhook processes can serve the bot
+TRADE_AMOUNTS = "trade_amounts"
+PENDING_INPUT = "pending_amount_input"
+PENDING_INPUT_TTL = 600  # seconds a /setamount prompt waits for the number
 
 @app.route('/', methods=['POST'])
 def webhook():
     payload = request.get_json()
-    info(f"📬 Raw payload: {payload}")
+    debug("📬 Raw payload: %s", payload, rate=1)
 
     # ✅ Fix: unwrap if payload is a list (SendPulse-style fallback)
     if isinstance(payload, list):
@@ -41,23 +59,34 @@ def webhook():
         warn("Missing user_id or text")
         return '', 200
 
+    # Strangers never reach the command queue, so they cannot fill it or delay allowed users
     if int(user_id) not in config.ALLOWED_USERS:
-        warn(f"Access denied for user: {user_id}")
+        warn("Access denied for user: %s", user_id, rate=5)
         send_message(user_id, f"⛔️ Access denied. Your ID is: {user_id}")
         return '', 200
 
+    # Acknowledge right away; the command runs on the user's worker.
+    # 503 on a full queue makes Telegram redeliver the update later.
+    if not get_dispatcher().submit(user_id, handle_command, user_id, text):
+        warn(f"Command queue full, rejecting update from {user_id}")
+        return '', 503
+    return '', 200
+
+
+def handle_command(user_id, text):
     success(f"✅ Command: {text} from {user_id}")
 
     # Handle amount input
-    if user_id in pending_amount_input:
+    store = get_state_store()
+    if store.get(PENDING_INPUT, user_id):
         try:
             amount = float(text)
-            trade_amounts[user_id] = amount
-            pending_amount_input.remove(user_id)
+            store.set(TRADE_AMOUNTS, user_id, amount)
+            store.delete(PENDING_INPUT, user_id)
             send_message(user_id, f"✅ Amount set to: {amount} USDT")
         except ValueError:
             send_message(user_id, "❌ Invalid input. Please enter a numeric amount.")
-        return '', 200
+        return
 
     if text == '/start':
         welcome = (
@@ -83,6 +112,7 @@ def webhook():
                     {"text": "❌ Stop & Close", "callback_data": "/closeposition"}
                 ],
                 [
+                    {"text": "🗂️ Jobs", "callback_data": "/jobs"},
                     {"text": "ℹ️ Help", "callback_data": "/help"}
                 ]
             ]
@@ -90,6 +120,7 @@ def webhook():
         send_message(user_id, welcome, reply_markup=keyboard)
 
     elif text == '/balance':
+        from bybit_client import get_usdt_balance
         balance = get_usdt_balance()
         send_message(user_id, f"💰 Your current USDT balance: {balance}")
 
@@ -108,36 +139,69 @@ def webhook():
                 f"📈 Equity chart:"
             )
             send_photo(user_id, 'equity_curve.png', caption=caption)
-        run_script_async('run_simulation.py', on_start=on_start, on_finish=on_finish)
+        job, created = run_script_async('run_simulation.py', on_start=on_start, on_finish=on_finish)
+        if not created:
+            send_message(user_id, f"⏳ A simulation is already {job.state} (job #{job.id})")
 
     elif text == '/updatedata':
         def on_start():
             send_message(user_id, "🔄 Fetching fresh OHLCV data...")
         def on_finish():
             send_message(user_id, f"✅ Data updated\n🕒 {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        run_script_async('fetch_data.py', on_start=on_start, on_finish=on_finish)
+        job, created = run_script_async('fetch_data.py', on_start=on_start, on_finish=on_finish)
+        if not created:
+            send_message(user_id, f"⏳ A data update is already {job.state} (job #{job.id})")
 
     elif text == '/trainmodel':
         def on_start():
             send_message(user_id, "🧠 Starting model training...")
         def on_finish():
             send_message(user_id, f"✅ Model trained\n🕒 {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        run_script_async('train_ppo.py', on_start=on_start, on_finish=on_finish)
+        job, created = run_script_async('train_ppo.py', on_start=on_start, on_finish=on_finish)
+        if not created:
+            send_message(user_id, f"⏳ A training is already {job.state} (job #{job.id})")
 
     elif text == '/papertrade':
         def on_start():
             send_message(user_id, "📈 Starting paper trading...")
-        run_script_async('paper_trader.py', on_start=on_start)
+        job, created = run_script_async('paper_trader.py', on_start=on_start)
+        if not created:
+            send_message(user_id, f"⏳ Paper trading is already {job.state} (job #{job.id})")
 
     elif text == '/setamount':
         send_message(user_id, "💵 Please enter the amount in USDT:")
-        pending_amount_input.add(user_id)
+        store.set(PENDING_INPUT, user_id, True, ttl=PENDING_INPUT_TTL)
 
     elif text == '/closeposition':
         send_message(user_id, "🛘 Stopping bot and closing position...")
+        from futures_trader import close_position
         success_flag, msg = close_position()
         send_message(user_id, msg if success_flag else f"❌ Failed to close position: {msg}")
 
+    elif text == '/jobs':
+        send_message(user_id, get_job_runner().format_jobs())
+
+    elif text.startswith('/cancel'):
+        parts = text.split()
+        if len(parts) != 2 or not parts[1].lstrip('#').isdigit():
+            send_message(user_id, "❌ Usage: /cancel <job id>")
+        elif get_job_runner().cancel(int(parts[1].lstrip('#'))):
+            send_message(user_id, f"🛑 Job {parts[1]} cancelled")
+        else:
+            send_message(user_id, f"❌ No queued or running job {parts[1]}")
+
+    elif text == '/latency':
+        # This process only sees its own stages; the live path (data arrival, inference, ...)
+        # runs in paper_trader's job worker, which exports its histograms to latency_report.json
+        report = tracing.load_export()
+        if report and report.get("stages"):
+            exported = datetime.datetime.fromtimestamp(report.get("exported", 0), datetime.timezone.utc)
+            send_message(user_id, tracing.format_report(
+                report["stages"], f"⏱️ Live path (paper_trader, exported {exported:%Y-%m-%d %H:%M} UTC), µs: p50 / p99 / p999 (n)"))
+        else:
+            send_message(user_id, "⏱️ No live-path latency export yet (run /papertrade).")
+        send_message(user_id, tracing.format_report(title="⏱️ Webhook process (µs): p50 / p99 / p999 (n)"))
+
     elif text == '/help':
         help_text = (
             "📖 *Available Commands*\n\n"
@@ -149,13 +213,32 @@ def webhook():
             "/trainmodel - Train model\n"
             "/status - DB/model info\n"
             "/papertrade - Run paper trading\n"
+            "/jobs - Queued, running and recent jobs\n"
+            "/cancel <id> - Cancel a job\n"
+            "/latency - Latency per stage (p50/p99/p999)\n"
             "/closeposition - Stop bot"
         )
         send_message(user_id, help_text)
 
-    return '', 200
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify(get_dispatcher().stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 
 if __name__ == '__main__':
     import os
+    import threading
+    from waitress import serve
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    market_data.subscribe([config.SYMBOL])  # warm the price cache before the first /closeposition
+    get_dispatcher()
+    get_job_runner()  # start warming workers before the first job
+    threading.Thread(target=preimport_lazy_modules, name="preimport", daemon=True).start()
+    info(f"🚀 Serving webhook on port {port} ({config.WEBHOOK_SERVER_THREADS} server threads)")
+    serve(app, host="0.0.0.0", port=port, threads=config.WEBHOOK_SERVER_THREADS)
@@ -0,0 +1,223 @@
+import json
+import time
+import threading
+from collections import namedtuple
+
+import config
+import tracing
+from log_utils import info, warn
+
+# === In-process ticker / top-of-book cache ===
+# Writers (the websocket thread, and REST fallbacks on caller threads) replace each symbol's
+# Quote with a new immutable tuple under _write_lock, so readers just do a dict lookup — no
+# locks on the read path. last and the top of book carry their own timestamps: a book
+# update does not make an old last price look fresh, and a REST last price does not
+# refresh the book. Reads older than max_staleness fall back to one REST call (coalesced in
+# bybit_client). The stream only runs once a process calls subscribe() explicitly.
+
+Quote = namedtuple("Quote", [
+    "symbol", "last", "bid", "ask", "bid_size", "ask_size", "last_updated", "book_updated", "source",
+])
+BOOK_FIELDS = ("bid", "ask", "bid_size", "ask_size")
+
+HEARTBEAT_SECONDS = 20  # Bybit drops public connections without a ping for ~30 s
+RECONNECT_MAX_SECONDS = 30
+
+_quotes = {}
+_stats = {"hits": 0, "misses": 0, "stale": 0, "rest_fallbacks": 0, "messages": 0, "max_age_ms": 0.0}
+_stream = None
+_stream_lock = threading.Lock()
+_price_listeners = []
+_write_lock = threading.Lock()
+
+
+def _publish(symbol, source, **fields):
+    now = time.monotonic()
+    with _write_lock:
+        previous = _quotes.get(symbol)
+        base = previous._asdict() if previous else {
+            "symbol": symbol, "last": None, "bid": None, "ask": None, "bid_size": None, "ask_size": None,
+            "last_updated": None, "book_updated": None,
+        }
+        base.update(fields)
+        if "last" in fields:
+            base["last_updated"] = now
+        if any(field in fields for field in BOOK_FIELDS):
+            base["book_updated"] = now
+        base["source"] = source
+        _quotes[symbol] = Quote(**base)
+    if "last" in fields:
+        for listener in _price_listeners:
+            listener(symbol, fields["last"])
+
+
+def add_price_listener(listener):
+    """listener(symbol, last_price) is called from the writer thread on every price update."""
+    _price_listeners.append(listener)
+
+
+class _TickerStream:
+    """Public linear stream: tickers.<symbol> for last price, orderbook.1.<symbol> for top of book."""
+
+    def __init__(self, url):
+        self.url = url
+        self.topics = set()
+        self.ws = None
+        self.connected = threading.Event()
+        self._thread = None
+
+    def add(self, symbols):
+        new_topics = set()
+        for symbol in symbols:
+            new_topics |= {f"tickers.{symbol}", f"orderbook.1.{symbol}"}
+        new_topics -= self.topics
+        if not new_topics:
+            return
+        self.topics |= new_topics
+        if self.connected.is_set():
+            self._send({"op": "subscribe", "args": sorted(new_topics)})
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="market-data-ws", daemon=True)
+            self._thread.start()
+
+    def _send(self, message):
+        try:
+            self.ws.send(json.dumps(message))
+        except Exception as e:
+            warn(f"⚠️ Market data send failed: {e}")
+
+    def _on_open(self, ws):
+        self.connected.set()
+        self._send({"op": "subscribe", "args": sorted(self.topics)})
+        info(f"📡 Market data stream connected ({len(self.topics)} topics)")
+
+    def _on_message(self, ws, raw):
+        with tracing.span("data_arrival"):
+            self._handle(json.loads(raw))
+
+    def _handle(self, message):
+        topic = message.get("topic")
+        if not topic:
+            return
+        _stats["messages"] += 1
+        data = message.get("data", {})
+
+        if topic.startswith("tickers."):
+            symbol = topic.split(".", 1)[1]
+            fields = {}
+            if "lastPrice" in data:
+                fields["last"] = float(data["lastPrice"])
+            if "bid1Price" in data:
+                fields["bid"] = float(data["bid1Price"])
+            if "ask1Price" in data:
+                fields["ask"] = float(data["ask1Price"])
+            if fields:
+                _publish(symbol, "stream", **fields)
+
+        elif topic.startswith("orderbook.1."):
+            symbol = data.get("s") or topic.split(".", 2)[2]
+            fields = {}
+            for side, price_key, size_key in (("b", "bid", "bid_size"), ("a", "ask", "ask_size")):
+                levels = data.get(side) or []
+                if levels and float(levels[0][1]) > 0:
+                    fields[price_key] = float(levels[0][0])
+                    fields[size_key] = float(levels[0][1])
+            if fields:
+                _publish(symbol, "stream", **fields)
+
+    def _on_close(self, ws, *args):
+        self.connected.clear()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            if self.connected.is_set():
+                self._send({"op": "ping"})
+
+    def _run(self):
+        import websocket  # websocket-client
+
+        threading.Thread(target=self._heartbeat, name="market-data-ping", daemon=True).start()
+        backoff = 1
+        while True:
+            self.ws = websocket.WebSocketApp(
+                self.url, on_open=self._on_open, on_message=self._on_message, on_close=self._on_close,
+                on_error=lambda ws, e: warn(f"⚠️ Market data stream error: {e}")
+            )
+            started = time.monotonic()
+            self.ws.run_forever()
+            self.connected.clear()
+            if time.monotonic() - started > RECONNECT_MAX_SECONDS:
+                backoff = 1
+            warn(f"⚠️ Market data stream disconnected, reconnecting in {backoff}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+
+
+def subscribe(symbols):
+    """Starts (or extends) the streaming subscription. No-op when MARKET_DATA_STREAM is off."""
+    global _stream
+    if not config.MARKET_DATA_STREAM:
+        return
+    with _stream_lock:
+        if _stream is None:
+            _stream = _TickerStream(config.BYBIT_WS_PUBLIC_URL)
+        _stream.add(symbols)
+
+
+def get_quote(symbol, max_staleness=None):
+    """Cached Quote if its last price is younger than max_staleness seconds, otherwise None (counted as a miss)."""
+    max_staleness = config.MARKET_DATA_MAX_STALENESS if max_staleness is None else max_staleness
+    quote = _quotes.get(symbol)
+    if quote is None or quote.last_updated is None:
+        _stats["misses"] += 1
+        return None
+    age = time.monotonic() - quote.last_updated
+    _stats["max_age_ms"] = max(_stats["max_age_ms"], age * 1000)
+    if age > max_staleness:
+        _stats["stale"] += 1
+        _stats["misses"] += 1
+        return None
+    _stats["hits"] += 1
+    tracing.record("quote_age", int(age * 1e9))
+    return quote
+
+
+def get_market_price(symbol, max_staleness=None):
+    """
+    Last price no older than max_staleness seconds; REST fallback keeps the old bybit_client contract.
+    Does not subscribe: long-lived processes that want streamed prices call subscribe() at startup.
+    """
+    quote = get_quote(symbol, max_staleness)
+    if quote is not None and quote.last is not None:
+        return quote.last
+
+    from bybit_client import get_market_price as rest_market_price
+    _stats["rest_fallbacks"] += 1
+    price = rest_market_price(symbol)
+    if price is not None:
+        _publish(symbol, "rest", last=price)
+    return price
+
+
+def quote_age(symbol):
+    """Seconds since the last price update, None if there is none."""
+    quote = _quotes.get(symbol)
+    return None if quote is None or quote.last_updated is None else time.monotonic() - quote.last_updated
+
+
+def book_age(symbol):
+    """Seconds since the top-of-book update, None if there is none."""
+    quote = _quotes.get(symbol)
+    return None if quote is None or quote.book_updated is None else time.monotonic() - quote.book_updated
+
+
+def stats():
+    """Snapshot of cache counters plus the current age (ms) of every cached symbol."""
+    lookups = _stats["hits"] + _stats["misses"]
+    snapshot = dict(_stats)
+    snapshot["hit_rate"] = _stats["hits"] / lookups if lookups else 0.0
+    ages = {symbol: quote_age(symbol) for symbol in list(_quotes)}
+    snapshot["ages_ms"] = {symbol: round(age * 1000, 1) for symbol, age in ages.items() if age is not None}
+    snapshot["stream_connected"] = bool(_stream and _stream.connected.is_set())
+    return snapshot
@@ -0,0 +1,337 @@
+import sys
+import time
+import bisect
+import argparse
+import threading
+from contextlib import contextmanager
+
+# === Counters, gauges and histograms in Prometheus text format ===
+# Recording is lock-free: every metric keeps one small list ("shard") per thread and a
+# thread only ever writes its own shard, so inc()/observe() are a thread-local lookup
+# plus a list update. Only shard creation (once per thread per metric) and render()
+# take a lock; render() sums the shards, folding those of exited threads into one
+# accumulator. Worker processes ship their totals and set gauges to the parent with
+# snapshot() / merge() (see job_runner): counters and histograms add up into that
+# accumulator, gauges take the last value.
+#
+#   BYBIT_REQUESTS = metrics.counter("bybit_requests_total", "Bybit REST calls", ["method", "path"])
+#   BYBIT_REQUESTS.labels("GET", "/v5/position/list").inc()
+#   with metrics.histogram("policy_inference_seconds", "...").time(): ...
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class _Child:
+    """
+    One label combination. Values live in per-thread shards (lists) summed on read. Shards
+    of threads that have exited are folded into one accumulator (together with totals merged
+    from other processes), so short-lived threads (executors, job threads) do not pile up.
+    """
+    __slots__ = ("_local", "_shards", "_folded", "_lock", "_width")
+
+    def __init__(self, width):
+        self._local = threading.local()
+        self._shards = []                # (thread, shard) for threads not folded yet
+        self._folded = [0.0] * width     # exited threads + merged snapshots
+        self._lock = threading.Lock()
+        self._width = width
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = [0.0] * self._width
+            with self._lock:
+                self._fold_exited()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _fold_exited(self):
+        """Under _lock. An exited thread never writes its shard again, so it can be summed once and dropped."""
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                for i, value in enumerate(shard):
+                    self._folded[i] += value
+        self._shards = live
+
+    def values(self):
+        with self._lock:
+            self._fold_exited()
+            totals = list(self._folded)
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+    def merge(self, values):
+        with self._lock:
+            for i, value in enumerate(values):
+                self._folded[i] += value
+
+
+class _CounterChild(_Child):
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = None  # None until set(): never shipped to the parent by snapshot()
+        self.function = None
+
+    def set(self, value):
+        self.value = value  # single assignment: atomic, no lock needed
+
+    def set_function(self, function):
+        """Evaluated at render time (e.g. a queue length)."""
+        self.function = function
+
+    def values(self):
+        if self.function is not None:
+            try:
+                return [float(self.function())]
+            except Exception:
+                return [float("nan")]
+        return [float(self.value or 0.0)]
+
+    @property
+    def shippable(self):
+        """Set explicitly in this process; function gauges describe local state (queues, workers)."""
+        return self.function is None and self.value is not None
+
+    def merge(self, values):
+        self.value = values[0]
+
+
+class _HistogramChild(_Child):
+    """Shard layout: [bucket counts..., +Inf count, sum]."""
+    __slots__ = ("bounds",)
+
+    def __init__(self, bounds):
+        super().__init__(len(bounds) + 2)
+        self.bounds = bounds
+
+    def observe(self, value):
+        shard = self._shard()
+        shard[bisect.bisect_left(self.bounds, value)] += 1
+        shard[-1] += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        key = values or tuple(str(kwargs[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def _label_str(self, key, extra=None):
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def children(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def render(self):
+        for key, child in self.children():
+            yield f"{self.name}{self._label_str(key)} {child.values()[0]:g}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default.set(value)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+    def render(self):
+        for key, child in self.children():
+            yield f"{self.name}{self._label_str(key)} {child.values()[0]:g}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def render(self):
+        for key, child in self.children():
+            values = child.values()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = self._label_str(key, 'le="' + le + '"')
+                yield f"{self.name}_bucket{labels} {cumulative:g}"
+            yield f"{self.name}_sum{self._label_str(key)} {values[-1]:g}"
+            yield f"{self.name}_count{self._label_str(key)} {cumulative:g}"
+
+
+def _get_or_create(cls, name, documentation, labelnames, **kwargs):
+    metric = _registry.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.get(name)
+            if metric is None:
+                metric = _registry[name] = cls(name, documentation, labelnames, **kwargs)
+    return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return _get_or_create(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    return _get_or_create(Gauge, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def render():
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# === Cross-process transfer ===
+def snapshot():
+    """Picklable {name: (kind, doc, labelnames, buckets, {labels: values})} of counters, histograms and set gauges."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    data = {}
+    for m in metrics:
+        children = {key: child.values() for key, child in m.children()
+                    if m.kind != "gauge" or child.shippable}
+        if children:
+            data[m.name] = (m.kind, m.documentation, m.labelnames, getattr(m, "buckets", None), children)
+    return data
+
+
+def merge(data):
+    """Folds another process's snapshot() into this registry: sums for counters / histograms, last value for gauges."""
+    for name, (kind, documentation, labelnames, buckets, children) in data.items():
+        if kind == "counter":
+            metric = counter(name, documentation, labelnames)
+        elif kind == "gauge":
+            metric = gauge(name, documentation, labelnames)
+        else:
+            metric = histogram(name, documentation, labelnames, buckets=buckets)
+        for key, values in children.items():
+            metric.labels(*key).merge(values)
+
+
+# === Overhead benchmark ===
+def bench(iterations=1_000_000):
+    c = counter("bench_counter_total", "benchmark counter")
+    h = histogram("bench_seconds", "benchmark histogram")
+    labelled = counter("bench_labelled_total", "benchmark labelled counter", ["side"]).labels("Buy")
+
+    def timed(fn):
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            fn()
+        return (time.perf_counter_ns() - start) / iterations
+
+    baseline = timed(lambda: None)
+    results = {
+        "counter.inc": timed(c.inc) - baseline,
+        "labelled child.inc": timed(labelled.inc) - baseline,
+        "histogram.observe": timed(lambda: h.observe(0.0042)) - baseline,
+    }
+
+    threads = [threading.Thread(target=lambda: [c.inc() for _ in range(iterations // 4)]) for _ in range(4)]
+    before = c.labels().values()[0]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert c.labels().values()[0] - before == 4 * (iterations // 4), "lost increments"
+
+    for name, ns in results.items():
+        print(f"⏱️ {name:<20} {ns:7.1f} ns/op")
+    print("✅ 4 threads x counter.inc: no lost increments")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Metrics overhead benchmark")
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    args = parser.parse_args()
+    bench(args.iterations)
+    sys.exit(0)
@@ -2,7 +2,6 @@ import os
 import json
 import time
 import numpy as np
-import pandas as pd
 from datetime import datetime
 
 from stable_baselines3 import PPO
@@ -11,7 +10,10 @@ from crypto_trading_env import CryptoTradingEnv
 from telegram_api import send_message
 from log_utils import info, warn, error
 import fetch_data  # <=== імпорт fetch_data
+import tracing
+from job_runner import report_progress
 import config
+from sim_records import PaperPosition
 
 STATE_FILE = "paper_trading_state.json"
 
@@ -34,28 +36,18 @@ def load_model(vec_env):
 
 
 def load_state():
-    default_state = {
-        "balance": 100.0,
-        "holding": False,
-        "entry_price": 0.0,
-        "crypto_amount": 0.0
-    }
     if os.path.exists(STATE_FILE):
         try:
             with open(STATE_FILE, "r") as f:
-                state = json.load(f)
-                for key in default_state:
-                    if key not in state:
-                        state[key] = default_state[key]
-                return state
-        except (json.JSONDecodeError, IOError) as e:
+                return PaperPosition.from_dict(json.load(f))
+        except (json.JSONDecodeError, IOError, TypeError, ValueError) as e:
             warn(f"⚠️ Failed to read state file: {e}. Reinitializing.")
-    return default_state
+    return PaperPosition()
 
 
 def save_state(state):
     with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
+        json.dump(state.to_dict(), f, indent=2)
 
 
 def run():
@@ -70,46 +62,51 @@ def run():
     step = 0
     done = False
 
-    price_series = vec_env.get_attr("df")[0]['close'].tolist()
+    n_rows = vec_env.get_attr("n_rows")[0]
 
     while not done:
-        action, _ = model.predict(obs)
-        obs, reward, done, step_info = vec_env.step(action)
-
-        price = price_series[step]
-
-        if action == 1 and not state["holding"]:
-            state["entry_price"] = price
-            state["crypto_amount"] = state["balance"] / price
-            state["balance"] = 0
-            state["holding"] = True
+        with tracing.span("inference"):
+            action, _ = model.predict(obs)
+        with tracing.span("feature_build"):  # next bar -> normalized observation; traced here, not in the env's training loop
+            obs, reward, done, step_info = vec_env.step(action)
+
+        price = step_info[0]["price"]
+        if step % 500 == 0:
+            report_progress(step / n_rows, f"step {step}/{n_rows}")
+
+        if action == 1 and not state.holding:
+            state.entry_price = price
+            state.crypto_amount = state.balance / price
+            state.balance = 0
+            state.holding = True
             msg = (
                 f"🟢 Paper BUY executed\n"
                 f"💰 Entry Price: {price:.2f}\n"
-                f"📊 Amount: {state['crypto_amount']:.6f} BTC"
+                f"📊 Amount: {state.crypto_amount:.6f} BTC"
             )
             send_message(config.CONTACT_ID, msg)
 
-        elif action == 2 and state["holding"]:
-            state["balance"] = state["crypto_amount"] * price
-            profit = state["balance"] - state["entry_price"] * state["crypto_amount"]
-            state["crypto_amount"] = 0
-            state["holding"] = False
+        elif action == 2 and state.holding:
+            state.balance = state.crypto_amount * price
+            profit = state.balance - state.entry_price * state.crypto_amount
+            state.crypto_amount = 0
+            state.holding = False
             msg = (
                 f"🔴 Paper SELL executed\n"
                 f"💰 Exit Price: {price:.2f}\n"
                 f"📈 Profit: {profit:.2f} USDT\n"
-                f"💼 New Balance: {state['balance']:.2f} USDT"
+                f"💼 New Balance: {state.balance:.2f} USDT"
             )
             send_message(config.CONTACT_ID, msg)
 
-        elif state["holding"] and step % 50 == 0:
-            unrealized = price * state["crypto_amount"] - state["entry_price"] * state["crypto_amount"]
+        elif state.holding and step % 50 == 0:
+            unrealized = price * state.crypto_amount - state.entry_price * state.crypto_amount
             send_message(config.CONTACT_ID, f"📍 Holding... Price: {price:.2f}, Unrealized PnL: {unrealized:.2f} USDT")
 
         save_state(state)
         step += 1
 
+    tracing.export_json()
     send_message(config.CONTACT_ID, "✅ Paper trading finished.")
 
 
@@ -0,0 +1,330 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import config
+import metrics
+from state_store import get_state_store
+from job_runner import get_job_runner, DONE
+from status_summary import read_summary
+from telegram_api import send_message
+from log_utils import info, success, warn, error
+
+# === Data pipeline as a DAG of cached stages ===
+# Every stage declares the stages it depends on and what its inputs are: by default its
+# upstream stages' outputs, or a cheap fingerprint derived from them or from outside
+# (e.g. the candle that just closed). Before running, a stage hashes its inputs; if the
+# hash matches the one stored after its last successful run, it is skipped and its
+# cached output is reused. Stages whose dependencies are done run in parallel on a small
+# thread pool, and only stages that actually run are submitted, so a pass with no new
+# data is a handful of state-store reads. Stage hashes live in the shared state store, so the bot's own
+# /updatedata and a restarted scheduler see the same cache.
+#
+#   ingest ──┬── rollups ── retrain ── backtest ──┐
+#            └── features ────────────────────────┴── report
+
+PIPELINE_NS = "pipeline"
+ROLLUP_TABLE = "ohlcv_rollup"
+ROLLUP_COLUMNS = ("timestamp", "open", "high", "low", "close", "volume")
+
+RUN, SKIP, FAIL, BLOCKED = "ran", "skipped", "failed", "blocked"
+
+STAGE_RUNS = metrics.counter("pipeline_stage_runs_total", "Pipeline stage outcomes", ["stage", "outcome"])
+STAGE_SECONDS = metrics.histogram("pipeline_stage_seconds", "Pipeline stage run time (stages that ran)", ["stage"])
+PIPELINE_SECONDS = metrics.histogram("pipeline_run_seconds", "Whole pipeline pass incl. skipped stages")
+
+
+class Stage:
+    __slots__ = ("name", "fn", "deps", "inputs")
+
+    def __init__(self, name, fn, deps=(), inputs=None):
+        self.name = name
+        self.fn = fn            # fn(upstream: {dep name: output}) -> JSON-serializable output
+        self.deps = tuple(deps)
+        self.inputs = inputs    # inputs(upstream) -> JSON-serializable fingerprint; default: upstream itself
+
+
+class StageResult:
+    __slots__ = ("state", "output", "seconds", "detail")
+
+    def __init__(self, state, output=None, seconds=0.0, detail=None):
+        self.state = state
+        self.output = output
+        self.seconds = seconds
+        self.detail = detail
+
+
+class Pipeline:
+    def __init__(self, stages, store=None, max_parallel=4):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            missing = [dep for dep in stage.deps if dep not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown stage(s) {missing}")
+        self._check_acyclic()
+        self.store = store or get_state_store()
+        self.max_parallel = max_parallel
+        self._run_lock = threading.Lock()
+
+    def _check_acyclic(self):
+        """A cycle would leave its stages pending forever, so run() would spin; refuse it up front."""
+        visiting, done = set(), set()
+
+        def visit(name, path):
+            if name in done:
+                return
+            if name in visiting:
+                cycle = path[path.index(name):] + [name]
+                raise ValueError(f"Pipeline has a dependency cycle: {' -> '.join(cycle)}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep, path + [name])
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name, [])
+
+    def _key(self, stage, upstream):
+        payload = [stage.name, stage.inputs(upstream) if stage.inputs else upstream]
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _execute(self, stage, upstream, key):
+        started = time.perf_counter()
+        output = stage.fn(upstream)
+        self.store.set(PIPELINE_NS, stage.name, {"key": key, "output": output, "finished": time.time()})
+        return output, time.perf_counter() - started
+
+    def run(self, force=False):
+        """One pass over the DAG; returns {stage name: StageResult}. A pass already in progress makes this wait."""
+        with self._run_lock:
+            started = time.perf_counter()
+            results = {}
+            pending = dict(self.stages)
+            running = {}
+            with ThreadPoolExecutor(self.max_parallel, thread_name_prefix="pipeline") as pool:
+                while pending or running:
+                    for name, stage in list(pending.items()):
+                        dep_states = [results[dep].state if dep in results else None for dep in stage.deps]
+                        if None in dep_states:
+                            continue
+                        del pending[name]
+                        if any(state in (FAIL, BLOCKED) for state in dep_states):
+                            results[name] = StageResult(BLOCKED)
+                            continue
+                        upstream = {dep: results[dep].output for dep in stage.deps}
+                        key = self._key(stage, upstream)
+                        cached = self.store.get(PIPELINE_NS, name)
+                        if not force and cached is not None and cached["key"] == key:
+                            results[name] = StageResult(SKIP, cached["output"])
+                            continue
+                        info(f"▶️ Stage {name} started")
+                        running[pool.submit(self._execute, stage, upstream, key)] = name
+
+                    if not running:
+                        continue  # the skips above may have unblocked more stages
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        try:
+                            output, seconds = future.result()
+                            results[name] = StageResult(RUN, output, seconds)
+                            STAGE_SECONDS.labels(name).observe(seconds)
+                            success(f"✅ Stage {name} done in {seconds:.2f}s")
+                        except Exception as e:
+                            results[name] = StageResult(FAIL, detail=str(e))
+                            error(f"❌ Stage {name} failed: {e}")
+
+            for name, result in results.items():
+                STAGE_RUNS.labels(name, result.state).inc()
+            elapsed = time.perf_counter() - started
+            PIPELINE_SECONDS.observe(elapsed)
+            ran = [name for name, result in results.items() if result.state == RUN]
+            info(f"🧩 Pipeline pass in {elapsed * 1000:.1f} ms: ran {', '.join(ran) or 'nothing'}")
+            return {name: results[name] for name in self.stages}
+
+
+def format_results(results):
+    icons = {RUN: "✅", SKIP: "⏭️", FAIL: "❌", BLOCKED: "⛔"}
+    lines = []
+    for name, result in results.items():
+        line = f"{icons[result.state]} {name}: {result.state}"
+        if result.state == RUN:
+            line += f" ({result.seconds:.1f}s)"
+        if result.detail:
+            line += f" — {result.detail}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# === Candle clock ===
+def candle_seconds(interval=None):
+    return int(interval or config.INTERVAL) * 60  # Bybit kline interval, minutes
+
+
+def last_closed_candle(now=None, interval=None):
+    """Open time (ms) of the newest candle that has closed."""
+    period = candle_seconds(interval)
+    now = time.time() if now is None else now
+    return (int(now // period) - 1) * period * 1000
+
+
+def next_candle_close(now=None, interval=None):
+    period = candle_seconds(interval)
+    now = time.time() if now is None else now
+    return (int(now // period) + 1) * period
+
+
+# === Stages ===
+def _run_job(name):
+    runner = get_job_runner()
+    job, _ = runner.submit(name)  # joins an identical job already started by /updatedata etc.
+    state = runner.wait(job.id)
+    if state != DONE:
+        raise RuntimeError(f"job #{job.id} {name} {state or 'lost'}")
+
+
+def ingest(upstream):
+    # Keyed on the candle clock, so this runs on every scheduled pass; the fetch job is
+    # only spawned when the DB does not hold the newest closed candle yet (e.g. /updatedata got it)
+    from data_access import time_range
+    newest = time_range()[1]
+    if newest is None or newest < last_closed_candle():
+        _run_job("updatedata")
+    return read_summary().get("ohlcv")
+
+
+def rollup_intervals():
+    intervals = {int(x) for x in config.PIPELINE_ROLLUP_INTERVALS.split(",") if x.strip()}
+    intervals.add(config.PIPELINE_RETRAIN_INTERVAL)
+    return sorted(intervals)
+
+
+def _upsert_rollup(conn, symbol, interval, df):
+    if df.empty:
+        return
+    df = df.drop_duplicates(subset=["timestamp"], keep="last")
+    bars = df.groupby("bucket").agg(
+        open=("open", "first"), high=("high", "max"), low=("low", "min"),
+        close=("close", "last"), volume=("volume", "sum"),
+    )
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {ROLLUP_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(symbol, interval, int(bucket), row.open, row.high, row.low, row.close, row.volume)
+             for bucket, row in bars.iterrows()],
+        )
+
+
+def rollups(upstream, db_path=None, symbol=None):
+    """
+    Upserts higher-timeframe bars (ohlcv_rollup) from the base bars, starting at each
+    interval's last stored bucket, which may have been partial. Returns per interval the
+    open time of the newest bucket that is complete.
+    """
+    import pandas as pd  # only needed when new bars arrive; keeps the scheduler's startup light
+    from data_access import iter_chunks
+    symbol = symbol or config.SYMBOL
+    base_ms = candle_seconds() * 1000
+    conn = sqlite3.connect(db_path or config.DB_PATH)
+    try:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+                symbol TEXT NOT NULL,
+                interval INTEGER NOT NULL,
+                timestamp INTEGER NOT NULL,
+                open REAL, high REAL, low REAL, close REAL, volume REAL,
+                PRIMARY KEY (symbol, interval, timestamp)
+            )
+        """)
+        output = {}
+        for interval in rollup_intervals():
+            step_ms = interval * 60_000
+            since = conn.execute(
+                f"SELECT MAX(timestamp) FROM {ROLLUP_TABLE} WHERE symbol = ? AND interval = ?", (symbol, interval)
+            ).fetchone()[0] or 0
+            # Chunked read; each chunk's last bucket may continue in the next one, so it is carried over
+            pending = None
+            for chunk in iter_chunks(symbol, start=since, columns=ROLLUP_COLUMNS, db_path=db_path):
+                df = pd.DataFrame(chunk, columns=ROLLUP_COLUMNS)
+                df["timestamp"] = df["timestamp"].astype("int64")
+                if pending is not None:
+                    df = pd.concat([pending, df], ignore_index=True)
+                df["bucket"] = df["timestamp"] // step_ms * step_ms
+                complete = df["bucket"] != df["bucket"].iloc[-1]
+                pending = df[~complete].drop(columns="bucket")
+                _upsert_rollup(conn, symbol, interval, df[complete])
+            if pending is not None:
+                pending["bucket"] = pending["timestamp"] // step_ms * step_ms
+                _upsert_rollup(conn, symbol, interval, pending)
+            last_bucket, last_bar = conn.execute(
+                f"SELECT MAX(r.timestamp), (SELECT MAX(timestamp) FROM ohlcv WHERE symbol = ?) "
+                f"FROM {ROLLUP_TABLE} r WHERE r.symbol = ? AND r.interval = ?", (symbol, symbol, interval)
+            ).fetchone()
+            if last_bucket is None:
+                output[str(interval)] = None
+            elif last_bar + base_ms >= last_bucket + step_ms:
+                output[str(interval)] = last_bucket
+            else:
+                output[str(interval)] = last_bucket - step_ms
+        return output
+    finally:
+        conn.close()
+
+
+def features(upstream):
+    from risk_analytics import get_risk_analytics  # numpy
+    stats = get_risk_analytics().refresh(config.SYMBOL, force=True)
+    return stats._asdict() if stats is not None else None
+
+
+def retrain_inputs(upstream):
+    # Only a newly completed PIPELINE_RETRAIN_INTERVAL bucket retrains, not every new base bar
+    return upstream["rollups"].get(str(config.PIPELINE_RETRAIN_INTERVAL))
+
+
+def retrain(upstream):
+    bucket = retrain_inputs(upstream)
+    if bucket is None:
+        warn("⚠️ No complete retrain bucket yet, keeping the current model")
+        return None
+    _run_job("trainmodel")
+    return {"trained": time.time(), "closed_bucket": bucket}
+
+
+def backtest(upstream):
+    if upstream["retrain"] is None:
+        return None
+    _run_job("simulate")
+    return read_summary().get("simulation")
+
+
+def report(upstream):
+    ohlcv = upstream["ingest"] or {}
+    lines = [f"🧩 Pipeline update for {config.SYMBOL}"]
+    if ohlcv.get("last_timestamp"):
+        last = time.strftime("%Y-%m-%d %H:%M", time.gmtime(ohlcv["last_timestamp"] / 1000))
+        lines.append(f"📈 {ohlcv['rows']} bars, last {last} UTC")
+    risk = upstream["features"]
+    if risk:
+        lines.append(f"📐 VaR {risk['var_hist'] * 100:.2f}% · ES {risk['es_hist'] * 100:.2f}% · vol {risk['volatility'] * 100:.2f}%/bar")
+    simulation = upstream["backtest"]
+    if simulation:
+        lines.append("🧪 Backtest: " + ", ".join(f"{k}={v}" for k, v in simulation.items() if k != "finished"))
+    text = "\n".join(lines)
+    send_message(config.ALLOWED_USERS[0], text)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def build_pipeline(store=None):
+    return Pipeline([
+        Stage("ingest", ingest, inputs=lambda upstream: last_closed_candle()),
+        Stage("rollups", rollups, deps=["ingest"]),
+        Stage("features", features, deps=["ingest"]),
+        Stage("retrain", retrain, deps=["rollups"], inputs=retrain_inputs),
+        Stage("backtest", backtest, deps=["retrain"]),
+        Stage("report", report, deps=["ingest", "features", "backtest"]),
+    ], store=store)
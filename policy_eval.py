@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import config
+from data_access import count_rows, timestamp_at
+from log_utils import info, success
+
+# === Out-of-sample evaluation of an exported policy ===
+# Runs a TorchScript policy (export_policy.py) through CryptoTradingEnv over a held-out time
+# range. train_ppo's ParallelEvalCallback starts this script as a subprocess per checkpoint
+# (--model / --vecnorm / --start / --output): the export from the saved checkpoint happens
+# there too, off the learner's thread and device.
+#
+#   python policy_eval.py --policy ppo_crypto_trader.pt --holdout 0.2
+#   python policy_eval.py --model step_4096/model.zip --vecnorm step_4096/vecnormalize.pkl --start 1700000000000 --output result.json
+
+
+def holdout_split(fraction=None, symbol=None, db_path=None):
+    """First timestamp of the newest `fraction` of bars, or None if there is too little data to split."""
+    fraction = config.EVAL_HOLDOUT_FRACTION if fraction is None else fraction
+    rows = count_rows(symbol, db_path=db_path)
+    held_out = int(rows * fraction)
+    if fraction <= 0 or held_out < 2 or rows - held_out < 2:
+        return None
+    return timestamp_at(rows - held_out, symbol, db_path=db_path)
+
+
+def evaluate_exported(policy_path, start=None, end=None, symbol=None, db_path=None):
+    """One deterministic episode over [start, end). Returns a dict of validation metrics."""
+    from policy_runtime import PolicyRuntime
+    from crypto_trading_env import CryptoTradingEnv
+
+    started = time.perf_counter()
+    runtime = PolicyRuntime(policy_path)
+    env = CryptoTradingEnv(symbol, start, end, db_path=db_path)
+    obs, _ = env.reset()
+    initial = equity = peak = env.balance
+    max_drawdown = 0.0
+    trades = steps = 0
+    holding = False
+    while True:
+        action = runtime.predict(obs, episode_start=steps == 0)
+        obs, equity, terminated, truncated, _ = env.step(action)
+        steps += 1
+        if holding != (env.crypto_held > 0):
+            holding = not holding
+            trades += 1
+        peak = max(peak, equity)
+        max_drawdown = max(max_drawdown, (peak - equity) / peak if peak else 0.0)
+        if terminated or truncated:
+            break
+    return {
+        "return": equity / initial - 1.0,
+        "max_drawdown": max_drawdown,
+        "trades": trades,
+        "steps": steps,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def evaluate_checkpoint(model_path, vecnorm_path, start=None, end=None, symbol=None, db_path=None):
+    """Exports an sb3 checkpoint next to itself (policy.pt) and evaluates that export."""
+    from export_policy import export_policy, load_sb3_model, load_vec_normalize
+
+    policy_path = os.path.join(os.path.dirname(model_path), "policy.pt")
+    export_policy(load_sb3_model(model_path), load_vec_normalize(vecnorm_path), policy_path)
+    return evaluate_exported(policy_path, start, end, symbol, db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate an exported policy on held-out bars")
+    parser.add_argument("--policy", default=config.POLICY_EXPORT_PATH)
+    parser.add_argument("--holdout", type=float, default=config.EVAL_HOLDOUT_FRACTION,
+                        help="evaluate on the newest fraction of bars")
+    parser.add_argument("--symbol", default=config.SYMBOL)
+    parser.add_argument("--model", help="sb3 checkpoint to export and evaluate instead of --policy")
+    parser.add_argument("--vecnorm", help="VecNormalize stats saved with --model")
+    parser.add_argument("--start", type=int, help="first held-out bar (ms); overrides --holdout")
+    parser.add_argument("--output", help="also write the metrics to this JSON file")
+    args = parser.parse_args()
+    if args.model and not args.vecnorm:
+        parser.error("--model needs --vecnorm")
+
+    start = args.start if args.start is not None else holdout_split(args.holdout, args.symbol)
+    source = args.model or args.policy
+    info(f"🧪 Evaluating {source} on {args.symbol} from {start if start is not None else 'the first bar'}")
+    if args.model:
+        result = evaluate_checkpoint(args.model, args.vecnorm, start=start, symbol=args.symbol)
+    else:
+        result = evaluate_exported(args.policy, start=start, symbol=args.symbol)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+    success(f"✅ Return {result['return']:+.2%} | max drawdown {result['max_drawdown']:.2%} | "
+            f"{result['trades']} trades over {result['steps']} bars ({result['seconds']:.1f}s)")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
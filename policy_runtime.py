@@ -0,0 +1,96 @@
+import json
+import time
+import numpy as np
+import torch
+import tracing
+import metrics
+
+# Minimal CPU runtime for policies exported by export_policy.py.
+# Only needs torch + numpy: no stable-baselines3, sb3_contrib or gymnasium import.
+
+META_FILE = "meta.json"
+
+INFERENCE_SECONDS = metrics.histogram("policy_inference_seconds", "TorchScript policy forward pass (whole batch)")
+INFERENCE_ROWS = metrics.counter("policy_inference_rows_total", "Observations run through the policy")
+
+
+class PolicyRuntime:
+    """
+    Holds the TorchScript policy and the LSTM state between calls.
+    predict() takes a raw (un-normalized) observation, exactly like the env returns it.
+    num_threads changes torch's process-wide intra-op pool, so it is only applied when given
+    (by an entry point that owns the process); None leaves torch's setting alone.
+    """
+
+    def __init__(self, path, n_envs=1, num_threads=None):
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        extra_files = {META_FILE: ""}
+        self.module = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+        self.module.eval()
+        self.meta = json.loads(extra_files[META_FILE])
+
+        self.recurrent = self.meta["recurrent"]
+        self.obs_dim = self.meta["obs_dim"]
+        self.n_envs = n_envs
+        self.last_logits = None
+
+        state_shape = (self.meta["lstm_layers"], n_envs, self.meta["lstm_hidden"])
+        self._h = torch.zeros(state_shape)
+        self._c = torch.zeros(state_shape)
+        self._obs = torch.zeros((n_envs, self.obs_dim))
+        self._episode_start = torch.ones(n_envs)
+
+    def reset(self):
+        with torch.inference_mode():  # _h/_c are inference tensors once a forward pass replaced them
+            self._h.zero_()
+            self._c.zero_()
+            self._episode_start.fill_(1.0)
+
+    def predict(self, obs, episode_start=False):
+        """Single observation -> int action. Keeps the recurrent state for the next call."""
+        return int(self.predict_batch(np.asarray(obs, dtype=np.float32).reshape(1, -1), episode_start)[0])
+
+    def predict_batch(self, obs, episode_start=False):
+        """obs: float32 [n_envs, obs_dim] -> int64 actions [n_envs]. episode_start: bool or per-row bools."""
+        self._obs.copy_(torch.from_numpy(np.asarray(obs, dtype=np.float32)))
+        if np.any(episode_start):
+            starts = np.broadcast_to(np.asarray(episode_start, dtype=np.float32), (self.n_envs,))
+            self._episode_start.copy_(torch.from_numpy(starts.copy()))
+
+        started = time.perf_counter()
+        with tracing.span("inference"), torch.inference_mode():
+            action, logits, h, c = self.module(self._obs, self._h, self._c, self._episode_start)
+        INFERENCE_SECONDS.observe(time.perf_counter() - started)
+        INFERENCE_ROWS.inc(self.n_envs)
+
+        self._h, self._c = h, c
+        self._episode_start.fill_(0.0)
+        self.last_logits = logits.numpy()
+        return action.numpy()
+
+    def predict_rows(self, rows, obs, episode_start=None):
+        """
+        Forward pass for a subset of the n_envs state rows (e.g. the symbols due on this bar):
+        obs float32 [len(rows), obs_dim] -> int64 actions [len(rows)]. The other rows' LSTM
+        state is left untouched. episode_start: None or per-row bools.
+        """
+        index = torch.as_tensor(rows, dtype=torch.long)
+        obs = torch.from_numpy(np.ascontiguousarray(obs, dtype=np.float32))
+        if episode_start is None:
+            starts = torch.zeros(len(rows))
+        else:
+            starts = torch.from_numpy(np.asarray(episode_start, dtype=np.float32))
+
+        started = time.perf_counter()
+        with tracing.span("inference"), torch.inference_mode():
+            h = self._h.index_select(1, index)
+            c = self._c.index_select(1, index)
+            action, logits, h, c = self.module(obs, h, c, starts)
+            self._h.index_copy_(1, index, h)
+            self._c.index_copy_(1, index, c)
+        INFERENCE_SECONDS.observe(time.perf_counter() - started)
+        INFERENCE_ROWS.inc(len(rows))
+
+        self.last_logits = logits.numpy()
+        return action.numpy()
@@ -0,0 +1,377 @@
+import json
+import hmac
+import time
+import hashlib
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from bybit_client import get_client, set_leverage
+from market_data import get_market_price
+from risk_engine import get_risk_engine
+from log_utils import info, success, warn, error
+
+CATEGORY = "linear"
+BATCH_LIMIT = 10  # /v5/order/create-batch accepts at most 10 linear orders per request
+BYBIT_HOSTS = ("bybit.com", "bytick.com")  # REST hosts whose private stream is BYBIT_WS_PRIVATE_URL
+PRIVATE_HEARTBEAT_SECONDS = 20
+
+
+def calculate_tp_sl(entry_price, direction):
+    if direction == "Buy":
+        stop_loss_price = entry_price * (1 - config.STOP_LOSS_PERCENT / 100)
+        take_profit_price = entry_price * (1 + config.TAKE_PROFIT_PERCENT / 100)
+    else:
+        stop_loss_price = entry_price * (1 + config.STOP_LOSS_PERCENT / 100)
+        take_profit_price = entry_price * (1 - config.TAKE_PROFIT_PERCENT / 100)
+    return round(take_profit_price, 2), round(stop_loss_price, 2)
+
+
+# === In-memory position book ===
+class PositionBook:
+    """
+    Latest known position per symbol, in the same shape as /v5/position/list entries.
+    Fed by the private websocket (position + execution topics); each update swaps in a
+    new dict, so get() is a lock-free lookup. Symbols are marked stale when the stream
+    is down and we traded them ourselves; a stale read falls back to one REST call.
+    """
+
+    def __init__(self):
+        self._positions = {}
+        self._seq = {}
+        self._stale = set()
+        self.live = threading.Event()  # private stream connected and authenticated
+
+    def sync_rest(self, symbol=None):
+        params = {"category": CATEGORY, "symbol": symbol} if symbol else {"category": CATEGORY, "settleCoin": "USDT"}
+        data = get_client().get("/v5/position/list", params, signed=True)
+        if data.get("retCode") != 0:
+            error(f"❌ Position sync failed: {data.get('retMsg')}")
+            return False
+        returned = set()
+        risk = get_risk_engine()
+        for position in data["result"]["list"]:
+            self._positions[position["symbol"]] = position
+            returned.add(position["symbol"])
+            risk.on_position(position["symbol"], position.get("size"), position.get("side"),
+                             position.get("avgPrice"), position.get("markPrice"))
+        # Bybit omits flat positions from the settleCoin listing
+        missing = ({symbol} if symbol else set(self._positions)) - returned
+        for flat in missing:
+            self._positions[flat] = {"symbol": flat, "size": "0", "side": ""}
+            risk.on_position(flat, 0, "", 0)
+        self._stale -= returned | missing
+        return True
+
+    def get(self, symbol):
+        position = self._positions.get(symbol)
+        if position is None or symbol in self._stale:
+            self.sync_rest(symbol)
+            position = self._positions.get(symbol, {})
+        return position
+
+    def size(self, symbol):
+        position = self.get(symbol)
+        return float(position.get("size", 0) or 0), position.get("side", "")
+
+    def open_symbols(self):
+        if self._stale:
+            self.sync_rest()
+        return [s for s, p in self._positions.items() if float(p.get("size", 0) or 0) > 0]
+
+    def mark_traded(self, symbols):
+        """Called after our own orders: without the stream we cannot see the fill, so force a refresh."""
+        if not self.live.is_set():
+            self._stale.update(symbols)
+
+    def invalidate_all(self):
+        self._stale.update(self._positions)
+
+    # === Execution reports ===
+    def apply_position(self, update):
+        symbol = update["symbol"]
+        seq = int(update.get("seq", 0) or 0)
+        if seq and seq < self._seq.get(symbol, 0):
+            return  # out-of-order message
+        self._seq[symbol] = seq
+        position = dict(self._positions.get(symbol, {}))
+        position.update(update)
+        if "entryPrice" in update:
+            position["avgPrice"] = update["entryPrice"]  # websocket and REST name the field differently
+        self._positions[symbol] = position
+        self._stale.discard(symbol)
+        get_risk_engine().on_position(symbol, position.get("size"), position.get("side"),
+                                      position.get("avgPrice"), position.get("markPrice"))
+
+    def apply_execution(self, execution):
+        """Moves the book on each fill right away; the following position message overwrites it."""
+        if execution.get("execType", "Trade") != "Trade":
+            return
+        symbol = execution["symbol"]
+        position = dict(self._positions.get(symbol, {"symbol": symbol, "size": "0", "side": ""}))
+        size = float(position.get("size", 0) or 0)
+        signed = size if position.get("side") == "Buy" else -size
+        qty = float(execution["execQty"])
+        price = float(execution["execPrice"])
+        get_risk_engine().on_fill(symbol, execution["side"], qty, price, float(execution.get("execFee", 0) or 0))
+        delta = qty if execution["side"] == "Buy" else -qty
+        new_signed = round(signed + delta, 8)  # size and side both derive from the rounded value (0.1+0.2-0.3 is flat)
+
+        if signed == 0 or (signed > 0) == (delta > 0):
+            avg = float(position.get("avgPrice", 0) or 0)
+            position["avgPrice"] = str((avg * abs(signed) + price * qty) / abs(new_signed))
+        elif (signed > 0) != (new_signed > 0) and new_signed != 0:
+            position["avgPrice"] = str(price)  # flipped through zero
+        position["size"] = str(abs(new_signed))
+        position["side"] = "" if new_signed == 0 else ("Buy" if new_signed > 0 else "Sell")
+        self._positions[symbol] = position
+
+
+class _PrivateStream:
+    """Authenticated v5 private stream: position + execution topics drive the PositionBook."""
+
+    def __init__(self, book, url):
+        self.book = book
+        self.url = url
+        self.ws = None
+        self.authenticated = False
+
+    def _auth_message(self):
+        client = get_client()
+        expires = client.clock.now_ms() + 10_000
+        signature = hmac.new(
+            client.api_secret.encode("utf-8"), f"GET/realtime{expires}".encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+        return {"op": "auth", "args": [client.api_key, expires, signature]}
+
+    def _on_open(self, ws):
+        ws.send(json.dumps(self._auth_message()))
+
+    def _on_message(self, ws, raw):
+        message = json.loads(raw)
+        if message.get("op") == "auth":
+            if message.get("success"):
+                self.authenticated = True
+                ws.send(json.dumps({"op": "subscribe", "args": ["position.linear", "execution.linear"]}))
+                self.book.sync_rest()  # resync anything missed while disconnected
+                self.book.live.set()
+                info("🔐 Private stream authenticated, position book is live")
+            else:
+                error(f"❌ Private stream auth failed: {message.get('ret_msg')}")
+            return
+        topic = message.get("topic", "")
+        if topic.startswith("position"):
+            for update in message.get("data", []):
+                self.book.apply_position(update)
+        elif topic.startswith("execution"):
+            for execution in message.get("data", []):
+                self.book.apply_execution(execution)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(PRIVATE_HEARTBEAT_SECONDS)
+            if self.book.live.is_set():
+                try:
+                    self.ws.send(json.dumps({"op": "ping"}))
+                except Exception as e:
+                    warn(f"⚠️ Private stream ping failed: {e}")
+
+    def run(self):
+        import websocket  # websocket-client
+
+        threading.Thread(target=self._heartbeat, name="private-ws-ping", daemon=True).start()
+        backoff = 1
+        while True:
+            self.authenticated = False
+            self.ws = websocket.WebSocketApp(
+                self.url, on_open=self._on_open, on_message=self._on_message,
+                on_error=lambda ws, e: warn(f"⚠️ Private stream error: {e}")
+            )
+            self.ws.run_forever()
+            if self.authenticated:
+                backoff = 1  # the session worked; only back off on consecutive failures
+            self.book.live.clear()
+            self.book.invalidate_all()  # TP/SL may fire while we are blind
+            warn(f"⚠️ Private stream disconnected, reconnecting in {backoff}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+# === Execution engine ===
+class PortfolioEngine:
+    """
+    Runs order flows for many symbols at once. Flows for different symbols run in
+    parallel; flows touching the same symbol are serialized by a per-symbol lock.
+    Orders from one call are packed into /v5/order/create-batch requests.
+    """
+
+    def __init__(self, max_workers=8):
+        self.book = PositionBook()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="portfolio")
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._stream_started = False
+
+    def start_stream(self):
+        if self._stream_started or not config.PORTFOLIO_PRIVATE_STREAM:
+            return
+        client = get_client()
+        if not client.api_key or not client.api_secret:
+            warn("⚠️ No Bybit API credentials, private stream not started (positions come from REST)")
+            return
+        host = urlparse(client.base_url).hostname or ""
+        if not host.endswith(BYBIT_HOSTS):
+            # e.g. exchange_sim: its keys would be sent to the real Bybit stream
+            warn(f"⚠️ REST base URL {client.base_url} is not Bybit, private stream not started (positions come from REST)")
+            return
+        self._stream_started = True
+        stream = _PrivateStream(self.book, config.BYBIT_WS_PRIVATE_URL)
+        threading.Thread(target=stream.run, name="private-ws", daemon=True).start()
+
+    def _lock_for(self, symbol):
+        with self._locks_guard:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def _acquire(self, symbols):
+        locks = [self._lock_for(symbol) for symbol in sorted(set(symbols))]  # fixed order: no deadlocks
+        for lock in locks:
+            lock.acquire()
+        return locks
+
+    # === Batch orders ===
+    def place_batch(self, orders):
+        """Sends orders in chunks of BATCH_LIMIT; returns one (ok, detail) per order, in input order."""
+        results = []
+        for start in range(0, len(orders), BATCH_LIMIT):
+            chunk = orders[start:start + BATCH_LIMIT]
+            if len(chunk) == 1:
+                data = get_client().post("/v5/order/create", chunk[0])
+                results.append((data.get("retCode") == 0, data.get("result") or data.get("retMsg")))
+                continue
+            request = [{k: v for k, v in order.items() if k != "category"} for order in chunk]
+            data = get_client().post("/v5/order/create-batch", {"category": CATEGORY, "request": request})
+            if data.get("retCode") != 0:
+                results.extend((False, data.get("retMsg")) for _ in chunk)
+                continue
+            acks = (data.get("result") or {}).get("list") or []
+            codes = (data.get("retExtInfo") or {}).get("list")
+            if codes is None:
+                codes = [{"code": 0}] * len(acks)
+            for i in range(len(chunk)):
+                # A short list must not shift later orders' results: a missing entry is a failure
+                ack = acks[i] if i < len(acks) else None
+                code = codes[i] if i < len(codes) else None
+                if ack is None or code is None:
+                    results.append((False, "no result for this order in the batch response"))
+                elif code.get("code") == 0:
+                    results.append((True, ack))
+                else:
+                    results.append((False, code.get("msg")))
+        info(f"📤 BATCH: {sum(ok for ok, _ in results)}/{len(orders)} orders accepted")
+        return results
+
+    # === Flows ===
+    def _prepare_open(self, symbol, side, usdt_amount, leverage):
+        size, _ = self.book.size(symbol)
+        if size > 0:
+            return None, "⚠️ Position already open!"
+
+        price = get_market_price(symbol, 1.0)
+        if not price:
+            return None, "⚠️ Market price fetch error!"
+
+        usdt_after_fee = usdt_amount * (1 - config.TRADING_FEE_PERCENT / 100)
+        qty = round((usdt_after_fee * leverage) / price, 3)
+        if qty <= 0:
+            return None, "⚠️ Calculated qty is zero!"
+
+        ok, reason = get_risk_engine().check_order(symbol, side, usdt_after_fee * leverage, leverage)
+        if not ok:
+            return None, reason
+
+        # Only an order that passed every check may change the account's leverage
+        current_leverage = float(self.book.get(symbol).get("leverage", 0) or 0)
+        if current_leverage != leverage:
+            ok, msg = set_leverage(symbol, leverage)
+            if not ok:
+                return None, f"⚠️ Leverage setting failed: {msg}"
+
+        tp, sl = calculate_tp_sl(price, side)
+        return {
+            "category": CATEGORY, "symbol": symbol, "side": side, "orderType": "Market",
+            "qty": str(qty), "timeInForce": "GoodTillCancel", "reduceOnly": False,
+            "takeProfit": str(tp), "stopLoss": str(sl), "tpslMode": "Full"
+        }, price
+
+    def open_positions(self, intents):
+        """
+        intents: list of (symbol, side, usdt_amount, leverage).
+        Per-symbol checks (book, leverage, price) run concurrently, then all orders go out batched.
+        Returns {symbol: (ok, message)}.
+        """
+        symbols = [intent[0] for intent in intents]
+        locks = self._acquire(symbols)
+        try:
+            prepared = list(self._pool.map(lambda intent: (intent, self._prepare_open(*intent)), intents))
+            results = {}
+            orders = []
+            for (symbol, side, _, _), (order, detail) in prepared:
+                if order is None:
+                    results[symbol] = (False, detail)
+                else:
+                    orders.append(order)
+
+            for order, (ok, detail) in zip(orders, self.place_batch(orders)):
+                symbol = order["symbol"]
+                if ok:
+                    results[symbol] = (True, f"{order['side']} {order['qty']} {symbol} | TP {order['takeProfit']} | SL {order['stopLoss']}")
+                else:
+                    error(f"❌ {symbol} order failed: {detail}")
+                    results[symbol] = (False, f"⚠️ Order placement failed: {detail}")
+            self.book.mark_traded([order["symbol"] for order in orders])
+            return results
+        finally:
+            for lock in locks:
+                lock.release()
+
+    def close_positions(self, symbols=None):
+        """Market reduce-only close for the given symbols (default: everything open in the book)."""
+        symbols = symbols or self.book.open_symbols()
+        locks = self._acquire(symbols)
+        try:
+            results = {}
+            orders = []
+            for symbol in symbols:
+                size, side = self.book.size(symbol)
+                if size == 0 or side == "":
+                    results[symbol] = (False, "⚠️ No open position to close!")
+                    continue
+                orders.append({
+                    "category": CATEGORY, "symbol": symbol, "side": "Sell" if side == "Buy" else "Buy",
+                    "orderType": "Market", "qty": str(size), "timeInForce": "GoodTillCancel", "reduceOnly": True
+                })
+            for order, (ok, detail) in zip(orders, self.place_batch(orders)):
+                results[order["symbol"]] = (ok, detail)
+            self.book.mark_traded([order["symbol"] for order in orders])
+            closed = sum(ok for ok, _ in results.values())
+            if closed:
+                success(f"🔒 Closed {closed}/{len(symbols)} positions")
+            return results
+        finally:
+            for lock in locks:
+                lock.release()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = PortfolioEngine()
+                _engine.start_stream()
+    return _engine
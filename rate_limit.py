@@ -0,0 +1,197 @@
+import time
+import threading
+import tracing
+from log_utils import warn
+
+# === Bybit v5 limits per endpoint group: (requests per second, burst) ===
+# Private endpoints are limited per UID, market data per IP (600 req / 5 s).
+ENDPOINT_GROUPS = {
+    "/v5/order/": ("order", 10, 10),
+    "/v5/position/set-leverage": ("position_write", 10, 10),
+    "/v5/position/trading-stop": ("position_write", 10, 10),
+    "/v5/position/": ("position_read", 50, 50),
+    "/v5/account/": ("account", 50, 50),
+    "/v5/market/": ("market", 100, 120),
+}
+DEFAULT_GROUP = ("default", 10, 10)
+
+RATE_LIMIT_RET_CODE = 10006  # "Too many visits"
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.25          # seconds, doubled on every retry
+MAX_RETRY_WAIT = 5.0         # never sleep longer than this for a single retry
+
+
+class TokenBucket:
+    """
+    Classic token bucket, corrected from Bybit's X-Bapi-Limit-* response headers:
+    the server's remaining quota caps the local token count and an exhausted
+    window blocks the bucket until X-Bapi-Limit-Reset-Timestamp.
+    """
+
+    def __init__(self, name, rate, capacity):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self):
+        """Seconds until one token is available (0 if one is available now)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            blocked = max(0.0, self._blocked_until - now)
+            missing = max(0.0, 1.0 - self._tokens) / self.rate
+            return max(blocked, missing)
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return True
+                wait = max(self._blocked_until - now, (1.0 - self._tokens) / self.rate)
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def update_from_headers(self, headers):
+        try:
+            remaining = headers.get("X-Bapi-Limit-Status")
+            reset_ms = headers.get("X-Bapi-Limit-Reset-Timestamp")
+        except AttributeError:
+            return
+        if remaining is None:
+            return
+        try:  # a malformed header must not fail a response that otherwise succeeded
+            remaining = float(remaining)
+            reset_at = int(reset_ms) / 1000 if reset_ms else None
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._tokens = min(self._tokens, remaining)
+            if remaining <= 0 and reset_at is not None:
+                delay = max(0.0, reset_at - time.time())
+                self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+
+    def block_for(self, seconds):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def group_for(path):
+    for prefix, group in ENDPOINT_GROUPS.items():
+        if path.startswith(prefix):
+            return group
+    return DEFAULT_GROUP
+
+
+def get_limiter(path):
+    name, rate, capacity = group_for(path)
+    bucket = _buckets.get(name)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.setdefault(name, TokenBucket(name, rate, capacity))
+    return bucket
+
+
+def is_rate_limited(response, data):
+    if response.status_code == 429:
+        return True
+    return isinstance(data, dict) and data.get("retCode") == RATE_LIMIT_RET_CODE
+
+
+def parse_response(response):
+    """JSON body, or a retCode/retMsg dict carrying the HTTP status when the body is not JSON (HTML, empty)."""
+    try:
+        return response.json()
+    except ValueError:
+        body = (response.text or "").strip().replace("\n", " ")[:200]
+        return {"retCode": response.status_code, "retMsg": f"HTTP {response.status_code}: {body or 'empty body'}"}
+
+
+def request_with_limits(path, send):
+    """
+    send() performs the HTTP call and returns a requests.Response; it is invoked again
+    on retry, so it must rebuild anything time-sensitive (e.g. signatures).
+    Retries only rate-limit rejections, and only while the limiter's wait stays short.
+    HTTP 403 means an IP ban on Bybit and is never retried.
+    """
+    limiter = get_limiter(path)
+    for attempt in range(MAX_RETRIES + 1):
+        with tracing.span("rate_limit_wait"):
+            limiter.acquire()
+        response = send()
+        limiter.update_from_headers(response.headers)
+        if response.status_code == 403:
+            data = parse_response(response)
+            warn(f"⚠️ HTTP 403 on {path} (IP ban?), not retrying: {data.get('retMsg') if isinstance(data, dict) else data}")
+            return data
+        data = parse_response(response)
+
+        if not is_rate_limited(response, data) or attempt == MAX_RETRIES:
+            return data
+
+        backoff = BACKOFF_BASE * (2 ** attempt)
+        limiter.block_for(backoff)
+        delay = limiter.wait_time()
+        if delay > MAX_RETRY_WAIT:
+            warn(f"⚠️ Rate limited on {path}, limiter wait {delay:.1f}s is too long — giving up")
+            return data
+        warn(f"⚠️ Rate limited on {path}, retry {attempt + 1}/{MAX_RETRIES} in {delay:.2f}s")
+    return data
+
+
+# === Request coalescing ===
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution and its result."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
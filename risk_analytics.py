@@ -0,0 +1,227 @@
+import math
+import time
+import sqlite3
+import threading
+from collections import namedtuple
+from statistics import NormalDist
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import config
+from log_utils import info, warn
+
+# === VaR / ES / volatility over the stored OHLCV history ===
+# Returns are simple close-to-close returns at the requested interval. Losses are reported
+# as positive fractions of notional (0.012 = 1.2% one-bar loss).
+
+RiskStats = namedtuple("RiskStats", [
+    "var_hist", "es_hist", "var_param", "es_param", "volatility", "bars", "last_timestamp"
+])
+
+CHUNK_WINDOWS = 4096        # windows partitioned per numpy call; bounds memory to CHUNK_WINDOWS * window floats
+REFRESH_MIN_SECONDS = 30    # how often the background refresher polls the DB for new bars
+LOAD_SPAN_WINDOWS = 2       # first load reads this many windows back from the newest bar (room for gaps)
+
+
+def rolling_risk(returns, window, confidence=None):
+    """
+    Vectorized rolling historical + parametric (normal) VaR / ES and volatility.
+    Returns a dict of arrays of length len(returns) - window + 1 (one value per full window).
+    """
+    confidence = config.RISK_CONFIDENCE if confidence is None else confidence
+    returns = np.asarray(returns, dtype=np.float64)
+    n_windows = len(returns) - window + 1
+    if n_windows <= 0:
+        raise ValueError(f"need at least {window} returns, got {len(returns)}")
+
+    # Parametric: rolling mean / std from cumulative sums, O(n)
+    csum = np.concatenate(([0.0], np.cumsum(returns)))
+    csq = np.concatenate(([0.0], np.cumsum(returns * returns)))
+    mean = (csum[window:] - csum[:-window]) / window
+    var = np.maximum((csq[window:] - csq[:-window]) / window - mean * mean, 0.0) * window / (window - 1)
+    std = np.sqrt(var)
+    z = NormalDist().inv_cdf(confidence)
+    tail_density = math.exp(-z * z / 2) / math.sqrt(2 * math.pi) / (1 - confidence)
+
+    # Historical: the k smallest returns of each window via np.partition, chunked
+    k = max(1, int(math.floor((1 - confidence) * window)))
+    windows = sliding_window_view(returns, window)
+    var_hist = np.empty(n_windows)
+    es_hist = np.empty(n_windows)
+    for start in range(0, n_windows, CHUNK_WINDOWS):
+        block = np.partition(windows[start:start + CHUNK_WINDOWS], k - 1, axis=1)[:, :k]
+        var_hist[start:start + len(block)] = -block.max(axis=1)
+        es_hist[start:start + len(block)] = -block.mean(axis=1)
+
+    return {
+        "var_hist": var_hist,
+        "es_hist": es_hist,
+        "var_param": -(mean - z * std),
+        "es_param": -(mean - std * tail_density),
+        "volatility": std,
+    }
+
+
+class _Series:
+    __slots__ = ("returns", "last_close", "last_timestamp", "stats", "checked")
+
+    def __init__(self):
+        self.returns = np.empty(0)
+        self.last_close = None
+        self.last_timestamp = None
+        self.stats = None
+        self.checked = 0.0
+
+
+class RiskAnalytics:
+    """
+    Per-(symbol, interval, window) cache of the latest RiskStats. Sizing lookups read the
+    cache (a cold key is loaded once, see cached()); a background thread (start()) and the
+    pipeline's features stage refresh it. A refresh pulls the bars newer than the cached
+    timestamp through the (symbol, timestamp) index and recomputes the last window, so a
+    warm order path never touches SQLite.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or config.DB_PATH
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    @staticmethod
+    def _key(symbol, interval=None, window=None):
+        return symbol, int(interval or config.INTERVAL), int(window or config.RISK_WINDOW)
+
+    def _load_closes(self, symbol, interval, after_ts=None, window=None):
+        # Bars are stored at config.INTERVAL (Bybit kline interval, minutes); a coarser interval samples bars on its boundaries
+        step_ms = int(interval) * 60_000
+        conn = sqlite3.connect(self.db_path)
+        try:
+            if after_ts is None:
+                newest = conn.execute("SELECT MAX(timestamp) FROM ohlcv WHERE symbol = ?", (symbol,)).fetchone()[0]
+                if newest is None:
+                    return np.empty(0, dtype=np.int64), np.empty(0)
+                after_ts = newest - LOAD_SPAN_WINDOWS * (window + 1) * step_ms
+            # Range on the index first; the boundary filter only sees the bars in that range
+            rows = conn.execute(
+                "SELECT timestamp, close FROM ohlcv WHERE symbol = ? AND timestamp > ? AND timestamp % ? = 0 "
+                "ORDER BY timestamp", (symbol, int(after_ts), step_ms)
+            ).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        data = np.asarray(rows, dtype=np.float64)
+        return data[:, 0].astype(np.int64), data[:, 1]
+
+    def _append(self, series, timestamps, closes, window):
+        if not len(closes):
+            return False
+        if series.last_close is not None:
+            closes = np.concatenate(([series.last_close], closes))
+        new_returns = closes[1:] / closes[:-1] - 1.0
+        series.returns = np.concatenate((series.returns, new_returns))[-window:]
+        series.last_close = float(closes[-1])
+        series.last_timestamp = int(timestamps[-1])
+        return True
+
+    def refresh(self, symbol, interval=None, window=None, force=False):
+        """Pulls new bars into the cache and returns the latest RiskStats (None without enough history)."""
+        key = self._key(symbol, interval, window)
+        _, interval, window = key
+        now = time.monotonic()
+
+        with self._lock:
+            series = self._cache.get(key)
+            if series is not None and not force and now - series.checked < REFRESH_MIN_SECONDS:
+                return series.stats
+
+            if series is None:
+                series = _Series()
+                timestamps, closes = self._load_closes(symbol, interval, window=window)
+            else:
+                timestamps, closes = self._load_closes(symbol, interval, series.last_timestamp)
+            if self._append(series, timestamps, closes, window) and len(series.returns) >= window:
+                last = {name: float(values[-1]) for name, values in rolling_risk(series.returns, window).items()}
+                series.stats = RiskStats(bars=window, last_timestamp=series.last_timestamp, **last)
+
+            series.checked = now
+            self._cache[key] = series
+            if series.stats is None:
+                warn(f"⚠️ Not enough history for {symbol} risk stats ({len(series.returns)}/{window} returns)", rate=60)
+            return series.stats
+
+    def cached(self, symbol, interval=None, window=None):
+        """
+        Latest RiskStats from memory. A key nobody warmed yet (e.g. the first order after a
+        start without warm-up) is loaded once, synchronously, rather than sized blind; the
+        refresher keeps it fresh from then on.
+        """
+        key = self._key(symbol, interval, window)
+        series = self._cache.get(key)
+        if series is None:
+            self.start()
+            return self.refresh(*key)
+        return series.stats
+
+    # === Background refresh ===
+    def start(self, symbols=()):
+        """Warms `symbols` (at config.INTERVAL / RISK_WINDOW) and keeps every cached key fresh."""
+        for symbol in symbols:
+            self._cache.setdefault(self._key(symbol), None)
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refresh_loop, name="risk-refresh", daemon=True)
+                self._thread.start()
+        return self
+
+    def _refresh_loop(self):
+        while True:
+            for key in list(self._cache):
+                try:
+                    self.refresh(*key, force=True)
+                except Exception as e:
+                    warn(f"⚠️ Risk stats refresh failed for {key[0]}: {e}", rate=60)
+            time.sleep(REFRESH_MIN_SECONDS)
+
+    def position_size(self, symbol, equity, interval=None, window=None):
+        """
+        Target notional (USDT) for one position:
+          VaR budget:  equity * RISK_PERCENT%  /  one-bar historical VaR
+          vol target:  equity * VOL_TARGET_PERCENT% / annualized volatility
+        The smaller of the two, capped at MAX_LEVERAGE x equity. None without enough history.
+        """
+        stats = self.cached(symbol, interval, window)
+        if stats is None or equity <= 0:
+            return None
+        interval = interval or config.INTERVAL
+        bars_per_year = 365 * 24 * 60 / int(interval)
+
+        var = max(stats.var_hist, stats.var_param, 1e-6)
+        by_var = equity * config.RISK_PERCENT / 100 / var
+        annual_vol = max(stats.volatility * math.sqrt(bars_per_year), 1e-6)
+        by_vol = equity * config.VOL_TARGET_PERCENT / 100 / annual_vol
+        return min(by_var, by_vol, equity * config.MAX_LEVERAGE)
+
+    def target_leverage(self, symbol, equity, margin, interval=None, window=None):
+        """Leverage that turns `margin` USDT into the target notional, clamped to 1..MAX_LEVERAGE (1 without history)."""
+        notional = self.position_size(symbol, equity, interval, window)
+        if not notional or margin <= 0:
+            return 1
+        return max(1, min(config.MAX_LEVERAGE, int(notional / margin)))
+
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+
+def get_risk_analytics():
+    global _analytics
+    if _analytics is None:
+        with _analytics_lock:
+            if _analytics is None:
+                _analytics = RiskAnalytics()
+                info("📐 Risk analytics cache ready")
+    return _analytics
@@ -0,0 +1,265 @@
+import time
+import atexit
+import threading
+from datetime import datetime, timezone
+
+import config
+import tracing
+from risk_utils import load_risk_state
+from state_store import get_state_store
+from log_utils import info, warn, error
+
+# === Resident risk engine ===
+# Equity, peak, per-symbol and gross exposure and daily-loss counters live in memory and
+# are updated incrementally from fills, position snapshots and price ticks. Pre-trade
+# checks are a handful of float comparisons under one lock. The state is persisted to the
+# shared state store by a background thread when something changed (and once more at exit).
+# Every process (webhook, job workers) runs its own engine, so the peak is max-merged in
+# the store: a process with a stale view can never move it backwards.
+
+PERSIST_INTERVAL = 1.0  # seconds
+RISK_NS = "risk"
+
+
+class _Exposure:
+    __slots__ = ("qty", "avg_price", "mark_price")
+
+    def __init__(self, qty=0.0, avg_price=0.0, mark_price=0.0):
+        self.qty = qty              # signed: > 0 long, < 0 short
+        self.avg_price = avg_price
+        self.mark_price = mark_price
+
+    @property
+    def notional(self):
+        return abs(self.qty) * self.mark_price
+
+    @property
+    def unrealized(self):
+        return self.qty * (self.mark_price - self.avg_price)
+
+
+class RiskEngine:
+    def __init__(self, store=None):
+        self._store = store or get_state_store()
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._positions = {}
+        self.wallet = 0.0
+        self.unrealized = 0.0
+        self.gross_exposure = 0.0
+        self.peak_equity = 0.0
+        self.day = None
+        self.day_start_equity = 0.0
+        self.realized_today = 0.0
+        self._load()
+        threading.Thread(target=self._persist_loop, name="risk-persist", daemon=True).start()
+        atexit.register(self.flush)
+
+    # === Persistence ===
+    def _load(self):
+        state = self._store.get(RISK_NS, "state")
+        if state is None:
+            state = load_risk_state()  # one-time import of the pre-store JSON file
+            if state:
+                self._dirty.set()
+        state = state or {}
+        self.peak_equity = max(float(state.get("peak_equity", 0.0)),
+                               float(self._store.get(RISK_NS, "peak_equity", 0.0)))
+        self.day = state.get("day")
+        self.day_start_equity = float(state.get("day_start_equity", 0.0))
+        self.realized_today = float(state.get("realized_today", 0.0))
+        self.wallet = float(state.get("equity", 0.0))
+
+    def _state(self):
+        return {
+            "equity": self.equity,
+            "day": self.day,
+            "day_start_equity": self.day_start_equity,
+            "realized_today": self.realized_today,
+            "gross_exposure": self.gross_exposure,
+        }
+
+    def _persist_loop(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(PERSIST_INTERVAL)  # coalesce bursts of updates into one write
+            self.flush()
+
+    def flush(self):
+        if not self._dirty.is_set():
+            return
+        self._dirty.clear()
+        with self._lock:
+            state, peak = self._state(), self.peak_equity
+        try:
+            self._store.set(RISK_NS, "state", state)
+            peak = self._store.set_max(RISK_NS, "peak_equity", peak)
+        except Exception as e:
+            error(f"❌ Could not persist risk state: {e}")
+            return
+        with self._lock:
+            if peak > self.peak_equity:
+                self.peak_equity = peak  # another process saw a higher equity
+
+    # === Incremental updates ===
+    @property
+    def equity(self):
+        return self.wallet + self.unrealized
+
+    def _roll_day(self):
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        if today != self.day:
+            self.day = today
+            self.day_start_equity = self.equity
+            self.realized_today = 0.0
+
+    def _set_exposure(self, symbol, qty, avg_price, mark_price):
+        position = self._positions.get(symbol)
+        if position is None:
+            position = self._positions[symbol] = _Exposure()
+        self.gross_exposure -= position.notional
+        self.unrealized -= position.unrealized
+        position.qty, position.avg_price, position.mark_price = qty, avg_price, mark_price
+        self.gross_exposure += position.notional
+        self.unrealized += position.unrealized
+        if qty == 0:
+            del self._positions[symbol]
+
+    def _touch_peak(self):
+        if self.equity > self.peak_equity:
+            self.peak_equity = self.equity
+            return True
+        return False
+
+    def on_equity(self, wallet_balance):
+        """Authoritative wallet balance (e.g. from get_usdt_balance)."""
+        with self._lock:
+            self.wallet = float(wallet_balance)
+            self._roll_day()
+            if not self.day_start_equity:
+                self.day_start_equity = self.equity
+            self._touch_peak()
+        self._dirty.set()
+
+    def on_fill(self, symbol, side, qty, price, fee=0.0):
+        with self._lock:
+            position = self._positions.get(symbol) or _Exposure(mark_price=price)
+            signed = position.qty
+            delta = qty if side == "Buy" else -qty
+            new_qty = signed + delta
+            avg = position.avg_price
+
+            if signed == 0 or (signed > 0) == (delta > 0):
+                avg = (avg * abs(signed) + price * qty) / abs(new_qty)
+            else:
+                closed = min(abs(delta), abs(signed))
+                pnl = closed * (price - avg) * (1 if signed > 0 else -1)
+                self.wallet += pnl
+                self.realized_today += pnl
+                if (new_qty > 0) != (signed > 0) and new_qty != 0:
+                    avg = price  # flipped through zero
+            self.wallet -= fee
+            self.realized_today -= fee
+            self._roll_day()
+            self._set_exposure(symbol, new_qty, avg, price)
+            self._touch_peak()
+        self._dirty.set()
+
+    def on_position(self, symbol, size, side, avg_price, mark_price=None):
+        """Absolute snapshot (REST resync / position stream) — replaces whatever fills accumulated."""
+        qty = float(size or 0) * (1 if side == "Buy" else -1)
+        with self._lock:
+            current = self._positions.get(symbol)
+            mark = float(mark_price or 0) or (current.mark_price if current else 0.0) or float(avg_price or 0)
+            self._set_exposure(symbol, qty, float(avg_price or 0), mark)
+        self._dirty.set()
+
+    def on_price(self, symbol, price):
+        with self._lock:
+            position = self._positions.get(symbol)
+            if position is None:
+                return  # flat symbols cost one dict lookup per tick
+            self._set_exposure(symbol, position.qty, position.avg_price, price)
+            new_peak = self._touch_peak()
+        if new_peak:
+            self._dirty.set()
+
+    # === Pre-trade checks ===
+    def drawdown(self):
+        peak = self.peak_equity
+        return 100 * (1 - self.equity / peak) if peak > 0 else 0.0
+
+    def daily_loss(self):
+        start = self.day_start_equity
+        return 100 * (1 - self.equity / start) if start > 0 else 0.0
+
+    def check_drawdown(self):
+        drawdown = self.drawdown()
+        if drawdown >= config.MAX_DRAWDOWN_PERCENT:
+            warn(f"🚨 Max drawdown exceeded: {drawdown:.2f}%")
+            return False, drawdown
+        return True, drawdown
+
+    @tracing.traced("risk_check")
+    def check_order(self, symbol, side, notional, leverage):
+        """
+        (ok, reason) for adding `notional` USDT of exposure on `symbol`.
+        Covers drawdown, daily loss, order leverage, per-symbol and gross exposure / leverage.
+        """
+        with self._lock:
+            equity = self.equity
+            if equity <= 0:
+                return False, "🚫 No equity"
+            drawdown = self.drawdown()
+            if drawdown >= config.MAX_DRAWDOWN_PERCENT:
+                return False, f"🚫 Trading halted due to drawdown: {drawdown:.2f}%"
+            daily_loss = self.daily_loss()
+            if daily_loss >= config.MAX_DAILY_LOSS_PERCENT:
+                return False, f"🚫 Daily loss limit hit: {daily_loss:.2f}%"
+            if leverage > config.MAX_LEVERAGE:
+                return False, f"🚫 Leverage {leverage}x above limit {config.MAX_LEVERAGE}x"
+
+            position = self._positions.get(symbol)
+            current_qty = position.qty if position else 0.0
+            current_notional = position.notional if position else 0.0
+            adding = (current_qty >= 0) == (side == "Buy")
+            symbol_after = current_notional + notional if adding else abs(current_notional - notional)
+            gross_after = self.gross_exposure - current_notional + symbol_after
+
+            if symbol_after > equity * config.MAX_SYMBOL_EXPOSURE_PERCENT / 100:
+                return False, f"🚫 {symbol} exposure {symbol_after:.2f} USDT above {config.MAX_SYMBOL_EXPOSURE_PERCENT}% of equity"
+            if gross_after / equity > config.MAX_GROSS_LEVERAGE:
+                return False, f"🚫 Gross leverage {gross_after / equity:.2f}x above {config.MAX_GROSS_LEVERAGE}x"
+        return True, None
+
+    def snapshot(self):
+        with self._lock:
+            state = self._state()
+            state["peak_equity"] = self.peak_equity
+            state["drawdown_percent"] = self.drawdown()
+            state["daily_loss_percent"] = self.daily_loss()
+            state["positions"] = {s: {"qty": p.qty, "avg": p.avg_price, "mark": p.mark_price}
+                                  for s, p in self._positions.items()}
+        return state
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_risk_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RiskEngine()
+                import market_data
+                market_data.add_price_listener(_engine.on_price)
+                info("🛡️ Risk engine loaded")
+    return _engine
+
+
+def flush():
+    """Persists pending risk state now (job workers exit via os._exit, which skips atexit)."""
+    if _engine is not None:
+        _engine.flush()
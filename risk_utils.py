@@ -1,20 +1,16 @@
 import os
 import json
 import config
-from log_utils import info, warn
+from log_utils import warn
 
 # === Шлях до JSON-файлу ===
 RISK_FILE = config.RISK_STATE_FILE
 
-# === Ініціалізація ризикового стану, якщо файл не існує ===
-def init_risk_state():
-    if not os.path.exists(RISK_FILE):
-        state = {"peak_equity": 0.0}
-        save_risk_state(state)
-        info("📁 Created new risk state file")
-
 # === Завантаження стану ===
+# Legacy file only: risk_engine imports it once into the state store. None when there is no file.
 def load_risk_state():
+    if not os.path.exists(RISK_FILE):
+        return None
     try:
         with open(RISK_FILE, 'r') as f:
             return json.load(f)
@@ -22,26 +18,12 @@ def load_risk_state():
         warn(f"⚠️ Could not load risk state: {e}")
         return {"peak_equity": 0.0}
 
-# === Збереження стану ===
-def save_risk_state(state):
-    with open(RISK_FILE, 'w') as f:
-        json.dump(state, f, indent=2)
-
 # === Перевірка просадки та оновлення ===
+# Delegates to the resident risk engine: peak/equity live in memory, the state store is written in the background.
 def check_drawdown(current_equity):
-    init_risk_state()
-    state = load_risk_state()
-    peak = state.get("peak_equity", 0.0)
-
-    if current_equity > peak:
-        state["peak_equity"] = current_equity
-        save_risk_state(state)
-        info(f"📈 New peak equity recorded: {current_equity}")
-        return True, None
-
-    drawdown = 100 * (1 - current_equity / peak) if peak > 0 else 0
-    if drawdown >= config.MAX_DRAWDOWN_PERCENT:
-        warn(f"🚨 Max drawdown exceeded: {drawdown:.2f}%")
-        return False, drawdown
+    from risk_engine import get_risk_engine
 
-    return True, drawdown
+    engine = get_risk_engine()
+    engine.on_equity(current_equity)
+    ok, drawdown = engine.check_drawdown()
+    return ok, (None if ok and drawdown <= 0 else drawdown)
@@ -12,6 +12,9 @@ from crypto_trading_env import CryptoTradingEnv
 import config
 from telegram_api import send_message, send_photo
 from log_utils import info, success
+from job_runner import report_progress
+from status_summary import record_simulation
+from sim_records import StepLog, Trade
 
 matplotlib.use('Agg')  # Use headless backend
 
@@ -49,10 +52,9 @@ obs = vec_env.reset()
 done = False
 reward_sum = 0
 step = 0
-log_data = []
-entry_points = []
-exit_points = []
-price_series = vec_env.get_attr("df")[0]['close'].tolist()
+n_rows = vec_env.get_attr("n_rows")[0]
+step_log = StepLog(n_rows)
+trades = []
 
 holding = False
 
@@ -68,36 +70,32 @@ while not done:
 
     reward_sum += reward_val
 
-    current_price = price_series[step]
+    current_price = step_info[0]["price"]
+    if step % 500 == 0:
+        report_progress(step / n_rows, f"step {step}/{n_rows}")
     if action == 1 and not holding:
-        entry_points.append((step, current_price))
+        trades.append(Trade(step, "Buy", current_price))
         holding = True
     elif action == 2 and holding:
-        exit_points.append((step, current_price))
+        trades.append(Trade(step, "Sell", current_price))
         holding = False
 
-    log_data.append({
-        "step": step,
-        "reward": reward_val,
-        "total_reward": reward_sum,
-        "price": current_price
-    })
+    step_log.append(action[0], current_price, reward_val)
     step += 1
 
 # === Save logs ===
-log_df = pd.DataFrame(log_data)
+log_df = pd.DataFrame(step_log.columns())
 log_df.to_csv("simulation_log.csv", index=False)
 info("Logs saved to simulation_log.csv ✅")
 
 # === Price chart with trade points ===
 plt.figure(figsize=(12, 6))
 plt.plot(log_df["step"], log_df["price"], label="BTC Price", color="blue")
-if entry_points:
-    ep_x, ep_y = zip(*entry_points)
-    plt.scatter(ep_x, ep_y, marker='^', color='green', label='Buy', s=60)
-if exit_points:
-    xp_x, xp_y = zip(*exit_points)
-    plt.scatter(xp_x, xp_y, marker='v', color='red', label='Sell', s=60)
+for side, marker, color in (("Buy", "^", "green"), ("Sell", "v", "red")):
+    points = [(t.step, t.price) for t in trades if t.side == side]
+    if points:
+        x, y = zip(*points)
+        plt.scatter(x, y, marker=marker, color=color, label=side, s=60)
 plt.title("BTC Price + Trade Points")
 plt.xlabel("Step")
 plt.ylabel("Price")
@@ -130,6 +128,15 @@ drawdown = (log_df["total_reward"].cummax() - log_df["total_reward"]).max()
 volatility = returns.std()
 sharpe_ratio = (returns.mean() / (returns.std() + 1e-9)) * np.sqrt(252)
 
+record_simulation({
+    "total_return": float(total_return),
+    "win_rate": float(win_rate),
+    "max_drawdown": float(drawdown),
+    "volatility": float(volatility),
+    "sharpe_ratio": float(sharpe_ratio),
+    "steps": step,
+})
+
 report = (
     f"📊 *Simulation Performance Metrics:*\n"
     f"-----------------------------\n"
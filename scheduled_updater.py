@@ -1,50 +1,52 @@
+import sys
 import time
-import subprocess
-import datetime
-import os
-from telegram_api import send_message, send_photo
+import argparse
+from datetime import datetime, timezone
 
-UPDATE_INTERVAL_SECONDS = 60 * 60  # 1 година
-VENV_PYTHON = os.path.join("venv", "Scripts", "python.exe")  # або 'bin' для Linux/Mac
+import config
+from pipeline import build_pipeline, format_results, next_candle_close, FAIL
+from telegram_api import send_message
+from log_utils import info, error
 
-LOG_FILE = "logs/app.log"
-GRAPH_FILE = "ohlcv_preview.png"
+# === Candle-aligned scheduler ===
+# Wakes up PIPELINE_GRACE_SECONDS after every candle close (config.INTERVAL) and runs one
+# pipeline pass: ingest → rollups + features → retrain → backtest → report. Stages whose
+# inputs did not change are skipped, so a wake-up without new data costs milliseconds.
+
+
+def run_once(pipeline, force=False):
+    results = pipeline.run(force=force)
+    failed = [name for name, result in results.items() if result.state == FAIL]
+    if failed:
+        send_message(config.ALLOWED_USERS[0], "❌ Pipeline stage(s) failed\n" + format_results(results))
+    return results
 
 
 def main():
-    print("⏳ Scheduled updater started...")
+    parser = argparse.ArgumentParser(description="Candle-aligned data / training pipeline")
+    parser.add_argument("--once", action="store_true", help="run one pass now and exit")
+    parser.add_argument("--force", action="store_true", help="run every stage even if its inputs are unchanged")
+    args = parser.parse_args()
+
+    pipeline = build_pipeline()
+    if args.once:
+        print(format_results(run_once(pipeline, force=args.force)))
+        return
+
+    info(f"⏳ Scheduled updater started ({config.INTERVAL}m candles)")
+    force = args.force
     while True:
-        now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"\n🔄 Updating data at {now}")
-
+        wake_at = next_candle_close() + config.PIPELINE_GRACE_SECONDS
+        info(f"🕒 Next pass at {datetime.fromtimestamp(wake_at, timezone.utc):%Y-%m-%d %H:%M:%S} UTC")
+        while time.time() < wake_at:
+            time.sleep(max(0.0, min(60.0, wake_at - time.time())))  # the clock may pass wake_at between the checks
         try:
-            # Запуск fetch_data.py для оновлення даних
-            subprocess.run([VENV_PYTHON, "fetch_data.py"], check=True)
-            print("✅ Data update completed.")
-
-            # Надсилання повідомлення в Telegram
-            send_message(config.ALLOWED_USERS[0], f"✅ OHLCV data updated successfully at {now}")
-
-            # Надсилання графіку, якщо існує
-            if os.path.exists(GRAPH_FILE):
-                send_photo(config.ALLOWED_USERS[0], GRAPH_FILE, caption="📊 OHLCV Chart Preview")
-            else:
-                print("⚠️ Graph file not found")
-
-            # Надсилання лог-файлу, якщо існує
-            if os.path.exists(LOG_FILE):
-                send_photo(config.ALLOWED_USERS[0], LOG_FILE, caption="📄 Log File")
-            else:
-                print("⚠️ Log file not found")
-
-        except subprocess.CalledProcessError as e:
-            print(f"❌ Error during data update: {e}")
-            send_message(config.ALLOWED_USERS[0], f"❌ Error during data update at {now}: {e}")
-
-        print(f"🕒 Sleeping for {UPDATE_INTERVAL_SECONDS // 60} minutes...\n")
-        time.sleep(UPDATE_INTERVAL_SECONDS)
+            run_once(pipeline, force=force)
+        except Exception as e:
+            error(f"❌ Pipeline pass crashed: {e}")
+        force = False
 
 
 if __name__ == "__main__":
-    import config  # Імпортуємо тут, щоб не ламати зовнішні залежності
-    main()
\ No newline at end of file
+    main()
+    sys.exit(0)
@@ -0,0 +1,78 @@
+import numpy as np
+
+# === Compact records for backtests and paper trading ===
+# Per-step data lives in preallocated typed NumPy columns (~13 bytes per step) instead of a
+# list of dicts (~400 bytes per step); trades and the paper position are __slots__ records.
+
+
+class StepLog:
+    """Per-step action / price / reward columns; grows by doubling if capacity runs out."""
+    __slots__ = ("action", "price", "reward", "size")
+
+    def __init__(self, capacity):
+        capacity = max(int(capacity), 1)
+        self.action = np.empty(capacity, dtype=np.int8)
+        self.price = np.empty(capacity, dtype=np.float32)
+        self.reward = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    def append(self, action, price, reward):
+        i = self.size
+        if i == len(self.action):
+            self._grow()
+        self.action[i] = action
+        self.price[i] = price
+        self.reward[i] = reward
+        self.size = i + 1
+
+    def _grow(self):
+        for name in ("action", "price", "reward"):
+            column = getattr(self, name)
+            grown = np.empty(2 * len(column), dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self.action.nbytes + self.price.nbytes + self.reward.nbytes
+
+    def columns(self):
+        """step / reward / total_reward / price / action arrays (views, except the derived ones)."""
+        n = self.size
+        return {
+            "step": np.arange(n, dtype=np.int32),
+            "reward": self.reward[:n],
+            "total_reward": np.cumsum(self.reward[:n]),
+            "price": self.price[:n],
+            "action": self.action[:n],
+        }
+
+
+class Trade:
+    __slots__ = ("step", "side", "price")
+
+    def __init__(self, step, side, price):
+        self.step = step
+        self.side = side
+        self.price = price
+
+
+class PaperPosition:
+    """paper_trader's account; persisted as the same JSON object as before."""
+    __slots__ = ("balance", "holding", "entry_price", "crypto_amount")
+
+    def __init__(self, balance=100.0, holding=False, entry_price=0.0, crypto_amount=0.0):
+        self.balance = float(balance)
+        self.holding = bool(holding)
+        self.entry_price = float(entry_price)
+        self.crypto_amount = float(crypto_amount)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{key: data[key] for key in cls.__slots__ if key in data})
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
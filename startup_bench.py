@@ -0,0 +1,104 @@
+import os
+import re
+import ast
+import sys
+import argparse
+import statistics
+import subprocess
+
+# === Cold-start budget per entry point ===
+# Runs each entry point's imports in a fresh interpreter under `python -X importtime`:
+# the import statements at module level and inside `if __name__ == "__main__":` blocks,
+# not the script body, so nothing is fetched, trained or sent. The budget applies to the
+# summed cumulative import time (median over --repeat runs). Exit code 1 when any entry
+# point is over budget or fails to import, so this can gate CI.
+#
+#   python startup_bench.py
+#   python startup_bench.py --only main scheduled_updater --repeat 5
+
+# script -> budget in ms
+ENTRY_POINTS = {
+    "main.py": 400,               # webhook: flask + requests, trading modules load lazily
+    "scheduled_updater.py": 300,
+    "fetch_data.py": 250,
+    "load_test_webhook.py": 250,
+    "export_policy.py": 3000,     # torch
+    "train_ppo.py": 5000,         # torch + sb3 + sb3_contrib + gymnasium
+    "run_simulation.py": 5000,
+    "paper_trader.py": 5000,
+}
+
+MARKER = "--startup-bench--"
+LINE_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def _is_main_guard(node):
+    return (isinstance(node, ast.If) and isinstance(node.test, ast.Compare)
+            and isinstance(node.test.left, ast.Name) and node.test.left.id == "__name__")
+
+
+def entry_imports(path):
+    """Source of every module-level (and __main__ block) import statement in the script."""
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    tree = ast.parse(source)
+    nodes = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            nodes.append(node)
+        elif _is_main_guard(node):
+            nodes.extend(n for n in node.body if isinstance(n, (ast.Import, ast.ImportFrom)))
+    return "\n".join(ast.get_source_segment(source, node) for node in nodes)
+
+
+def measure(path, cwd):
+    """(total ms, [(module, cumulative ms)] of the top-level imports). Raises RuntimeError on import errors."""
+    code = f"import sys; sys.stderr.write({MARKER!r} + '\\n'); sys.stderr.flush()\n" + entry_imports(path)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    _, _, timings = proc.stderr.partition(MARKER)
+    if proc.returncode != 0:
+        raise RuntimeError(timings.strip().splitlines()[-1] if timings.strip() else f"exit code {proc.returncode}")
+    top = []
+    for match in LINE_RE.finditer(timings):
+        if len(match.group(3)) == 1:  # depth 0: imported directly by the entry point
+            top.append((match.group(4), int(match.group(2)) / 1000))
+    return sum(ms for _, ms in top), top
+
+
+def run(entry_points, repeat, cwd):
+    failures = 0
+    for script, budget in entry_points.items():
+        try:
+            runs = [measure(os.path.join(cwd, script), cwd) for _ in range(repeat)]
+        except RuntimeError as e:
+            failures += 1
+            print(f"❌ {script:<22} import failed: {e}")
+            continue
+        total = statistics.median(total for total, _ in runs)
+        _, top = min(runs, key=lambda r: abs(r[0] - total))
+        slowest = ", ".join(f"{name} {ms:.0f}" for name, ms in sorted(top, key=lambda t: -t[1])[:4])
+        ok = total <= budget
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {script:<22} {total:7.0f} ms / {budget} ms budget   ({slowest})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget check for every entry point")
+    parser.add_argument("--only", nargs="+", help="entry points to check (with or without .py)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per entry point; the median is compared")
+    args = parser.parse_args()
+
+    entry_points = ENTRY_POINTS
+    if args.only:
+        wanted = {name if name.endswith(".py") else name + ".py" for name in args.only}
+        entry_points = {script: budget for script, budget in ENTRY_POINTS.items() if script in wanted}
+    failures = run(entry_points, args.repeat, os.path.dirname(os.path.abspath(__file__)))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import json
+import time
+import sqlite3
+import threading
+
+import config
+from log_utils import info
+
+# === Shared state store ===
+# User session state and job state live here instead of in module globals, so several
+# webhook processes (or hosts, with Redis) see the same data. Values are JSON.
+#
+#   sqlite (default): one WAL database file shared by every process on the host. Reads
+#     are served from an in-process cache that is dropped whenever PRAGMA data_version
+#     says another connection committed, so a cached read costs one pragma, not a query.
+#   redis: any Redis-compatible server (Redis, KeyDB, Valkey, ...) via STATE_REDIS_URL.
+#     No local cache — other hosts can write at any time and there is no cheap version check.
+#
+# Every write is a single atomic statement / command.
+
+
+class SQLiteStateStore:
+    def __init__(self, path=None):
+        self.path = path or config.STATE_DB_PATH
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires REAL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self._cache = {}
+        self._data_version = None
+
+    def _validate_cache(self):
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._cache.clear()
+            self._data_version = version
+
+    def get(self, namespace, key, default=None):
+        cache_key = (namespace, str(key))
+        with self._lock:
+            self._validate_cache()
+            entry = self._cache.get(cache_key)
+            if entry is None:
+                row = self._conn.execute(
+                    "SELECT value, expires FROM state WHERE namespace = ? AND key = ?", cache_key
+                ).fetchone()
+                entry = (json.loads(row[0]), row[1]) if row else (None, None)
+                self._cache[cache_key] = entry
+        value, expires = entry
+        if value is None or (expires is not None and expires < time.time()):
+            return default
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO state (namespace, key, value, expires) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+                (namespace, str(key), json.dumps(value), expires),
+            )
+            self._cache[(namespace, str(key))] = (value, expires)
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set only if absent (or expired). True when this call created the entry."""
+        now = time.time()
+        expires = now + ttl if ttl else None
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO state (namespace, key, value, expires) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, expires = excluded.expires "
+                "WHERE state.expires IS NOT NULL AND state.expires < ?",
+                (namespace, str(key), json.dumps(value), expires, now),
+            )
+            created = cursor.rowcount == 1
+            if created:
+                self._cache[(namespace, str(key))] = (value, expires)
+            return created
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, str(key)))
+            self._cache.pop((namespace, str(key)), None)
+
+    def incr(self, namespace, key):
+        with self._lock:
+            row = self._conn.execute(
+                "INSERT INTO state (namespace, key, value) VALUES (?, ?, '1') "
+                "ON CONFLICT(namespace, key) DO UPDATE SET value = CAST(state.value AS INTEGER) + 1 "
+                "RETURNING value",
+                (namespace, str(key)),
+            ).fetchone()
+            value = int(row[0])
+            self._cache[(namespace, str(key))] = (value, None)
+            return value
+
+    def set_max(self, namespace, key, value):
+        """Keeps the larger of the stored and the given number (e.g. a peak shared by processes); returns it."""
+        with self._lock:
+            row = self._conn.execute(
+                "INSERT INTO state (namespace, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT(namespace, key) DO UPDATE SET value = CASE "
+                "WHEN CAST(excluded.value AS REAL) > CAST(state.value AS REAL) THEN excluded.value ELSE state.value END "
+                "RETURNING value",
+                (namespace, str(key), json.dumps(value)),
+            ).fetchone()
+            stored = json.loads(row[0])
+            self._cache[(namespace, str(key))] = (stored, None)
+            return stored
+
+    def items(self, namespace):
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM state WHERE namespace = ? AND (expires IS NULL OR expires >= ?)",
+                (namespace, now),
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE expires IS NOT NULL AND expires < ?", (time.time(),))
+
+
+class RedisStateStore:
+    _SET_MAX = """
+        local current = redis.call('GET', KEYS[1])
+        if current and tonumber(current) >= tonumber(ARGV[1]) then return current end
+        redis.call('SET', KEYS[1], ARGV[1])
+        return ARGV[1]
+    """
+
+    def __init__(self, url=None):
+        import redis  # optional dependency, only needed for STATE_BACKEND=redis
+        self.url = url or config.STATE_REDIS_URL
+        self._redis = redis.Redis.from_url(self.url, decode_responses=True)
+        self._set_max = self._redis.register_script(self._SET_MAX)
+
+    @staticmethod
+    def _key(namespace, key):
+        return f"state:{namespace}:{key}"
+
+    def get(self, namespace, key, default=None):
+        raw = self._redis.get(self._key(namespace, key))
+        return default if raw is None else json.loads(raw)
+
+    def set(self, namespace, key, value, ttl=None):
+        self._redis.set(self._key(namespace, key), json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def add(self, namespace, key, value, ttl=None):
+        return bool(self._redis.set(self._key(namespace, key), json.dumps(value), nx=True, ex=int(ttl) if ttl else None))
+
+    def delete(self, namespace, key):
+        self._redis.delete(self._key(namespace, key))
+
+    def incr(self, namespace, key):
+        return int(self._redis.incr(self._key(namespace, key)))
+
+    def set_max(self, namespace, key, value):
+        return json.loads(self._set_max(keys=[self._key(namespace, key)], args=[json.dumps(value)]))
+
+    def items(self, namespace):
+        prefix = self._key(namespace, "")
+        keys = list(self._redis.scan_iter(match=f"{prefix}*"))
+        values = self._redis.mget(keys) if keys else []
+        return {k[len(prefix):]: json.loads(v) for k, v in zip(keys, values) if v is not None}
+
+    def purge_expired(self):
+        pass  # Redis expires keys itself
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_state_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if config.STATE_BACKEND == "redis":
+                    _store = RedisStateStore()
+                else:
+                    _store = SQLiteStateStore()
+                    _store.purge_expired()
+                info(f"🗄️ State store: {config.STATE_BACKEND}")
+    return _store
@@ -0,0 +1,78 @@
+import json
+import time
+import sqlite3
+
+import config
+
+# === /status summary ===
+# A tiny key -> JSON table next to ohlcv. Writers update it in the same transaction as
+# their data (fetch_data) or right after producing results (run_simulation), so /status
+# reads a few rows instead of scanning ohlcv and re-parsing simulation_log.csv.
+
+TABLE_NAME = "status_summary"
+
+
+def init_summary(conn):
+    """Creates the table and seeds the ohlcv entry with one full scan if it is missing."""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated REAL NOT NULL
+        )
+    """)
+    if _read(conn, "ohlcv") is None:
+        has_ohlcv = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ohlcv'"
+        ).fetchone()
+        rows, last_ts = conn.execute("SELECT COUNT(*), MAX(timestamp) FROM ohlcv").fetchone() if has_ohlcv else (0, None)
+        _write(conn, "ohlcv", {"rows": rows, "last_timestamp": last_ts})
+    conn.commit()
+
+
+def _read(conn, key):
+    row = conn.execute(f"SELECT value FROM {TABLE_NAME} WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _write(conn, key, value):
+    conn.execute(
+        f"INSERT INTO {TABLE_NAME} (key, value, updated) VALUES (?, ?, ?) "
+        f"ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+        (key, json.dumps(value), time.time()),
+    )
+
+
+def record_ingest(conn, inserted, last_timestamp):
+    """Call on the ingest connection before its commit: rows += inserted, last timestamp moves forward."""
+    summary = _read(conn, "ohlcv") or {"rows": 0, "last_timestamp": None}
+    summary["rows"] += int(inserted)
+    if last_timestamp is not None:
+        summary["last_timestamp"] = max(int(last_timestamp), summary["last_timestamp"] or 0)
+    _write(conn, "ohlcv", summary)
+
+
+def record_simulation(metrics, db_path=None):
+    conn = sqlite3.connect(db_path or config.DB_PATH)
+    try:
+        init_summary(conn)
+        _write(conn, "simulation", dict(metrics, finished=time.time()))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def read_summary(db_path=None):
+    """{key: value} for every summary entry; the ohlcv entry is created on first use."""
+    conn = sqlite3.connect(db_path or config.DB_PATH)
+    try:
+        rows = conn.execute(f"SELECT key, value FROM {TABLE_NAME}").fetchall()
+        if not any(key == "ohlcv" for key, _ in rows):
+            init_summary(conn)
+            rows = conn.execute(f"SELECT key, value FROM {TABLE_NAME}").fetchall()
+    except sqlite3.OperationalError:
+        init_summary(conn)
+        rows = conn.execute(f"SELECT key, value FROM {TABLE_NAME}").fetchall()
+    finally:
+        conn.close()
+    return {key: json.loads(value) for key, value in rows}
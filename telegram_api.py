@@ -1,11 +1,221 @@
+import os
+import time
+import atexit
+import threading
+from collections import deque
+
 import requests
+from requests.adapters import HTTPAdapter
+
 import config
-import os
-from log_utils import success, error
+import metrics
+from rate_limit import TokenBucket
+from log_utils import info, warn, error
 
-def send_message(chat_id, text, parse_mode=None, reply_markup=None):
-    url = f"https://api.telegram.org/bot{config.BOT_TOKEN}/sendMessage"
+# === Outbound Telegram dispatcher ===
+# send_message / send_photo only enqueue and return. A few sender threads drain the
+# queue over one pooled session, within Telegram's limits (about 1 msg/s per chat with
+# small bursts, 30 msg/s overall). Text messages queued for the same chat while it waits
+# for its rate limit are merged into one message. 429s honour retry_after; network
+# errors and 5xx retry with exponential backoff. Pending messages are flushed at exit.
+
+API_URL = config.TELEGRAM_API_URL
+GLOBAL_RATE, GLOBAL_BURST = 30, 30
+CHAT_RATE, CHAT_BURST = 1, 3
+SENDER_THREADS = 4
+MAX_MESSAGE_LENGTH = 4096
+MAX_SEND_RETRIES = 5
+BACKOFF_BASE = 1.0     # seconds, doubled on every retry
+FLUSH_TIMEOUT = 30     # seconds the process waits at exit for queued messages
+
+TELEGRAM_REQUESTS = metrics.counter("telegram_requests_total", "Telegram Bot API calls", ["method", "outcome"])
+TELEGRAM_LATENCY = metrics.histogram("telegram_request_seconds", "Telegram Bot API round trip", ["method"])
+TELEGRAM_MERGED = metrics.counter("telegram_merged_messages_total", "Messages folded into an earlier one for the same chat")
+TELEGRAM_PENDING = metrics.gauge("telegram_pending_messages", "Messages waiting in the outbound queue")
+
+
+class _Outgoing:
+    __slots__ = ("method", "data", "photo", "attempts", "not_before")
+
+    def __init__(self, method, data, photo=None):
+        self.method = method
+        self.data = data
+        self.photo = photo
+        self.attempts = 0
+        self.not_before = 0.0
+
+    @property
+    def mergeable(self):
+        return self.method == "sendMessage" and "reply_markup" not in self.data
+
+
+class TelegramDispatcher:
+    def __init__(self, token=None, senders=SENDER_THREADS):
+        self._token = token or config.BOT_TOKEN
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=senders)
+        self.session.mount("https://", adapter)
+        self._cond = threading.Condition()
+        self._chats = {}        # chat_id -> deque of _Outgoing, insertion order = fairness order
+        self._in_flight = set()
+        self._chat_buckets = {}
+        self._global = TokenBucket("telegram", GLOBAL_RATE, GLOBAL_BURST)
+        self._stats_lock = threading.Lock()  # sender threads update these concurrently
+        self.stats = {"queued": 0, "sent": 0, "merged": 0, "retries": 0, "dropped": 0}
+        for index in range(senders):
+            threading.Thread(target=self._run, name=f"telegram-sender-{index}", daemon=True).start()
+        atexit.register(self.flush, FLUSH_TIMEOUT)
+        TELEGRAM_PENDING.set_function(self.pending)
+
+    # === Producer side ===
+    def enqueue(self, chat_id, item):
+        with self._cond:
+            self._chats.setdefault(chat_id, deque()).append(item)
+            self._count("queued")
+            self._cond.notify()
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def pending(self):
+        with self._cond:
+            return sum(len(q) for q in self._chats.values()) + len(self._in_flight)
+
+    def flush(self, timeout=None):
+        """Blocks until everything queued so far is sent (or dropped). False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._chats or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    warn(f"⚠️ Telegram flush timed out with {self.pending()} message(s) pending")
+                    return False
+                self._cond.wait(remaining)
+        return True
 
+    # === Sender side ===
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(f"chat:{chat_id}", CHAT_RATE, CHAT_BURST)
+        return bucket
+
+    def _take(self):
+        """Under the lock: (chat_id, batch) ready to send now, or (None, seconds to wait)."""
+        now = time.monotonic()
+        wait = None
+        for chat_id, items in self._chats.items():
+            if chat_id in self._in_flight:
+                continue
+            delay = max(items[0].not_before - now, self._chat_bucket(chat_id).wait_time(), self._global.wait_time())
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            if not self._chat_bucket(chat_id).acquire(timeout=0) or not self._global.acquire(timeout=0):
+                wait = 0.01
+                continue
+            batch = [items.popleft()]
+            if batch[0].mergeable and batch[0].attempts == 0:
+                length = len(batch[0].data["text"])
+                while (items and items[0].mergeable and items[0].attempts == 0
+                       and items[0].data.get("parse_mode") == batch[0].data.get("parse_mode")
+                       and length + 2 + len(items[0].data["text"]) <= MAX_MESSAGE_LENGTH):
+                    length += 2 + len(items[0].data["text"])
+                    batch.append(items.popleft())
+            if not items:
+                del self._chats[chat_id]
+            self._in_flight.add(chat_id)
+            return chat_id, batch
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                chat_id, batch = self._take()
+                while chat_id is None:
+                    self._cond.wait(batch)
+                    chat_id, batch = self._take()
+
+            item = batch[0]
+            retry_after = None
+            try:
+                if len(batch) > 1:
+                    item = _Outgoing("sendMessage", dict(item.data, text="\n\n".join(b.data["text"] for b in batch)))
+                    self._count("merged", len(batch) - 1)
+                    TELEGRAM_MERGED.inc(len(batch) - 1)
+                retry_after = self._send(item)
+            except Exception as e:
+                self._count("dropped")
+                error(f"❌ Telegram {item.method} to {chat_id} failed: {e}")
+            finally:
+                # Always release the chat, or its queue (and flush()) would wait forever
+                with self._cond:
+                    self._in_flight.discard(chat_id)
+                    if retry_after is not None:
+                        item.attempts += 1
+                        item.not_before = time.monotonic() + retry_after
+                        self._chats.setdefault(chat_id, deque()).appendleft(item)
+                        self._count("retries")
+                    self._cond.notify_all()
+
+    def _send(self, item):
+        """Sends one request. Returns seconds to wait before a retry, or None when done (sent or dropped)."""
+        url = f"{API_URL}/bot{self._token}/{item.method}"
+        chat_id = item.data.get("chat_id")
+        started = time.perf_counter()
+        try:
+            if item.photo is not None:
+                response = self.session.post(url, data=item.data, files={"photo": item.photo}, timeout=30)
+            else:
+                response = self.session.post(url, json=item.data, timeout=10)
+        except requests.exceptions.RequestException as e:
+            TELEGRAM_REQUESTS.labels(item.method, "network_error").inc()
+            return self._retry_or_drop(item, BACKOFF_BASE * 2 ** item.attempts, f"network error: {type(e).__name__}")
+
+        TELEGRAM_LATENCY.labels(item.method).observe(time.perf_counter() - started)
+        TELEGRAM_REQUESTS.labels(item.method, str(response.status_code)).inc()
+        if response.ok:
+            self._count("sent")
+            return None
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.json()["parameters"]["retry_after"])
+            except (ValueError, KeyError, TypeError):
+                retry_after = BACKOFF_BASE * 2 ** item.attempts
+            self._chat_bucket(chat_id).block_for(retry_after)
+            return self._retry_or_drop(item, retry_after, "429 Too Many Requests")
+        if response.status_code >= 500:
+            return self._retry_or_drop(item, BACKOFF_BASE * 2 ** item.attempts, f"HTTP {response.status_code}")
+
+        self._count("dropped")
+        error(f"❌ Telegram {item.method} to {chat_id} rejected: HTTP {response.status_code} {response.text[:200]}")
+        return None
+
+    def _retry_or_drop(self, item, delay, reason):
+        if item.attempts >= MAX_SEND_RETRIES:
+            self._count("dropped")
+            error(f"❌ Telegram {item.method} to {item.data.get('chat_id')} dropped after {item.attempts} retries: {reason}")
+            return None
+        warn(f"⚠️ Telegram {item.method} {reason}, retrying in {delay:.1f}s")
+        return delay
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = TelegramDispatcher()
+                info("📮 Telegram dispatcher started")
+    return _dispatcher
+
+
+def send_message(chat_id, text, parse_mode=None, reply_markup=None):
     payload = {
         "chat_id": chat_id,
         "text": text
@@ -17,35 +227,25 @@ def send_message(chat_id, text, parse_mode=None, reply_markup=None):
     if reply_markup:
         payload["reply_markup"] = reply_markup
 
-    print(f"\n📤 send_message() called → chat_id: {chat_id}")
-    print(f"🔗 URL: {url}")
-    print(f"📦 Payload: {payload}")
+    get_dispatcher().enqueue(chat_id, _Outgoing("sendMessage", payload))
 
-    try:
-        response = requests.post(url, json=payload)
-        print(f"📨 Response status: {response.status_code}")
-        print(f"📨 Response body: {response.text}")
-        response.raise_for_status()
-        success("✅ Message sent successfully")
-    except requests.exceptions.RequestException as e:
-        error(f"❌ Error sending message: {e}")
-        print(f"📨 Response: {response.text}")
 
 def send_photo(chat_id, image_path, caption=None):
-    url = f"https://api.telegram.org/bot{config.BOT_TOKEN}/sendPhoto"
-
     if not os.path.exists(image_path):
         error(f"❌ File not found: {image_path}")
         return
 
-    try:
-        with open(image_path, 'rb') as photo:
-            files = {"photo": photo}
-            data = {"chat_id": chat_id}
-            if caption:
-                data["caption"] = caption
-            response = requests.post(url, data=data, files=files)
-            response.raise_for_status()
-            success("✅ Photo sent successfully")
-    except requests.exceptions.RequestException as e:
-        error(f"⚠️ Error sending photo: {e}")
+    # Read now: the file may be overwritten (e.g. by the next simulation) before it is sent
+    with open(image_path, 'rb') as photo:
+        content = photo.read()
+    data = {"chat_id": chat_id}
+    if caption:
+        data["caption"] = caption
+    get_dispatcher().enqueue(chat_id, _Outgoing("sendPhoto", data, photo=(os.path.basename(image_path), content)))
+
+
+def flush(timeout=None):
+    """Waits for queued messages to go out; scripts about to exit get this automatically via atexit."""
+    if _dispatcher is not None:
+        return _dispatcher.flush(timeout)
+    return True
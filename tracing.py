@@ -0,0 +1,199 @@
+import json
+import time
+import itertools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+# === Span-based latency tracing for the live path ===
+# Timestamps come from time.perf_counter_ns(): monotonic, nanosecond resolution on every OS
+# (time.monotonic_ns() ticks at ~15 ms on Windows). Every span feeds a per-stage histogram;
+# spans opened inside trace() are also kept on that trace for a per-decision breakdown.
+#
+# Stages used across the repo:
+#   data_arrival, quote_age, feature_build, inference, risk_check, rate_limit_wait,
+#   sign, http:<path>, tpsl_confirm, decision_to_protected
+
+SUB_BUCKETS = 16  # per power of two -> <= ~6% relative error on percentiles
+RECENT_TRACES = 200
+
+
+class LatencyHistogram:
+    """Log-linear histogram of nanosecond durations (HdrHistogram-style bucketing)."""
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.sum_ns = 0
+        self.max_ns = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(value_ns):
+        if value_ns < SUB_BUCKETS:
+            return value_ns
+        shift = value_ns.bit_length() - 5  # keep the top 5 bits: 16 sub-buckets per octave
+        return (shift << 4) + (value_ns >> shift)
+
+    @staticmethod
+    def _bucket_upper(bucket):
+        if bucket < 2 * SUB_BUCKETS:
+            return bucket
+        shift, mantissa = divmod(bucket, SUB_BUCKETS)
+        shift -= 1
+        return ((mantissa + SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, value_ns):
+        value_ns = max(0, int(value_ns))
+        bucket = self._bucket(value_ns)
+        with self._lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+            self.total += 1
+            self.sum_ns += value_ns
+            if value_ns > self.max_ns:
+                self.max_ns = value_ns
+
+    def percentile(self, q):
+        with self._lock:
+            if not self.total:
+                return 0
+            rank = max(1, int(round(q * self.total)))
+            seen = 0
+            for bucket in sorted(self.counts):
+                seen += self.counts[bucket]
+                if seen >= rank:
+                    return min(self._bucket_upper(bucket), self.max_ns)
+        return self.max_ns
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "mean_us": round(self.sum_ns / self.total / 1000, 1) if self.total else 0.0,
+            "p50_us": round(self.percentile(0.50) / 1000, 1),
+            "p99_us": round(self.percentile(0.99) / 1000, 1),
+            "p999_us": round(self.percentile(0.999) / 1000, 1),
+            "max_us": round(self.max_ns / 1000, 1),
+        }
+
+
+class Trace:
+    __slots__ = ("trace_id", "name", "start_ns", "end_ns", "spans")
+
+    def __init__(self, trace_id, name):
+        self.trace_id = trace_id
+        self.name = name
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+        self.spans = []  # (stage, offset_ns from trace start, duration_ns)
+
+    def as_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "total_us": round(((self.end_ns or self.start_ns) - self.start_ns) / 1000, 1),
+            "spans": [{"stage": s, "at_us": round(o / 1000, 1), "us": round(d / 1000, 1)} for s, o, d in self.spans],
+        }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+_recent = deque(maxlen=RECENT_TRACES)
+_trace_ids = itertools.count(1)
+_current = contextvars.ContextVar("current_trace", default=None)  # asyncio.to_thread copies it to workers
+
+
+def _histogram(stage):
+    histogram = _histograms.get(stage)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(stage, LatencyHistogram())
+    return histogram
+
+
+def record(stage, duration_ns, start_ns=None):
+    """Adds a measured duration to the stage histogram (and to the active trace, if any)."""
+    _histogram(stage).record(duration_ns)
+    active = _current.get()
+    if active is not None:
+        start_ns = start_ns if start_ns is not None else time.perf_counter_ns() - duration_ns
+        active.spans.append((stage, start_ns - active.start_ns, duration_ns))
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter_ns() - start, start)
+
+
+def traced(stage):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def trace(name):
+    """Groups the spans of one decision (e.g. one open_position) under a trace id."""
+    active = Trace(next(_trace_ids), name)
+    token = _current.set(active)
+    try:
+        yield active
+    finally:
+        active.end_ns = time.perf_counter_ns()
+        _current.reset(token)
+        _histogram(f"{name}.total").record(active.end_ns - active.start_ns)
+        _recent.append(active)
+
+
+# === Export ===
+def snapshot():
+    return {stage: histogram.summary() for stage, histogram in sorted(_histograms.items())}
+
+
+def recent_traces(limit=20):
+    return [t.as_dict() for t in list(_recent)[-limit:]]
+
+
+REPORT_PATH = "latency_report.json"  # written by the process that runs the traced path (paper_trader)
+
+
+def export_json(path=REPORT_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"exported": time.time(), "stages": snapshot(), "recent_traces": recent_traces(RECENT_TRACES)},
+                  f, indent=2)
+    return path
+
+
+def load_export(path=REPORT_PATH):
+    """Another process's export_json() report, or None if there is none (or it is unreadable)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def format_report(stages=None, title="⏱️ Latency per stage (µs): p50 / p99 / p999 (n)"):
+    stages = snapshot() if stages is None else stages
+    if not stages:
+        return "⏱️ No latency samples recorded yet."
+    lines = [title]
+    for stage, s in stages.items():
+        lines.append(f"• {stage}: {s['p50_us']} / {s['p99_us']} / {s['p999_us']} ({s['count']})")
+    return "\n".join(lines)
+
+
+def reset():
+    with _histograms_lock:
+        _histograms.clear()
+    _recent.clear()
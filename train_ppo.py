@@ -1,15 +1,23 @@
 import os
+import sys
+import json
+import shutil
 import datetime
+import subprocess
 import numpy as np
-import pandas as pd
 from dotenv import load_dotenv
 from sb3_contrib import RecurrentPPO
 from stable_baselines3.common.vec_env import DummyVecEnv, VecNormalize
+from stable_baselines3.common.callbacks import BaseCallback
 from crypto_trading_env import CryptoTradingEnv
+from data_access import count_rows, return_stats
+import policy_eval
+from policy_eval import holdout_split
+from export_policy import export_policy
+from job_runner import report_progress
 import config
 from telegram_api import send_message
-from log_utils import info, success
-import sqlite3
+from log_utils import info, success, warn
 
 # === LOAD .env ===
 load_dotenv()
@@ -18,11 +26,9 @@ load_dotenv()
 def auto_select_hyperparams():
     info("🔍 Auto-selecting PPO and risk parameters...")
 
-    # Load OHLCV data
-    df = pd.read_sql("SELECT * FROM ohlcv ORDER BY timestamp", sqlite3.connect(config.DB_PATH))
-    row_count = len(df)
-    returns = df['close'].pct_change().dropna()
-    volatility = returns.std()
+    # Streamed over the table in chunks: constant memory, connection closed when done
+    row_count = count_rows()
+    volatility = return_stats().std
 
     TRAIN_TIMESTEPS = 100_000 if row_count > 100 else 50_000
     LEARNING_RATE = 3e-4
@@ -56,6 +62,115 @@ def auto_select_hyperparams():
     return TRAIN_TIMESTEPS, LEARNING_RATE, GAMMA, GAE_LAMBDA, BATCH_SIZE, N_STEPS, STOP_LOSS_PERCENT, TAKE_PROFIT_PERCENT, RISK_PERCENT
 
 
+# === Progress for /jobs ===
+class JobProgressCallback(BaseCallback):
+    def __init__(self, total_timesteps, every=2048):
+        super().__init__()
+        self.total_timesteps = total_timesteps
+        self.every = every
+
+    def _on_step(self):
+        if self.n_calls % self.every == 0:
+            report_progress(self.num_timesteps / self.total_timesteps,
+                            f"{self.num_timesteps}/{self.total_timesteps} timesteps")
+        return True
+
+
+# === Out-of-sample evaluation in a worker process ===
+EVAL_DIR = os.path.join("models", "eval")
+BEST_DIR = os.path.join("models", "best")
+
+
+class ParallelEvalCallback(BaseCallback):
+    """
+    Every eval_every timesteps saves a checkpoint (model + VecNormalize) and evaluates it on
+    the held-out bars from `start` in a `policy_eval.py --model ...` subprocess, polled from
+    _on_step, so learning never waits: a snapshot due while the previous one is still being
+    evaluated is skipped. Results go to TensorBoard under eval/, the best checkpoint is kept in
+    BEST_DIR, and training stops after `patience` evaluations without a min_delta gain in return.
+    (Not a multiprocessing pool: job-runner workers are daemonic and may not have children.)
+    """
+
+    def __init__(self, start, eval_every=None, patience=None, min_delta=None):
+        super().__init__()
+        self.start = start
+        self.eval_every = eval_every or config.EVAL_EVERY_TIMESTEPS
+        self.patience = config.EVAL_PATIENCE if patience is None else patience
+        self.min_delta = config.EVAL_MIN_DELTA if min_delta is None else min_delta
+        self.next_eval = self.eval_every
+        self.pending = None  # (process, checkpoint dir, timesteps)
+        self.best_return = float("-inf")
+        self.best_timesteps = None
+        self.stale = 0
+
+    def _on_training_start(self):
+        os.makedirs(EVAL_DIR, exist_ok=True)
+
+    def _on_step(self):
+        if self.pending is not None and self.pending[0].poll() is not None and not self._collect():
+            return False
+        if self.num_timesteps >= self.next_eval:
+            self.next_eval = self.num_timesteps + self.eval_every
+            if self.pending is None:
+                self._snapshot()
+            else:
+                info(f"⏭️ Eval snapshot at {self.num_timesteps} skipped, previous one still running", rate=1)
+        return True
+
+    def _snapshot(self):
+        path = os.path.join(EVAL_DIR, f"step_{self.num_timesteps}")
+        os.makedirs(path, exist_ok=True)
+        model_path = os.path.join(path, "model.zip")
+        vecnorm_path = os.path.join(path, "vecnormalize.pkl")
+        self.model.save(model_path)
+        self.model.get_vec_normalize_env().save(vecnorm_path)
+        # A fresh interpreter: nothing of the learner's torch threads or CUDA state is inherited
+        process = subprocess.Popen([
+            sys.executable, policy_eval.__file__, "--model", model_path, "--vecnorm", vecnorm_path,
+            "--start", str(self.start), "--output", os.path.join(path, "result.json"),
+        ])
+        self.pending = (process, path, self.num_timesteps)
+
+    def _collect(self):
+        """Logs a finished evaluation; False once validation return has plateaued."""
+        process, path, timesteps = self.pending
+        self.pending = None
+        try:
+            if process.wait():
+                raise RuntimeError(f"policy_eval exited with code {process.returncode}")
+            with open(os.path.join(path, "result.json"), encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError, RuntimeError) as e:
+            warn(f"⚠️ Evaluation of the {timesteps}-step snapshot failed: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            return True
+
+        for key in ("return", "max_drawdown", "trades"):
+            self.logger.record(f"eval/{key}", result[key])
+        self.logger.record("eval/snapshot_timesteps", timesteps)
+        if result["return"] > self.best_return + self.min_delta:
+            self.best_return, self.best_timesteps, self.stale = result["return"], timesteps, 0
+            shutil.rmtree(BEST_DIR, ignore_errors=True)
+            shutil.move(path, BEST_DIR)
+            success(f"🏅 New best held-out return {result['return']:+.2%} at {timesteps} timesteps → {BEST_DIR}")
+        else:
+            self.stale += 1
+            shutil.rmtree(path, ignore_errors=True)
+            info(f"🧪 Held-out return {result['return']:+.2%} at {timesteps} timesteps "
+                 f"(best {self.best_return:+.2%}, {self.stale}/{self.patience or '∞'} without improvement)")
+        self.logger.record("eval/best_return", self.best_return)
+        if self.patience and self.stale >= self.patience:
+            info(f"🛑 Early stop at {self.num_timesteps} timesteps: validation return plateaued")
+            return False
+        return True
+
+    def _on_training_end(self):
+        if self.pending is not None:
+            self._collect()  # waits: the last snapshot still counts for the best checkpoint
+        self.logger.dump(self.num_timesteps)
+        shutil.rmtree(EVAL_DIR, ignore_errors=True)
+
+
 # === MAIN ===
 def main():
     (TRAIN_TIMESTEPS, LEARNING_RATE, GAMMA, GAE_LAMBDA, BATCH_SIZE, 
@@ -63,7 +178,9 @@ def main():
 
     info("🧠 Starting Recurrent PPO (LSTM) training with auto-selected hyperparameters...")
 
-    env = DummyVecEnv([lambda: CryptoTradingEnv()])
+    # The newest EVAL_HOLDOUT_FRACTION of bars is held out for ParallelEvalCallback
+    holdout_start = holdout_split()
+    env = DummyVecEnv([lambda: CryptoTradingEnv(end=holdout_start)])
     env = VecNormalize(env, norm_obs=True, norm_reward=True, clip_obs=10.)
 
     model = RecurrentPPO(
@@ -78,7 +195,14 @@ def main():
         tensorboard_log=os.getenv("TENSORBOARD_LOG", "./tensorboard_logs/")
     )
 
-    model.learn(total_timesteps=TRAIN_TIMESTEPS)
+    callbacks = [JobProgressCallback(TRAIN_TIMESTEPS)]
+    evaluation = None
+    if holdout_start is not None:
+        evaluation = ParallelEvalCallback(holdout_start)
+        callbacks.append(evaluation)
+    else:
+        warn("⚠️ No held-out range (EVAL_HOLDOUT_FRACTION=0 or too few bars), training without evaluation")
+    model.learn(total_timesteps=TRAIN_TIMESTEPS, callback=callbacks)
 
     # Save with timestamp
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -93,12 +217,18 @@ def main():
     model.save("ppo_crypto_trader.zip")
     env.save("ppo_crypto_trader.pkl")
 
+    # === Export standalone TorchScript policy (VecNormalize + LSTM actor) for live inference ===
+    export_policy(model, env, config.POLICY_EXPORT_PATH)
+
     msg = (
         f"✅ Model training complete ({timestamp})\n"
         f"🧠 Saved model: `{model_name}.zip`\n"
         f"📁 VecNormalize: `{vecnorm_name}`\n"
         f"🛠️ Params: LR={LEARNING_RATE}, Gamma={GAMMA}, GAE={GAE_LAMBDA}, Batch={BATCH_SIZE}, Steps={N_STEPS}"
     )
+    if evaluation is not None and evaluation.best_timesteps is not None:
+        msg += (f"\n🏅 Best held-out return: {evaluation.best_return:+.2%} "
+                f"at {evaluation.best_timesteps} steps (`{BEST_DIR}`)")
     success(msg)
     send_message(config.CONTACT_ID, msg)
 